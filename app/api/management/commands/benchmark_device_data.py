@@ -0,0 +1,92 @@
+"""Benchmark POST /api/v1/devices/data/: per-request query count and latency percentiles."""
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from devices.identity import invalidate_device_identity
+from devices.models import Device
+from main.enums import LdProduct
+
+BENCHMARK_DEVICE_ID = "BENCHMARK000000AAA"
+BENCHMARK_API_KEY = "benchmark-api-key"
+
+
+class Command(BaseCommand):
+    help = (
+        "Post synthetic Air Station payloads to the device data endpoint and report queries per "
+        "request and p50/p95 latency. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Number of timed requests.")
+        parser.add_argument("--sensors", type=int, default=5, help="Sensors per payload.")
+        parser.add_argument("--dimensions", type=int, default=8, help="Dimensions per sensor.")
+
+    def _payload(self, time_measured, sensors, dimensions):
+        return {
+            "device": {
+                "time": time_measured.isoformat(),
+                "id": BENCHMARK_DEVICE_ID,
+                "firmware": "1.0.0",
+                "model": LdProduct.AIR_STATION,
+                "apikey": BENCHMARK_API_KEY,
+            },
+            "location": {"lat": 48.2082, "lon": 16.3738},
+            "sensors": {
+                str(s): {
+                    "type": s + 1,
+                    "data": {str(d + 1): 10.0 + d for d in range(dimensions)},
+                }
+                for s in range(sensors)
+            },
+        }
+
+    def handle(self, *args, **options):
+        client = APIClient()
+        url = reverse("api:v1:device-data")
+        start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        latencies = []
+        query_counts = []
+
+        with transaction.atomic():
+            Device.objects.create(
+                id=BENCHMARK_DEVICE_ID,
+                api_key=BENCHMARK_API_KEY,
+                firmware="1.0.0",
+                model=LdProduct.AIR_STATION,
+            )
+            # warm-up request (device row, counters, connection state)
+            client.post(url, self._payload(start, options["sensors"], options["dimensions"]), format="json", secure=True)
+
+            for i in range(1, options["requests"] + 1):
+                payload = self._payload(start + timedelta(minutes=i), options["sensors"], options["dimensions"])
+                with CaptureQueriesContext(connection) as ctx:
+                    t0 = time.perf_counter()
+                    response = client.post(url, payload, format="json", secure=True)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                if response.status_code != 200:
+                    self.stderr.write(f"request {i}: HTTP {response.status_code} {response.content[:200]!r}")
+                query_counts.append(len(ctx.captured_queries))
+
+            transaction.set_rollback(True)
+        # the rolled-back device must not linger in the identity cache
+        invalidate_device_identity(BENCHMARK_DEVICE_ID)
+
+        if len(latencies) < 2:
+            self.stderr.write("Need at least 2 requests for percentiles.")
+            return
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"payload: {options['sensors']} sensors x {options['dimensions']} dimensions, "
+            f"{options['requests']} requests"
+        )
+        self.stdout.write(f"queries/request: min={min(query_counts)} max={max(query_counts)}")
+        self.stdout.write(
+            f"latency ms: mean={statistics.mean(latencies):.2f} p50={percentiles[49]:.2f} p95={percentiles[94]:.2f}"
+        )
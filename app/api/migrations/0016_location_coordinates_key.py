@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_populate_location_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='coordinates_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+import devices.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_location_coordinates_key'),
+        ('devices', '0039_measurement_inserted_at'),
+    ]
+
+    operations = [
+        # existing rows stay NULL: adding the column with a volatile default would rewrite the table
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    """
+                    ALTER TABLE api_airqualityrecord ADD COLUMN inserted_at timestamp with time zone NULL;
+                    ALTER TABLE api_airqualityrecord ALTER COLUMN inserted_at SET DEFAULT clock_timestamp();
+                    """,
+                    "ALTER TABLE api_airqualityrecord DROP COLUMN inserted_at",
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='airqualityrecord',
+                    name='inserted_at',
+                    field=models.DateTimeField(blank=True, db_default=devices.models.ClockTimestamp(), editable=False, null=True),
+                ),
+            ],
+        ),
+    ]
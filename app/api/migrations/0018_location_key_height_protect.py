@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_airqualityrecord_inserted_at'),
+        ('workshops', '0013_workshopspotstat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='coordinates_key',
+            field=models.CharField(blank=True, editable=False, max_length=48, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='airqualityrecord',
+            name='location',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='air_quality_records', to='api.location'),
+        ),
+        # keys now include the height, and workshop image locations are not shared: unkey those rows so
+        # new readings do not join them (the next dedupe_locations run keys them again where allowed)
+        migrations.RunSQL(
+            """
+            UPDATE api_location l SET coordinates_key = NULL
+            WHERE l.coordinates_key IS NOT NULL
+              AND (l.height IS NOT NULL
+                   OR EXISTS (SELECT 1 FROM workshops_workshopimage i WHERE i.location_id = l.id))
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from workshops.models import Participant, Workshop
-from devices.models import Device, Sensor
+from devices.models import ClockTimestamp, Device, Sensor
 from django.contrib.gis.db.models import PointField
 #from campaign.models import Campaign
 
@@ -38,7 +38,9 @@ class AirQualityRecord(models.Model):
     lon = models.FloatField(null=True, blank=True)
     location_precision = models.FloatField(null=True, blank=True)
     mode = models.ForeignKey(MobilityMode, on_delete=models.CASCADE, null=True, blank=True)
-    location = models.ForeignKey('api.Location', on_delete=models.CASCADE, null=True, related_name='air_quality_records')
+    location = models.ForeignKey('api.Location', on_delete=models.PROTECT, null=True, related_name='air_quality_records')
+    # set by the database, see Measurement.inserted_at
+    inserted_at = models.DateTimeField(null=True, blank=True, editable=False, db_default=ClockTimestamp())
 
     def save(self, *args, **kwargs):
         if self.lat is not None and self.lon is not None and not self.location:
@@ -53,3 +55,6 @@ class AirQualityRecord(models.Model):
 class Location(models.Model):
     coordinates = PointField()
     height = models.FloatField(null=True)
+    # rounded "lon,lat[,height]" of locations shared between readings (LOCATION_STORAGE = "dedupe",
+    # see devices.locations); NULL for per-reading and workshop image locations
+    coordinates_key = models.CharField(max_length=48, null=True, blank=True, unique=True, editable=False)
@@ -1,11 +1,14 @@
 """API serializers package. Re-exports all serializers for backward compatibility."""
 from .air_quality import (
     AirQualityRecordSerializer,
+    AirQualityRecordValuesSerializer,
     AirQualityRecordWorkshopSerializer,
 )
 from .devices import (
     BatteryDataSerializer,
     BatterySerializer,
+    DeviceDataBatchSerializer,
+    DeviceDataReadingSerializer,
     DeviceDataSerializer,
     DevicePayloadSerializer,
     DeviceSerializer,
@@ -26,9 +29,12 @@ from .workshops import (
 
 __all__ = [
     "AirQualityRecordSerializer",
+    "AirQualityRecordValuesSerializer",
     "AirQualityRecordWorkshopSerializer",
     "BatteryDataSerializer",
     "BatterySerializer",
+    "DeviceDataBatchSerializer",
+    "DeviceDataReadingSerializer",
     "DeviceDataSerializer",
     "DevicePayloadSerializer",
     "DeviceSerializer",
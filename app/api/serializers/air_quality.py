@@ -12,6 +12,14 @@ class AirQualityRecordSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class AirQualityRecordValuesSerializer(serializers.ModelSerializer):
+    """Measured values and position of an uploaded record; relations are resolved by the view in bulk."""
+
+    class Meta:
+        model = AirQualityRecord
+        exclude = ["device", "workshop", "participant", "mode", "location"]
+
+
 class AirQualityRecordWorkshopSerializer(serializers.ModelSerializer):
     device_name = serializers.SerializerMethodField()
 
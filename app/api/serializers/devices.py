@@ -118,6 +118,22 @@ class DeviceDataSerializer(serializers.Serializer):
     location = LocationPayloadSerializer(required=False, allow_null=True)
 
 
+class DeviceDataReadingSerializer(serializers.Serializer):
+    """One buffered reading in POST /v1/devices/data/batch/"""
+
+    time = serializers.DateTimeField()
+    sensors = serializers.DictField(child=SensorDataSerializer())
+    workshop = WorkshopContextSerializer(required=False, allow_null=True)
+    location = LocationPayloadSerializer(required=False, allow_null=True)
+
+
+class DeviceDataBatchSerializer(serializers.Serializer):
+    """Request body for POST /v1/devices/data/batch/: device (without time), readings."""
+
+    device = DevicePayloadSerializer()
+    readings = serializers.ListField(child=DeviceDataReadingSerializer())
+
+
 class DeviceStatusLogSerializer(serializers.Serializer):
     time = serializers.DateTimeField()
     level = serializers.IntegerField()
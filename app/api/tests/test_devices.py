@@ -1,13 +1,22 @@
 """Tests for device status and data endpoints."""
+from unittest.mock import patch
+
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import ProtectedError
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from api.models import MobilityMode
-from devices.models import Device, DeviceLogs, DeviceStatus, Measurement
+from api.models import Location, MobilityMode
+from devices.ingest_buffer import flush_ingest_buffer
+from devices.locations import dedupe_locations
+from devices.models import Device, DeviceLogs, DeviceStatus, IngestBuffer, Measurement, Values
 from main.enums import LdProduct
-from workshops.models import Workshop, Participant
+from workshops.models import Workshop, WorkshopImage, Participant
 
 
 class DeviceStatusEndpointTest(TestCase):
@@ -116,6 +125,90 @@ class DeviceStatusEndpointTest(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_device_status_wrong_api_key_writes_nothing(self):
+        payload = {**self.valid_payload, "device": {**self.valid_payload["device"], "apikey": "wrong", "firmware": "9.9"}}
+        response = self.client.post(reverse("api:v1:device-status"), data=payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeviceStatus.objects.filter(device=self.device).exists())
+        self.assertFalse(DeviceLogs.objects.filter(device=self.device).exists())
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.firmware, "1.0")
+
+    def test_device_status_firmware_change_is_saved(self):
+        payload = {**self.valid_payload, "device": {**self.valid_payload["device"], "firmware": "1.1"}}
+        response = self.client.post(reverse("api:v1:device-status"), data=payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.firmware, "1.1")
+
+    def test_device_status_query_budget(self):
+        """Cached device: status row and one bulk insert for all log lines."""
+        url = reverse("api:v1:device-status")
+        self.client.post(url, data=self.valid_payload, format="json")
+
+        lines = [
+            {"time": f"2025-01-07T12:00:{i:02d}Z", "level": 0, "message": f"debug line {i}"}
+            for i in range(40)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data={**self.valid_payload, "status_list": lines}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(queries.captured_queries), 3)
+        self.assertEqual(DeviceLogs.objects.filter(device=self.device).count(), 41)
+
+    def test_device_status_missing_time_returns_400(self):
+        payload = {**self.valid_payload, "status_list": [{"level": 1, "message": "no time"}]}
+        response = self.client.post(reverse("api:v1:device-status"), data=payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _post_status(self, **device_overrides):
+        payload = {**self.valid_payload, "device": {**self.valid_payload["device"], **device_overrides}}
+        return self.client.post(reverse("api:v1:device-status"), data=payload, format="json")
+
+    @override_settings(DEVICE_STATUS_RECORDING="changes")
+    def test_device_status_changes_mode_coalesces_identical_snapshots(self):
+        cache.clear()
+        self._post_status()
+        response = self._post_status()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(DeviceStatus.objects.filter(device=self.device).count(), 1)
+        self.assertEqual(DeviceLogs.objects.filter(device=self.device).count(), 2)
+        self.device.refresh_from_db()
+        self.assertIsNotNone(self.device.last_seen)
+
+    @override_settings(DEVICE_STATUS_RECORDING="changes")
+    def test_device_status_changes_mode_caches_snapshot_loaded_from_db(self):
+        self._post_status()
+        cache.clear()
+        self._post_status()
+        with CaptureQueriesContext(connection) as queries:
+            self._post_status()
+        self.assertFalse(any('FROM "devices_devicestatus"' in q["sql"] for q in queries.captured_queries))
+        self.assertEqual(DeviceStatus.objects.filter(device=self.device).count(), 1)
+
+    def test_device_status_always_mode_skips_last_seen_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._post_status()
+        self.assertFalse(any(q["sql"].startswith('UPDATE "devices_device"') for q in queries.captured_queries))
+        self.assertEqual(DeviceStatus.objects.filter(device=self.device).count(), 1)
+
+    @override_settings(DEVICE_STATUS_RECORDING="changes", DEVICE_STATUS_BATTERY_VOLTAGE_DELTA=0.1)
+    def test_device_status_changes_mode_records_battery_and_sensor_changes(self):
+        cache.clear()
+        self._post_status()
+        self._post_status(battery={"voltage": 3.65, "percentage": 80})  # below delta
+        self._post_status(battery={"voltage": 3.5, "percentage": 80})
+        self._post_status(sensor_list=[{"model_id": 1, "dimension_list": [2, 3]}])
+        self.assertEqual(DeviceStatus.objects.filter(device=self.device).count(), 3)
+
+    @override_settings(DEVICE_STATUS_RECORDING="changes", DEVICE_STATUS_HEARTBEAT_SECONDS=0)
+    def test_device_status_changes_mode_heartbeat(self):
+        cache.clear()
+        self._post_status()
+        self._post_status()
+        self.assertEqual(DeviceStatus.objects.filter(device=self.device).count(), 2)
+
     def test_device_status_station_alias_returns_200(self):
         """Firmware may send top-level 'station' with device id in 'device' field."""
         payload = {
@@ -543,6 +636,406 @@ class DeviceDataEndpointTest(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def _sensor_payload(self, time, sensor_count, dimension_count):
+        return {
+            "device": {
+                "time": time,
+                "id": self.device.id,
+                "firmware": "2.0",
+                "model": 1,
+                "apikey": "data-key-456",
+            },
+            "sensors": {
+                str(i): {
+                    "type": i + 1,
+                    "data": {str(d + 2): float(d) for d in range(dimension_count)},
+                }
+                for i in range(sensor_count)
+            },
+        }
+
+    def test_device_data_writes_all_sensors_and_values(self):
+        response = self.client.post(
+            reverse("api:v1:device-data"),
+            data=self._sensor_payload("2025-01-07T11:00:00Z", 5, 8),
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 5)
+        self.assertEqual(Values.objects.filter(measurement__device=self.device).count(), 40)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_update.isoformat(), "2025-01-07T11:00:00+00:00")
+
+    def test_device_data_duplicate_returns_422(self):
+        payload = self._sensor_payload("2025-01-07T11:00:00Z", 2, 3)
+        self.client.post(reverse("api:v1:device-data"), data=payload, format="json")
+        response = self.client.post(reverse("api:v1:device-data"), data=payload, format="json")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 2)
+        self.assertEqual(Values.objects.filter(measurement__device=self.device).count(), 6)
+
+    def test_device_data_cached_device_skips_device_query(self):
+        url = reverse("api:v1:device-data")
+        self.client.post(url, data=self._sensor_payload("2025-01-07T10:00:00Z", 1, 1), format="json")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data=self._sensor_payload("2025-01-07T11:00:00Z", 1, 1), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('FROM "devices_device"' in q["sql"] for q in queries.captured_queries))
+
+    def test_device_data_api_key_change_invalidates_cache(self):
+        url = reverse("api:v1:device-data")
+        self.client.post(url, data=self._sensor_payload("2025-01-07T10:00:00Z", 1, 1), format="json")
+        self.device.api_key = "rotated-key"
+        self.device.save()
+        response = self.client.post(url, data=self._sensor_payload("2025-01-07T11:00:00Z", 1, 1), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 1)
+
+    def test_device_save_invalidates_cache_again_on_commit(self):
+        """A row cached by a concurrent request before the commit is dropped once it commits."""
+        key = Device.identity_cache_key(self.device.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.api_key = "rotated-key"
+            self.device.save()
+            cache.set(key, Device.objects.get(pk=self.device.id))
+        self.assertIsNone(cache.get(key))
+
+    def test_device_data_partial_duplicate_reports_skipped(self):
+        url = reverse("api:v1:device-data")
+        self.client.post(url, data=self._sensor_payload("2025-01-07T11:00:00Z", 2, 3), format="json")
+        response = self.client.post(url, data=self._sensor_payload("2025-01-07T11:00:00Z", 3, 3), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [s["sensor_model"] for s in response.json()["skipped"]],
+            [1, 2],
+        )
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 3)
+        self.assertEqual(Values.objects.filter(measurement__device=self.device).count(), 9)
+
+    def test_device_data_duplicate_does_not_leave_location(self):
+        url = reverse("api:v1:device-data")
+        self.client.post(url, data=self.valid_payload, format="json")
+        locations = Location.objects.count()
+        response = self.client.post(url, data=self.valid_payload, format="json")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Location.objects.count(), locations)
+
+    def test_device_data_query_count_does_not_scale_with_sensors(self):
+        """Duplicate probe, Measurement and Values inserts are one statement each."""
+        url = reverse("api:v1:device-data")
+        self.client.post(url, data=self._sensor_payload("2025-01-07T10:00:00Z", 1, 1), format="json")
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, data=self._sensor_payload("2025-01-07T11:00:00Z", 1, 1), format="json")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, data=self._sensor_payload("2025-01-07T12:00:00Z", 5, 8), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class DeviceDataBatchEndpointTest(TestCase):
+    """POST api/v1/devices/data/batch/ - replay buffered readings (body: device, readings)."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("api:v1:device-data-batch")
+        self.device = Device.objects.create(
+            id="BATCH001",
+            api_key="batch-key-789",
+            firmware="2.0",
+            model=1,
+        )
+        self.workshop = Workshop.objects.create(
+            title="Batch Workshop",
+            start_date="2025-01-01T00:00:00+00:00",
+            end_date="2025-12-31T23:59:59+00:00",
+        )
+
+    def _reading(self, time, with_workshop=False):
+        reading = {
+            "time": time,
+            "sensors": {"1": {"type": 1, "data": {"2": 5.0, "3": 6.0}}},
+        }
+        if with_workshop:
+            reading["workshop"] = {
+                "id": self.workshop.name,
+                "participant": "batch-participant",
+                "mode": "cycling",
+            }
+            reading["location"] = {"lat": 48.1769523, "lon": 16.3654834}
+        return reading
+
+    def _payload(self, readings, apikey="batch-key-789"):
+        return {
+            "device": {"id": self.device.id, "firmware": "2.0", "model": 1, "apikey": apikey},
+            "readings": readings,
+        }
+
+    def test_batch_creates_all_readings(self):
+        readings = [self._reading(f"2025-01-07T11:00:0{i}Z", with_workshop=True) for i in range(3)]
+        response = self.client.post(self.url, data=self._payload(readings), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["created"], 3)
+        self.assertEqual(Measurement.objects.filter(device=self.device, workshop=self.workshop).count(), 3)
+        self.assertEqual(Values.objects.filter(measurement__device=self.device).count(), 6)
+        self.assertTrue(Participant.objects.filter(name="batch-participant", workshop=self.workshop).exists())
+        self.assertTrue(MobilityMode.objects.filter(name="cycling").exists())
+        self.assertEqual(
+            Measurement.objects.filter(device=self.device, location__isnull=False).count(), 3
+        )
+
+    def test_batch_reports_duplicate_and_invalid_per_reading(self):
+        self.client.post(self.url, data=self._payload([self._reading("2025-01-07T11:00:00Z")]), format="json")
+        readings = [
+            self._reading("2025-01-07T11:00:00Z"),  # already stored
+            self._reading("2025-01-07T11:00:01Z"),
+            self._reading("2025-01-07T11:00:01Z"),  # repeated within the batch
+            {"time": "not-a-time", "sensors": {}},
+            {"time": "2025-01-07T11:00:02Z", "sensors": {"1": {"type": 1, "data": {}}},
+             "workshop": {"id": self.workshop.name}},
+        ]
+        response = self.client.post(self.url, data=self._payload(readings), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(
+            [r["status"] for r in body["results"]],
+            ["duplicate", "created", "duplicate", "invalid", "invalid"],
+        )
+        self.assertEqual((body["created"], body["duplicate"], body["invalid"]), (1, 2, 2))
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 2)
+
+    def test_batch_rejects_non_string_participant_and_mode_per_reading(self):
+        bad_mode = self._reading("2025-01-07T11:00:01Z", with_workshop=True)
+        bad_mode["workshop"]["mode"] = 5
+        bad_participant = self._reading("2025-01-07T11:00:02Z", with_workshop=True)
+        bad_participant["workshop"]["participant"] = {"name": "batch-participant"}
+        readings = [self._reading("2025-01-07T11:00:00Z", with_workshop=True), bad_mode, bad_participant]
+
+        response = self.client.post(self.url, data=self._payload(readings), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual([r["status"] for r in body["results"]], ["created", "invalid", "invalid"])
+        self.assertEqual(body["results"][1]["detail"], "Invalid workshop mode.")
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 1)
+
+    def test_batch_wrong_api_key_returns_400(self):
+        response = self.client.post(
+            self.url,
+            data=self._payload([self._reading("2025-01-07T11:00:00Z")], apikey="wrong-key"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Measurement.objects.filter(device=self.device).exists())
+
+    def test_batch_empty_readings_returns_400(self):
+        response = self.client.post(self.url, data=self._payload([]), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_query_count_does_not_scale_with_readings(self):
+        self.client.post(self.url, data=self._payload([self._reading("2025-01-07T10:00:00Z", True)]), format="json")
+
+        small_batch = [self._reading("2025-01-07T11:00:00Z", True)]
+        large_batch = [self._reading(f"2025-01-07T12:00:{i:02d}Z", True) for i in range(50)]
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, data=self._payload(small_batch), format="json")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.url, data=self._payload(large_batch), format="json")
+
+        self.assertEqual(response.json()["created"], 50)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    @override_settings(LOCATION_STORAGE="dedupe")
+    def test_batch_dedupe_location_storage_shares_location(self):
+        self.client.post(self.url, data=self._payload([self._reading("2025-01-07T10:00:00Z", True)]), format="json")
+        readings = [self._reading(f"2025-01-07T11:00:0{i}Z", True) for i in range(3)]
+        self.client.post(self.url, data=self._payload(readings), format="json")
+
+        location_ids = set(Measurement.objects.filter(device=self.device).values_list("location_id", flat=True))
+        self.assertEqual(len(location_ids), 1)
+        location = Location.objects.get(pk=location_ids.pop())
+        self.assertEqual(location.coordinates_key, "16.3654834,48.1769523")
+        self.assertEqual(Location.objects.count(), 1)
+
+    def test_dedupe_locations_merges_identical_coordinates(self):
+        readings = [self._reading(f"2025-01-07T11:00:0{i}Z", True) for i in range(3)]
+        self.client.post(self.url, data=self._payload(readings), format="json")
+        self.assertEqual(Location.objects.count(), 3)
+
+        deleted, updated = dedupe_locations(chunk_size=1)
+
+        self.assertEqual((deleted, updated), (2, 2))
+        location = Location.objects.get()
+        self.assertEqual(location.coordinates_key, "16.3654834,48.1769523")
+        self.assertEqual(Measurement.objects.filter(device=self.device, location=location).count(), 3)
+
+    def test_dedupe_locations_keeps_heights_and_image_locations_apart(self):
+        point = Point(16.3654834, 48.1769523, srid=4326)
+        plain = Location.objects.create(coordinates=point)
+        Location.objects.create(coordinates=point)
+        raised = Location.objects.create(coordinates=point, height=12.5)
+        image_location = Location.objects.create(coordinates=point)
+        WorkshopImage.objects.create(workshop=self.workshop, image="workshop_images/spot.jpg", location=image_location)
+
+        deleted, _ = dedupe_locations()
+
+        self.assertEqual(deleted, 1)
+        self.assertEqual(
+            sorted(Location.objects.values_list("pk", "coordinates_key")),
+            sorted([
+                (plain.pk, "16.3654834,48.1769523"),
+                (raised.pk, "16.3654834,48.1769523,12.50"),
+                (image_location.pk, None),
+            ]),
+        )
+
+    @override_settings(LOCATION_STORAGE="dedupe")
+    def test_shared_location_cannot_be_deleted_with_its_readings(self):
+        self.client.post(self.url, data=self._payload([self._reading("2025-01-07T10:00:00Z", True)]), format="json")
+        location = Measurement.objects.get(device=self.device).location
+
+        with self.assertRaises(ProtectedError):
+            location.delete()
+        self.assertTrue(Measurement.objects.filter(device=self.device).exists())
+
+
+@override_settings(INGEST_MODE="buffered")
+class DeviceIngestBufferTest(TestCase):
+    """INGEST_MODE = "buffered": data/status requests are staged and written by flush_ingest_buffer."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.device = Device.objects.create(
+            id="BUFFER001",
+            api_key="buffer-key",
+            firmware="2.0",
+            model=1,
+        )
+        self.device_block = {
+            "time": "2025-01-07T11:00:00Z",
+            "id": self.device.id,
+            "device": self.device.id,
+            "firmware": "2.0",
+            "model": 1,
+            "apikey": "buffer-key",
+        }
+
+    def _post_data(self, time="2025-01-07T11:00:00Z"):
+        return self.client.post(
+            reverse("api:v1:device-data"),
+            data={
+                "device": {**self.device_block, "time": time},
+                "location": {"lat": 48.2, "lon": 16.37},
+                "sensors": {"1": {"type": 1, "data": {"2": 5.0, "3": 6.0}}},
+            },
+            format="json",
+        )
+
+    def test_data_is_buffered_until_flush(self):
+        response = self._post_data()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Measurement.objects.filter(device=self.device).exists())
+        self.assertEqual(IngestBuffer.objects.count(), 1)
+
+        result = flush_ingest_buffer(batch_size=100)
+
+        self.assertEqual((result.entries, result.measurements, result.failed), (1, 1, 0))
+        self.assertFalse(IngestBuffer.objects.exists())
+        measurement = Measurement.objects.get(device=self.device)
+        self.assertEqual(measurement.values.count(), 2)
+        self.assertIsNotNone(measurement.location_id)
+        self.assertTrue(DeviceStatus.objects.filter(device=self.device).exists())
+
+    def test_invalid_mode_is_rejected_before_buffering(self):
+        response = self.client.post(
+            reverse("api:v1:device-data"),
+            data={
+                "device": self.device_block,
+                "workshop": {"id": "buffer-workshop", "mode": ["walking"]},
+                "location": {"lat": 48.2, "lon": 16.37},
+                "sensors": {"1": {"type": 1, "data": {"2": 5.0}}},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IngestBuffer.objects.exists())
+
+    def test_flush_skips_duplicates(self):
+        self._post_data()
+        self._post_data()
+        result = flush_ingest_buffer(batch_size=100)
+        self.assertEqual((result.measurements, result.skipped), (1, 1))
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 1)
+
+    def test_status_is_buffered_until_flush(self):
+        response = self.client.post(
+            reverse("api:v1:device-status"),
+            data={
+                "device": {**self.device_block, "battery": {"voltage": 3.7, "percentage": 80}},
+                "status_list": [
+                    {"time": "2025-01-07T11:00:00Z", "level": 1, "message": "one"},
+                    {"time": "2025-01-07T11:00:01Z", "level": 2, "message": "two"},
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("flags", response.data)
+        self.assertFalse(DeviceLogs.objects.filter(device=self.device).exists())
+
+        flush_ingest_buffer(batch_size=100)
+
+        self.assertEqual(DeviceLogs.objects.filter(device=self.device).count(), 2)
+        self.assertEqual(DeviceStatus.objects.get(device=self.device).battery_voltage, 3.7)
+
+    def test_failed_flush_keeps_rows_for_retry(self):
+        self._post_data()
+        with patch("devices.ingest_buffer.store_readings", side_effect=RuntimeError("deadlock detected")):
+            result = flush_ingest_buffer(batch_size=100)
+        self.assertEqual(result.failed, 1)
+        entry = IngestBuffer.objects.get()
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn("deadlock detected", entry.last_error)
+
+        result = flush_ingest_buffer(batch_size=100)
+        self.assertEqual((result.measurements, result.failed), (1, 0))
+        self.assertFalse(IngestBuffer.objects.exists())
+
+    @override_settings(INGEST_BUFFER_MAX_ATTEMPTS=1)
+    def test_rows_failing_too_often_are_kept_as_dead_letters(self):
+        self._post_data()
+        with patch("devices.ingest_buffer.store_readings", side_effect=RuntimeError("boom")):
+            flush_ingest_buffer(batch_size=100)
+        self.assertEqual(flush_ingest_buffer(batch_size=100).entries, 0)
+        self.assertEqual(IngestBuffer.objects.count(), 1)
+
+    def test_flush_records_statuses_in_one_insert(self):
+        for minute in range(5):
+            self._post_data(f"2025-01-07T11:0{minute}:00Z")
+        with CaptureQueriesContext(connection) as queries:
+            flush_ingest_buffer(batch_size=100)
+        status_inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "devices_devicestatus"')]
+        self.assertEqual(len(status_inserts), 1)
+        self.assertEqual(DeviceStatus.objects.filter(device=self.device).count(), 5)
+        self.assertFalse(any(q["sql"].startswith('UPDATE "devices_device"') for q in queries.captured_queries))
+
+    def test_wrong_api_key_is_not_buffered(self):
+        self.device_block["apikey"] = "wrong"
+        response = self._post_data()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IngestBuffer.objects.exists())
+
+    @override_settings(INGEST_BUFFER_HIGH_WATER_MARK=1)
+    def test_full_buffer_returns_503_with_retry_after(self):
+        self._post_data("2025-01-07T11:00:00Z")
+        cache.clear()  # drop the cached buffer depth
+        response = self._post_data("2025-01-07T11:01:00Z")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(IngestBuffer.objects.count(), 1)
+
 
 class DeviceNameEndpointTest(TestCase):
     """GET /api/v1/devices/name/ - resolve device name by id."""
@@ -15,6 +15,10 @@ class SchemaEndpointTest(TestCase):
         response = self.client.get(reverse("api:v1:schema"))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_schema_documents_air_quality_data_add(self):
+        response = self.client.get(reverse("api:v1:schema"))
+        self.assertIn(b"Add air quality data", response.content)
+
 
 class SwaggerUIEndpointTest(TestCase):
     """GET /api/v1/docs/ returns Swagger UI."""
@@ -1,12 +1,32 @@
 """Tests for workshop data add, detail, and workshop data GET endpoints."""
+import json
+import struct
+from unittest.mock import patch
+
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from auditlog.models import LogEntry
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from api.models import AirQualityRecord
-from devices.models import Device
-from workshops.models import Workshop
+from api.models import AirQualityRecord, Location, MobilityMode
+from devices.models import Device, Measurement, Values
+from api.workshop_data import stream_json
+from main.streaming import streaming_response
+from workshops.cache import GENERATION_TIMEOUT, _lock_key, get_or_lock, workshop_data_generation, workshop_data_key
+from workshops.models import Participant, Workshop
+
+
+def _json(response):
+    """Body of a (possibly streaming) JSON response."""
+    if response.streaming:
+        return json.loads(b"".join(response.streaming_content))
+    return response.json()
 
 
 class WorkshopDataAddEndpointTest(TestCase):
@@ -49,6 +69,57 @@ class WorkshopDataAddEndpointTest(TestCase):
         self.assertEqual(AirQualityRecord.objects.count(), 1)
         self.assertEqual(AirQualityRecord.objects.first().pm1, 10)
 
+    def _record(self, second, device="B040", participant="Air Around 0001"):
+        return {
+            **self.valid_payload[0],
+            "time": f"2019-01-01T00:00:{second:02d}+00:00",
+            "device": device,
+            "participant": participant,
+            "mode": "walking",
+        }
+
+    def test_workshop_data_add_resolves_relations_and_locations(self):
+        payload = [self._record(i, device=f"B04{i % 3}", participant=f"Air Around 000{i % 2}") for i in range(6)]
+        response = self.client.post(reverse("api:v1:workshop-data-add"), data=payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 6)
+        self.assertEqual(AirQualityRecord.objects.filter(location__isnull=False).count(), 6)
+        self.assertEqual(Participant.objects.filter(name__startswith="Air Around").count(), 2)
+        self.assertTrue(MobilityMode.objects.filter(name="walking").exists())
+        self.assertTrue(Device.objects.filter(id="40B0AAA").exists())
+
+    def test_workshop_data_add_reports_duplicates(self):
+        self.client.post(reverse("api:v1:workshop-data-add"), data=[self._record(0)], format="json")
+        response = self.client.post(
+            reverse("api:v1:workshop-data-add"),
+            data=[self._record(0), self._record(1), self._record(1)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.json()["errors"]), 2)
+        self.assertEqual(AirQualityRecord.objects.count(), 2)
+
+    def test_workshop_data_add_query_count_does_not_scale_with_records(self):
+        url = reverse("api:v1:workshop-data-add")
+        large_batch = [self._record(i, device=f"B0{i:02d}", participant=f"P{i}") for i in range(2, 52)]
+        # devices and participants already known; only new ones cost a query each
+        self.client.post(url, data=[self._record(1)] + large_batch, format="json")
+        AirQualityRecord.objects.all().delete()
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, data=[self._record(1)], format="json")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, data=large_batch, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_workshop_data_add_logs_new_devices_and_participants(self):
+        response = self.client.post(
+            reverse("api:v1:workshop-data-add"), data=[self._record(0, device="B140", participant="New")], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(LogEntry.objects.get_for_object(Device.objects.get(id="40B1AAA")).exists())
+        self.assertTrue(LogEntry.objects.get_for_object(Participant.objects.get(name="New")).exists())
+
     def test_workshop_data_add_bad_request(self):
         response = self.client.post(
             reverse("api:v1:workshop-data-add"),
@@ -83,6 +154,8 @@ class WorkshopDetailEndpointTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+# rows are read right after they were inserted; the cursor lag is tested separately
+@override_settings(WORKSHOP_DATA_CURSOR_LAG=0)
 class WorkshopDataGetEndpointTest(TestCase):
     """GET workshops/<pk>/data/ - workshop air quality data."""
 
@@ -99,10 +172,393 @@ class WorkshopDataGetEndpointTest(TestCase):
             reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.json(), list)
+        self.assertIsInstance(_json(response), list)
 
     def test_workshop_data_not_found(self):
         response = self.client.get(
             reverse("api:v1:workshop-data", kwargs={"pk": "nonexistent"})
         )
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def _add_measurement(self, device, second, location=None):
+        measurement = Measurement.objects.create(
+            device=device,
+            workshop=self.workshop,
+            time_measured=f"2020-06-01T10:00:{second:02d}+00:00",
+            sensor_model=1,
+            location=location,
+        )
+        Values.objects.create(measurement=measurement, dimension=3, value=12.5)
+        Values.objects.create(measurement=measurement, dimension=7, value=21.0)
+        return measurement
+
+    def test_workshop_data_pivots_measurement_values(self):
+        device = Device.objects.create(id="PIVOT01", device_name="Pivot")
+        location = Location.objects.create(coordinates=Point(16.37, 48.21, srid=4326))
+        self._add_measurement(device, 0, location)
+
+        response = self.client.get(reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}))
+
+        (row,) = _json(response)
+        self.assertEqual(row["device"], "PIVOT01")
+        self.assertEqual(row["display_name"], "Pivot")
+        self.assertEqual((row["participant"], row["mode"]), ("—", "—"))
+        self.assertAlmostEqual(row["lat"], 48.21)
+        self.assertAlmostEqual(row["lon"], 16.37)
+        self.assertEqual((row["pm25"], row["temperature"], row["pm1"]), (12.5, 21.0, None))
+
+    def test_workshop_data_resolves_corrected_device_names(self):
+        Device.objects.create(id="28372F821AE4AAA")
+        Device.objects.create(id="28372F821AE5AAA", device_name="Air Around 0007")
+        AirQualityRecord.objects.create(
+            time="2020-06-01T10:00:00+00:00", device_id="28372F821AE4AAA", workshop=self.workshop, pm25=3.0,
+        )
+
+        response = self.client.get(reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}))
+
+        (row,) = _json(response)
+        self.assertEqual((row["device"], row["display_name"]), ("Air Around 0007", "Air Around 0007"))
+        self.assertEqual(row["pm25"], 3.0)
+
+    def test_workshop_data_query_count_does_not_scale_with_rows(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        device = Device.objects.create(id="PIVOT02")
+        self._add_measurement(device, 0)
+        AirQualityRecord.objects.create(time="2020-06-01T10:00:00+00:00", device=device, workshop=self.workshop)
+        # streamed: the rows are read while the content is consumed
+        with CaptureQueriesContext(connection) as small:
+            _json(self.client.get(url))
+
+        cache.clear()
+        for second in range(1, 30):
+            self._add_measurement(Device.objects.create(id=f"PIVOT1{second:02d}"), second)
+            AirQualityRecord.objects.create(
+                time=f"2020-06-01T10:00:{second:02d}+00:00", device_id=f"PIVOT1{second:02d}", workshop=self.workshop,
+            )
+        with CaptureQueriesContext(connection) as large:
+            rows = _json(self.client.get(url))
+
+        self.assertEqual(len(rows), 60)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_workshop_data_cursor_returns_only_new_rows(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        device = Device.objects.create(id="CURSOR01")
+        self._add_measurement(device, 0)
+
+        first = _json(self.client.get(url, {"cursor": ""}))
+        self.assertEqual(len(first["data"]), 1)
+
+        unchanged = _json(self.client.get(url, {"cursor": first["cursor"]}))
+        self.assertEqual((unchanged["data"], unchanged["cursor"]), ([], first["cursor"]))
+
+        self._add_measurement(device, 1)
+        AirQualityRecord.objects.create(time="2020-06-01T10:00:02+00:00", device=device, workshop=self.workshop)
+        delta = _json(self.client.get(url, {"cursor": first["cursor"]}))
+        self.assertEqual([row["time"] for row in delta["data"]], ["2020-06-01T10:00:01+00:00", "2020-06-01T10:00:02+00:00"])
+        self.assertNotEqual(delta["cursor"], first["cursor"])
+
+        # without a cursor the full list is returned as before
+        self.assertEqual(len(_json(self.client.get(url))), 3)
+
+    @override_settings(WORKSHOP_DATA_CURSOR_LAG=60)
+    def test_workshop_data_cursor_holds_back_recent_rows(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        device = Device.objects.create(id="CURSOR02")
+        self._add_measurement(device, 0)
+        Measurement.objects.update(inserted_at="2020-06-01T12:00:00+00:00")
+        self._add_measurement(device, 1)
+
+        first = _json(self.client.get(url, {"cursor": ""}))
+        self.assertEqual([row["time"] for row in first["data"]], ["2020-06-01T10:00:00+00:00"])
+
+        # once settled, the held back row comes with the next poll
+        Measurement.objects.update(inserted_at="2020-06-01T12:00:00+00:00")
+        delta = _json(self.client.get(url, {"cursor": first["cursor"]}))
+        self.assertEqual([row["time"] for row in delta["data"]], ["2020-06-01T10:00:01+00:00"])
+
+        # the full list without a cursor is not held back
+        self._add_measurement(device, 2)
+        self.assertEqual(len(_json(self.client.get(url))), 3)
+
+    def test_workshop_data_invalid_cursor_returns_400(self):
+        response = self.client.get(
+            reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}), {"cursor": "not-a-cursor"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_workshop_data_columnar_format(self):
+        device = Device.objects.create(id="COLUMN01", device_name="Column")
+        self._add_measurement(device, 0)
+        self._add_measurement(device, 1)
+
+        response = self.client.get(
+            reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}), {"format": "columnar"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(body["count"], 2)
+        self.assertEqual(body["dictionaries"]["device"], ["COLUMN01"])
+        self.assertEqual(body["columns"]["device"], [0, 0])
+        self.assertEqual(body["columns"]["time"], [1591005600, 1591005601])
+        self.assertEqual(body["columns"]["pm25"], [12.5, 12.5])
+        self.assertEqual(body["columns"]["pm1"], [None, None])
+        self.assertIn("cursor", body)
+
+    def test_workshop_data_binary_format(self):
+        self._add_measurement(Device.objects.create(id="BINARY01"), 0)
+
+        response = self.client.get(
+            reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}), {"format": "binary"}
+        )
+
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        content = response.content
+        self.assertEqual(content[:4], b"LDWD")
+        (header_length,) = struct.unpack("<I", content[8:12])
+        header = json.loads(content[12:12 + header_length])
+        self.assertEqual(header["count"], 1)
+        data_start = 12 + header_length
+        self.assertEqual(data_start % 8, 0)
+        columns = {column["name"]: column for column in header["columns"]}
+        (pm25,) = struct.unpack_from("<f", content, data_start + columns["pm25"]["offset"])
+        self.assertEqual(pm25, 12.5)
+        (time,) = struct.unpack_from("<I", content, data_start + columns["time"]["offset"])
+        self.assertEqual(time, 1591005600)
+
+    def test_workshop_data_unknown_format_returns_400(self):
+        response = self.client.get(
+            reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}), {"format": "xml"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(WORKSHOP_DATA_CACHE_MAX_BYTES=10 * 1024 * 1024)
+    def test_workshop_data_streams_and_caches_encoded_bytes(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        self._add_measurement(Device.objects.create(id="STREAM01"), 0)
+
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        streamed = b"".join(response.streaming_content)
+
+        cached = cache.get(workshop_data_key(self.workshop.name))
+        self.assertEqual(cached, streamed)
+        response = self.client.get(url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, streamed)
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+    @override_settings(WORKSHOP_DATA_CACHE_MAX_BYTES=10)
+    def test_workshop_data_larger_than_cache_limit_is_not_cached(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        self._add_measurement(Device.objects.create(id="STREAM02"), 0)
+
+        self.assertEqual(len(_json(self.client.get(url))), 1)
+        self.assertIsNone(cache.get(workshop_data_key(self.workshop.name)))
+
+    @override_settings(WORKSHOP_DATA_CACHE_MAX_BYTES=10)
+    def test_workshop_data_too_large_to_cache_is_built_without_lock(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        self._add_measurement(Device.objects.create(id="STREAM04"), 0)
+        key = workshop_data_key(self.workshop.name)
+
+        response = self.client.get(url)
+        chunks = iter(response.streaming_content)
+        next(chunks)
+        next(chunks)
+        # still streaming: the lock is already released, later requests do not wait for it
+        self.assertTrue(cache.add(_lock_key(key), 1))
+        cache.delete(_lock_key(key))
+        value, lock = get_or_lock(key)
+        self.assertIsNone(value)
+        self.assertTrue(cache.add(_lock_key(key), 1))
+        response.close()
+
+    def test_workshop_data_caches_columnar_and_binary_variants(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        self._add_measurement(Device.objects.create(id="VARIANT01"), 0)
+
+        for data_format in ("columnar", "binary"):
+            content = self.client.get(url, {"format": data_format}).content
+            self.assertEqual(cache.get(workshop_data_key(self.workshop.name, data_format)), content)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url, {"format": data_format}).content, content)
+            self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_workshop_data_added_records_invalidate_cache_on_commit(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        _json(self.client.get(url))
+        generation = workshop_data_generation(self.workshop.name)
+        self.assertIsNotNone(cache.get(workshop_data_key(self.workshop.name)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("api:v1:workshop-data-add"),
+                data=[{"time": "2020-06-01T10:00:00+00:00", "pm25": 4.0, "device": "INVAL01", "workshop": self.workshop.name}],
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertGreater(workshop_data_generation(self.workshop.name), generation)
+        self.assertIsNone(cache.get(workshop_data_key(self.workshop.name)))
+        self.assertEqual(len(_json(self.client.get(url))), 1)
+
+    def test_workshop_data_device_rename_invalidates_cache(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        self._add_measurement(Device.objects.create(id="RENAME01", device_name="Old name"), 0)
+        self.assertEqual(_json(self.client.get(url))[0]["display_name"], "Old name")
+
+        device = Device.objects.get(id="RENAME01")
+        with self.captureOnCommitCallbacks(execute=True):
+            device.device_name = "New name"
+            device.save()
+
+        self.assertEqual(_json(self.client.get(url))[0]["display_name"], "New name")
+
+    def test_unknown_workshop_leaves_no_permanent_cache_entries(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": "no-such-workshop"})
+        with patch("workshops.cache.cache.add", wraps=cache.add) as add:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(add.call_args_list)
+        self.assertNotIn(None, [call.args[2] for call in add.call_args_list])
+        self.assertIn(GENERATION_TIMEOUT, [call.args[2] for call in add.call_args_list])
+
+    def test_workshop_data_cache_miss_is_rebuilt_once(self):
+        key = workshop_data_key(self.workshop.name)
+        value, lock = get_or_lock(key)
+        self.assertIsNone(value)
+        cache.set(key, b"[]")
+        # a concurrent request finds the result of the rebuild instead of rebuilding itself
+        self.assertEqual(get_or_lock(key), (b"[]", None))
+        lock.release()
+
+    def test_workshop_data_unread_stream_releases_rebuild_lock_on_close(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        # client went away before the first chunk was read
+        response.close()
+        self.assertTrue(cache.add(_lock_key(workshop_data_key(self.workshop.name)), 1))
+
+    def test_workshop_data_streams_asynchronously_under_asgi(self):
+        self._add_measurement(Device.objects.create(id="STREAM03"), 0)
+        response = streaming_response(AsyncRequestFactory().get("/"), stream_json(self.workshop.name), "application/json")
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(len(json.loads(async_to_sync(read)())), 1)
+
+    def _add_track(self, device, values):
+        """One reading per second along a straight line (west to east) with the given pm25 values."""
+        for second, value in enumerate(values):
+            measurement = Measurement.objects.create(
+                device=device,
+                workshop=self.workshop,
+                time_measured=f"2020-06-01T10:00:{second:02d}+00:00",
+                sensor_model=1,
+                location=Location.objects.create(coordinates=Point(16.37 + second * 0.00001, 48.21, srid=4326)),
+            )
+            Values.objects.create(measurement=measurement, dimension=3, value=value)
+
+    def test_workshop_data_simplify_keeps_track_ends_and_extremes(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        values = [5.0] * 50
+        values[20], values[30] = 50.0, 1.0
+        self._add_track(Device.objects.create(id="TRACK01"), values)
+
+        rows = _json(self.client.get(url, {"simplify": "16", "dimension": "pm25"}))
+
+        self.assertEqual([row["pm25"] for row in rows], [5.0, 50.0, 1.0, 5.0])
+        self.assertEqual(len(_json(self.client.get(url))), 50)
+
+    def test_workshop_data_simplify_binary_format(self):
+        self._add_track(Device.objects.create(id="TRACK02"), [5.0] * 30)
+
+        response = self.client.get(
+            reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name}), {"simplify": "16", "format": "binary"}
+        )
+
+        content = response.content
+        (header_length,) = struct.unpack("<I", content[8:12])
+        self.assertEqual(json.loads(content[12:12 + header_length])["count"], 2)
+
+    def test_workshop_data_simplify_bad_request(self):
+        url = reverse("api:v1:workshop-data", kwargs={"pk": self.workshop.name})
+        for params in ({"simplify": "99"}, {"simplify": "x"}, {"simplify": "12", "dimension": "nope"},
+                       {"simplify": "12", "cursor": ""}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+class WorkshopGridEndpointTest(TestCase):
+    """GET workshops/<pk>/grid/ - workshop data aggregated into map cells."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.workshop = Workshop.objects.create(
+            title="Grid Workshop",
+            start_date="2020-01-01T00:00:00+00:00",
+            end_date="2020-12-31T23:59:59+00:00",
+        )
+        self.url = reverse("api:v1:workshop-grid", kwargs={"pk": self.workshop.name})
+
+    def _add_measurement(self, device, second, lon, lat, pm25):
+        measurement = Measurement.objects.create(
+            device=device,
+            workshop=self.workshop,
+            time_measured=f"2020-06-01T10:00:{second:02d}+00:00",
+            sensor_model=1,
+            location=Location.objects.create(coordinates=Point(lon, lat, srid=4326)),
+        )
+        Values.objects.create(measurement=measurement, dimension=3, value=pm25)
+
+    def test_workshop_grid_aggregates_both_sources_per_cell(self):
+        device = Device.objects.create(id="GRID01")
+        self._add_measurement(device, 0, 16.37000, 48.21000, 10.0)
+        self._add_measurement(device, 1, 16.37001, 48.21001, 20.0)
+        self._add_measurement(device, 2, 16.50000, 48.30000, 5.0)
+        AirQualityRecord.objects.create(
+            time="2020-06-01T10:00:03+00:00", device=device, workshop=self.workshop, pm25=30.0, lat=48.21002, lon=16.37002,
+        )
+        AirQualityRecord.objects.create(time="2020-06-01T10:00:04+00:00", device=device, workshop=self.workshop, pm25=99.0)
+
+        response = self.client.get(self.url, {"dimension": "pm25", "cell": "1000"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual((body["dimension"], body["cell_size"]), ("pm25", 1000.0))
+        near, far = body["cells"]
+        self.assertEqual((near["count"], near["mean"], near["max"]), (3, 20.0, 30.0))
+        self.assertAlmostEqual(near["lat"], 48.21, places=2)
+        self.assertEqual((far["count"], far["max"]), (1, 5.0))
+
+    def test_workshop_grid_zoom_sets_cell_size(self):
+        response = self.client.get(self.url, {"zoom": "15"})
+        self.assertEqual(response.json()["cell_size"], 76.0)
+
+    def test_workshop_grid_of_finished_workshop_is_cached_until_new_data(self):
+        self.client.get(self.url, {"cell": "1000"})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {"cell": "1000"})
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("api:v1:workshop-data-add"),
+                data=[{
+                    "time": "2020-06-01T10:00:00+00:00", "pm25": 4.0, "device": "GRID02",
+                    "workshop": self.workshop.name, "lat": 48.21, "lon": 16.37,
+                }],
+                format="json",
+            )
+        (cell,) = self.client.get(self.url, {"cell": "1000"}).json()["cells"]
+        self.assertEqual(cell["count"], 1)
+
+    def test_workshop_grid_bad_request(self):
+        for params in ({}, {"dimension": "nope", "cell": "100"}, {"zoom": "99"}, {"cell": "abc"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_workshop_grid_not_found(self):
+        response = self.client.get(reverse("api:v1:workshop-grid", kwargs={"pk": "nonexistent"}), {"zoom": "12"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
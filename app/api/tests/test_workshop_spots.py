@@ -1,12 +1,20 @@
 """Tests for workshop spots add, delete, list endpoints."""
 from django.contrib.gis.geos import Point
+from django.core.cache import cache
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from datetime import datetime, timezone
+
 from accounts.models import CustomUser
-from workshops.models import Workshop, WorkshopSpot
+from api.models import Location
+from devices.ingest import Reading, write_readings
+from devices.models import Device, Measurement, Values
+from main.enums import Dimension
+from workshops.cache import workshop_data_key
+from workshops.models import Workshop, WorkshopSpot, WorkshopSpotStat
 
 
 class WorkshopSpotAddEndpointTest(TestCase):
@@ -120,3 +128,107 @@ class WorkshopSpotListEndpointTest(TestCase):
             reverse("api:v1:workshop-spot-list", kwargs={"pk": "nonexistent"})
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WorkshopSpotStatsTest(TestCase):
+    """Per-spot statistics: filled on spot creation, updated on ingest, listed without spatial joins."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            username="statowner", email="stat@test.com", password="testpass123"
+        )
+        self.workshop = Workshop.objects.create(
+            title="Stat Workshop",
+            start_date="2020-01-01T00:00:00+00:00",
+            end_date="2020-12-31T23:59:59+00:00",
+            owner=self.user,
+        )
+        self.device = Device.objects.create(id="SPOT01")
+
+    def _add_spot(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            reverse("api:v1:workshop-spot-add"),
+            data={"workshop": self.workshop.name, "lat": 48.21, "lon": 16.37, "radius": 100.0, "type": "hot"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return WorkshopSpot.objects.get(workshop=self.workshop)
+
+    def _write(self, second, lon, temperature):
+        location = Location.objects.create(coordinates=Point(lon, 48.21, srid=4326))
+        reading = Reading(
+            time_measured=datetime(2020, 6, 1, 10, 0, second, tzinfo=timezone.utc),
+            sensors={"1": {"type": 1, "data": {Dimension.TEMPERATURE: temperature, Dimension.PM2_5: 4.0}}},
+            workshop_id=self.workshop.name,
+            location_id=location.pk,
+        )
+        write_readings(self.device, [reading], time_received=reading.time_measured)
+
+    def test_spot_creation_aggregates_existing_readings(self):
+        measurement = Measurement.objects.create(
+            device=self.device,
+            workshop=self.workshop,
+            time_measured="2020-06-01T10:00:00+00:00",
+            sensor_model=1,
+            location=Location.objects.create(coordinates=Point(16.37, 48.21, srid=4326)),
+        )
+        Values.objects.create(measurement=measurement, dimension=Dimension.TEMPERATURE, value=30.0)
+
+        spot = self._add_spot()
+
+        stat = WorkshopSpotStat.objects.get(spot=spot, dimension=Dimension.TEMPERATURE)
+        self.assertEqual((stat.count, stat.mean), (1, 30.0))
+
+    def test_ingested_readings_update_spot_stats(self):
+        spot = self._add_spot()
+        self._write(0, 16.37, 20.0)
+        self._write(1, 16.3701, 26.0)
+        self._write(2, 16.50, 40.0)  # outside the spot
+
+        stat = WorkshopSpotStat.objects.get(spot=spot, dimension=Dimension.TEMPERATURE)
+        self.assertEqual((stat.count, stat.total, stat.minimum, stat.maximum), (2, 46.0, 20.0, 26.0))
+
+        self.client.post(
+            reverse("api:v1:workshop-data-add"),
+            data=[{
+                "time": "2020-06-01T10:00:03+00:00", "temperature": 32.0, "device": "SPOT02",
+                "workshop": self.workshop.name, "lat": 48.21, "lon": 16.37,
+            }],
+            format="json",
+        )
+        stat.refresh_from_db()
+        self.assertEqual((stat.count, stat.maximum), (3, 32.0))
+
+    def test_spot_list_exposes_stats(self):
+        spot = self._add_spot()
+        self._write(0, 16.37, 20.0)
+
+        (listed,) = self.client.get(
+            reverse("api:v1:workshop-spot-list", kwargs={"pk": self.workshop.name})
+        ).json()
+
+        self.assertEqual(listed["pk"], spot.pk)
+        self.assertEqual((listed["temperature"], listed["pm25"], listed["humidity"]), (20.0, 4.0, None))
+        self.assertEqual(listed["stats"][str(Dimension.TEMPERATURE)], {"mean": 20.0, "min": 20.0, "max": 20.0, "count": 1})
+
+    def test_deleted_measurement_leaves_spot_stats_and_cached_data(self):
+        spot = self._add_spot()
+        self._write(0, 16.37, 20.0)
+        self._write(1, 16.3701, 26.0)
+        key = workshop_data_key(self.workshop.name)
+        cache.set(key, b"[]")
+        admin = CustomUser.objects.create_superuser(username="statadmin", email="admin@test.com", password="testpass123")
+        self.client.force_login(admin)
+
+        measurement = Measurement.objects.get(device=self.device, time_measured=datetime(2020, 6, 1, 10, 0, 1, tzinfo=timezone.utc))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("measurement-delete", kwargs={"pk": self.device.pk, "measurement_pk": measurement.pk})
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        stat = WorkshopSpotStat.objects.get(spot=spot, dimension=Dimension.TEMPERATURE)
+        self.assertEqual((stat.count, stat.maximum), (1, 20.0))
+        self.assertNotEqual(workshop_data_key(self.workshop.name), key)
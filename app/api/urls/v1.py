@@ -10,6 +10,7 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from api.views import (
     AirQualityDataAddView,
     CreateDeviceDataAPIView,
+    CreateDeviceDataBatchAPIView,
     CreateDeviceStatusAPIView,
     CreateWorkshopSpotAPIView,
     DeleteWorkshopSpotAPIView,
@@ -17,6 +18,7 @@ from api.views import (
     DeviceNameView,
     WorkshopAirQualityDataView,
     WorkshopDetailView,
+    WorkshopGridView,
 )
 
 @extend_schema(exclude=True)
@@ -32,12 +34,14 @@ urlpatterns = [
     # Devices (status, data, name)
     path("devices/status/", CreateDeviceStatusAPIView.as_view(), name="device-status"),
     path("devices/data/", CreateDeviceDataAPIView.as_view(), name="device-data"),
+    path("devices/data/batch/", CreateDeviceDataBatchAPIView.as_view(), name="device-data-batch"),
     path("devices/name/", DeviceNameView.as_view(), name="device-name"),
 
     # Workshops
     path("workshops/data/add/", AirQualityDataAddView.as_view(), name="workshop-data-add"),
     path("workshops/<str:pk>/", WorkshopDetailView.as_view(), name="workshop-detail"),
     path("workshops/<str:pk>/data/", WorkshopAirQualityDataView.as_view(), name="workshop-data"),
+    path("workshops/<str:pk>/grid/", WorkshopGridView.as_view(), name="workshop-grid"),
 
     # Workshop spots (nested under workshops concept)
     path("workshops/spot/add/", CreateWorkshopSpotAPIView.as_view(), name="workshop-spot-add"),
@@ -1,6 +1,7 @@
 """API views package. Re-exports all views for backward compatibility."""
 from .devices import (
     CreateDeviceDataAPIView,
+    CreateDeviceDataBatchAPIView,
     CreateDeviceStatusAPIView,
     DeviceDetailView,
     DeviceNameView,
@@ -11,6 +12,7 @@ from .workshops import (
     LegacyWorkshopDetailView,
     WorkshopAirQualityDataView,
     WorkshopDetailView,
+    WorkshopGridView,
 )
 from .workshop_spots import (
     CreateWorkshopSpotAPIView,
@@ -23,6 +25,7 @@ __all__ = [
     "LegacyAirQualityDataAddView",
     "LegacyWorkshopDetailView",
     "CreateDeviceDataAPIView",
+    "CreateDeviceDataBatchAPIView",
     "CreateDeviceStatusAPIView",
     "CreateWorkshopSpotAPIView",
     "DeleteWorkshopSpotAPIView",
@@ -31,4 +34,5 @@ __all__ = [
     "DeviceNameView",
     "WorkshopAirQualityDataView",
     "WorkshopDetailView",
+    "WorkshopGridView",
 ]
@@ -15,18 +15,21 @@ from rest_framework.exceptions import ValidationError
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
-from django.contrib.gis.geos import Point
-
-from devices.models import Device, DeviceLogs, Measurement, Values
+from devices.identity import authenticate_device
+from devices.ingest import PendingReading, Reading, store_readings, write_readings
+from devices.ingest_buffer import buffer_full, buffering_enabled, enqueue_data, enqueue_status
+from devices.locations import location_ids
+from devices.models import Device, DeviceLogs
 from devices.sensor_scan import parse_sensor_scan, sensor_list_from_model_ids
 from main.util import get_or_create_station
-from api.models import Location, MobilityMode
+from api.models import MobilityMode
 from workshops.models import Participant, Workshop
 
 from stations.station_url import resolve_station_from_pk
 
 from api.serializers import (
     DeviceSerializer,
+    DeviceDataBatchSerializer,
     DeviceDataSerializer,
     DeviceStatusRequestSerializer,
     DeviceNameSerializer,
@@ -87,26 +90,38 @@ def extract_workshop(data, device_block):
     return None
 
 
-def _latest_status_list_level(status_list):
-    """Level of the status_list entry with the greatest `time` (not necessarily last index)."""
+def _status_list_time(t_raw):
+    if isinstance(t_raw, datetime):
+        return django_timezone.make_aware(t_raw) if django_timezone.is_naive(t_raw) else t_raw
+    return parse_datetime(str(t_raw))
+
+
+def _process_status_list(status_list):
+    """
+    One pass over status_list. Returns (log_rows, scan_parse, latest_level):
+    DeviceLogs field dicts in list order, the last sensor scan found in an INFO (level 1) line,
+    and the level of the entry with the greatest `time` (not necessarily last index).
+    """
+    log_rows = []
+    scan_parse = None
     latest_dt = None
     latest_level = None
     for status_data in status_list:
+        level = status_data.get("level", 1)
+        message = status_data.get("message", "")
         t_raw = status_data.get("time")
-        if t_raw is None:
-            continue
-        if isinstance(t_raw, datetime):
-            dt = t_raw
-            if django_timezone.is_naive(dt):
-                dt = django_timezone.make_aware(dt)
-        else:
-            dt = parse_datetime(str(t_raw))
-        if dt is None:
-            continue
-        if latest_dt is None or dt > latest_dt:
+        dt = _status_list_time(t_raw) if t_raw is not None else None
+        # unparsable times are passed through unchanged; bulk_create rejects them (400)
+        log_rows.append({"timestamp": dt or t_raw, "level": level, "message": message})
+
+        if level == 1:
+            parsed = parse_sensor_scan(message or "")
+            if parsed is not None:
+                scan_parse = parsed
+        if dt is not None and (latest_dt is None or dt > latest_dt):
             latest_dt = dt
-            latest_level = status_data.get("level", 1)
-    return latest_level
+            latest_level = level
+    return log_rows, scan_parse, latest_level
 
 
 @extend_schema(
@@ -221,46 +236,52 @@ class CreateDeviceStatusAPIView(APIView):
             logger.warning("Device status 400: missing device block. Request body: %s", request.data)
             raise ValidationError("Device block ('device' or 'station') is required.")
 
-        device, station_status = get_or_create_station(station_info=device_data)
+        log_rows, scan_parse, latest_level = _process_status_list(status_list)
 
-        if device.api_key != device_data.get("apikey"):
-            logger.warning("Device status 400: wrong API key. Request body: %s", request.data)
-            raise ValidationError("Wrong API Key")
+        # the sensor scan only needs the payload, so the merged sensor_list goes into the status row directly
+        sensor_list = device_data.get("sensor_list")
+        if scan_parse is not None:
+            sensor_list = sensor_list_from_model_ids(
+                scan_parse.model_ids,
+                previous=sensor_list,
+                serial_by_model=scan_parse.serial_by_model,
+            )
 
-        if device.test_mode is None:
-            device.test_mode = device_data.get("test_mode")
-        if device.calibration_mode is None:
-            device.calibration_mode = device_data.get("calibration_mode")
-        device.save()
+        buffered = buffering_enabled()
+        if buffered:
+            if buffer_full():
+                return _ingest_busy_response()
+            if any(not isinstance(row["timestamp"], datetime) for row in log_rows):
+                raise ValidationError("Every status_list entry needs a valid time.")
 
         try:
-            if status_list:
-                with transaction.atomic():
-                    for status_data in status_list:
-                        DeviceLogs.objects.create(
-                            device=device,
-                            timestamp=status_data["time"],
-                            level=status_data.get("level", 1),
-                            message=status_data.get("message", ""),
-                        )
+            if buffered:
+                # status row and log lines are written by the flusher
+                device = authenticate_device(device_data)
+            else:
+                device, _ = get_or_create_station(station_info=device_data, sensor_list=sensor_list)
+        except ValidationError:
+            logger.warning("Device status 400: wrong API key. Request body: %s", request.data)
+            raise
 
-                    scan_parse = None
-                    for status_data in status_list:
-                        if status_data.get("level", 1) != 1:
-                            continue
-                        msg = status_data.get("message", "") or ""
-                        parsed = parse_sensor_scan(msg)
-                        if parsed is not None:
-                            scan_parse = parsed
-                    if scan_parse is not None:
-                        station_status.sensor_list = sensor_list_from_model_ids(
-                            scan_parse.model_ids,
-                            previous=station_status.sensor_list,
-                            serial_by_model=scan_parse.serial_by_model,
-                        )
-                        station_status.save(update_fields=["sensor_list"])
+        # flags are only seeded from the device while unset; write only when that happens
+        changed_flags = []
+        for flag in ("test_mode", "calibration_mode"):
+            if getattr(device, flag) is None and device_data.get(flag) is not None:
+                setattr(device, flag, device_data[flag])
+                changed_flags.append(flag)
+        if changed_flags:
+            device.save(update_fields=changed_flags)
+
+        try:
+            if buffered:
+                enqueue_status(device, device_data, sensor_list, status_list, datetime.now(timezone.utc))
+            elif log_rows:
+                if any(row["timestamp"] is None for row in log_rows):
+                    raise ValueError("Every status_list entry needs a time.")
+                # one statement: all lines are written or none (Django rejects unparsable times before the query)
+                DeviceLogs.objects.bulk_create([DeviceLogs(device=device, **row) for row in log_rows])
 
-            device.refresh_from_db()
             payload = {
                 "status": "success",
                 "flags": {
@@ -269,10 +290,8 @@ class CreateDeviceStatusAPIView(APIView):
                 },
             }
             desired = device.log_level
-            if desired is not None:
-                latest_level = _latest_status_list_level(status_list)
-                if latest_level is not None and latest_level != desired:
-                    payload["log_level"] = desired
+            if desired is not None and latest_level is not None and latest_level != desired:
+                payload["log_level"] = desired
 
             return Response(payload, status=200)
 
@@ -284,12 +303,12 @@ class CreateDeviceStatusAPIView(APIView):
 @extend_schema(
     tags=["devices"],
     summary="Add device measurement data",
-    description="Adds measurement data from sensors for a device. Request body: device, sensors. Optional workshop (requires location when present), optional location {lat, lon}. Creates Measurement and Values records. Prevents duplicate measurements.",
+    description="Adds measurement data from sensors for a device. Request body: device, sensors. Optional workshop (requires location when present), optional location {lat, lon}. Creates Measurement and Values records. Sensors whose (device, time, sensor_model) is already stored are skipped and listed under skipped.",
     request=DeviceDataSerializer,
     responses={
-        200: {"description": "Measurements created successfully, or no sensor data found"},
+        200: {"description": "Measurements created successfully (skipped lists sensors that were already stored), or no sensor data found"},
         400: {"description": "Validation error - wrong API key or invalid data"},
-        422: {"description": "Duplicate measurement - measurement with same device, time, and sensor_model already exists"},
+        422: {"description": "Duplicate measurement - every sensor of the reading already exists for this device and time"},
     },
     examples=[
         OpenApiExample(
@@ -316,6 +335,25 @@ class CreateDeviceStatusAPIView(APIView):
 class CreateDeviceDataAPIView(APIView):
     serializer_class = DeviceDataSerializer
 
+    def _buffer(self, request, device_data, device_info, sensors_data):
+        """INGEST_MODE = "buffered": authenticate, validate and stage the request (devices.ingest_buffer)."""
+        if buffer_full():
+            return _ingest_busy_response()
+        device = authenticate_device(device_info)
+        if not parse_datetime(device_data["time"]):
+            raise ValidationError("Invalid device.time.")
+
+        time_received = datetime.now(timezone.utc)
+        if not sensors_data:
+            enqueue_data(device, None, time_received)
+            return JsonResponse({"status": "success, but no sensor data found"}, status=200)
+        try:
+            pending = _pending_reading(request.data, device_data, device_data)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValidationError(str(e))
+        enqueue_data(device, pending, time_received)
+        return JsonResponse({"status": "success"}, status=200)
+
     def post(self, request, *args, **kwargs):
         try:
             device_data = extract_device_block(request.data)
@@ -334,10 +372,10 @@ class CreateDeviceDataAPIView(APIView):
                 "model": device_data.get("model"),
                 "apikey": device_data.get("apikey"),
             }
-            device, _ = get_or_create_station(station_info=device_info)
+            if buffering_enabled():
+                return self._buffer(request, device_data, device_info, sensors_data)
 
-            if device.api_key != device_data.get("apikey"):
-                raise ValidationError("Wrong API Key")
+            device, _ = get_or_create_station(station_info=device_info)
 
             time_received = datetime.now(timezone.utc)
             time_measured = parse_datetime(device_data["time"])
@@ -351,6 +389,7 @@ class CreateDeviceDataAPIView(APIView):
             participant_obj = None
             mode_obj = None
             if workshop_data:
+                _check_workshop(workshop_data)
                 workshop_obj = Workshop.objects.filter(name=workshop_data["id"]).first()
                 if workshop_obj is None and settings.DEBUG:
                     logger.warning(
@@ -386,51 +425,37 @@ class CreateDeviceDataAPIView(APIView):
                     workshop_data.get("mode") if workshop_data else None,
                 )
 
+            reading = Reading(
+                time_measured=time_measured,
+                sensors=sensors_data,
+                workshop_id=workshop_obj.pk if workshop_obj else None,
+                participant_id=participant_obj.pk if participant_obj else None,
+                mode_id=mode_obj.pk if mode_obj else None,
+            )
+
             try:
                 with transaction.atomic():
                     # Create location if lat/lon provided (same as workshops/data/add)
-                    location_obj = None
                     if lat is not None and lon is not None:
-                        point = Point(float(lon), float(lat), srid=4326)
-                        location_obj = Location.objects.create(coordinates=point)
-                    for sensor_id, sensor_data in sensors_data.items():
-                        existing_measurement = Measurement.objects.filter(
-                            device=device,
-                            time_measured=time_measured,
-                            sensor_model=sensor_data["type"],
-                        ).first()
-
-                        if existing_measurement:
-                            return JsonResponse(
-                                {"status": "error", "detail": "Measurement already in Database"},
-                                status=422,
-                            )
-
-                        measurement = Measurement(
-                            sensor_model=sensor_data["type"],
-                            device=device,
-                            time_measured=time_measured,
-                            time_received=time_received,
-                            room=device.current_room,
-                            user=device.current_user,
-                            workshop=workshop_obj,
-                            participant=participant_obj,
-                            mode=mode_obj,
-                            location_id=location_obj.pk if location_obj else None,
-                        )
-                        measurement.save()
+                        reading.location_id = location_ids([(lon, lat)])[0]
 
-                        for dimension, value in sensor_data["data"].items():
-                            Values.objects.create(
-                                dimension=int(dimension),
-                                value=float(value),
-                                measurement=measurement,
-                            )
+                    result = write_readings(device, [reading], time_received=time_received)
 
-                    device.last_update = time_measured
-                    device.save()
+                    if not result.created:
+                        # every sensor already stored: drop the location created above
+                        transaction.set_rollback(True)
+                        return JsonResponse(
+                            {"status": "error", "detail": "Measurement already in Database"},
+                            status=422,
+                        )
 
-                    return JsonResponse({"status": "success"}, status=200)
+                    body = {"status": "success"}
+                    if result.skipped:
+                        body["skipped"] = [
+                            {"time": time_measured.isoformat(), "sensor_model": sensor_model}
+                            for time_measured, sensor_model in result.skipped
+                        ]
+                    return JsonResponse(body, status=200)
 
             except Exception as e:
                 return JsonResponse({"status": "error", "message": str(e)}, status=400)
@@ -439,3 +464,154 @@ class CreateDeviceDataAPIView(APIView):
             import traceback
             logger.error(traceback.format_exc())
             return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+
+def _ingest_busy_response():
+    """503 while the ingest buffer is above its high-water mark; devices retry later."""
+    return JsonResponse(
+        {"status": "error", "detail": "Ingest buffer full, retry later."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(settings.INGEST_BUFFER_RETRY_AFTER)},
+    )
+
+
+def _pending_reading(reading_data, device_data, time_block):
+    """
+    Validate one reading (time from ``time_block``, sensors, optional workshop + location) into a
+    PendingReading. Raises ValueError/KeyError/TypeError with a message for the client.
+    """
+    if not isinstance(reading_data, dict):
+        raise ValueError("Reading must be an object.")
+    time_measured = parse_datetime(str(time_block.get("time") or ""))
+    if not time_measured:
+        raise ValueError("Invalid time.")
+    _check_sensors(reading_data.get("sensors"))
+    workshop_data = extract_workshop(reading_data, device_data)
+    location_data = extract_location(reading_data, device_data)
+    if workshop_data and not location_data:
+        raise ValueError("'location' is required when 'workshop' is provided.")
+    if workshop_data:
+        _check_workshop(workshop_data)
+    pending = PendingReading(time_measured=time_measured, sensors=reading_data["sensors"], workshop=workshop_data)
+    if location_data:
+        pending.lat = float(location_data["lat"])
+        pending.lon = float(location_data["lon"])
+    return pending
+
+
+def _check_workshop(workshop_data):
+    """Raise ValueError unless participant and mode (both optional) are names that fit their columns."""
+    for key, model in (("participant", Participant), ("mode", MobilityMode)):
+        value = workshop_data.get(key)
+        if value and (not isinstance(value, str) or len(value) > model._meta.get_field("name").max_length):
+            raise ValueError(f"Invalid workshop {key}.")
+
+
+def _check_sensors(sensors):
+    """Raise ValueError unless ``sensors`` is a non-empty {id: {"type": int, "data": {dim: number}}} map."""
+    if not isinstance(sensors, dict) or not sensors:
+        raise ValueError("No sensor data.")
+    try:
+        for sensor_data in sensors.values():
+            int(sensor_data["type"])
+            for dimension, value in sensor_data["data"].items():
+                int(dimension)
+                float(value)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError("Invalid sensor data.")
+
+
+@extend_schema(
+    tags=["devices"],
+    summary="Add buffered device measurement data",
+    description=(
+        "Batch variant of POST /devices/data/ for devices replaying readings recorded offline. "
+        "The device block is authenticated once; each entry of readings carries its own time, sensors "
+        "and optional location/workshop (workshop requires location). Workshops, participants and "
+        "mobility modes are resolved once per distinct value and all rows are written in bulk. "
+        "The response lists a status per reading: created, duplicate or invalid."
+    ),
+    request=DeviceDataBatchSerializer,
+    responses={
+        200: {"description": "Batch processed; see results for the status of each reading"},
+        400: {"description": "Validation error - wrong API key, missing device block or readings"},
+    },
+    examples=[
+        OpenApiExample(
+            "Replay two readings",
+            value={
+                "device": {
+                    "id": "D83BDA6E37DDAAA",
+                    "firmware": "2.0.0",
+                    "model": 5,
+                    "apikey": "your-api-key-here",
+                },
+                "readings": [
+                    {
+                        "time": "2025-01-07T11:23:23.439Z",
+                        "workshop": {"id": "homrh8", "participant": "8133a310-ffaf-11f0-8794-bbb756d19a96", "mode": "cycling"},
+                        "location": {"lat": 48.1769523, "lon": 16.3654834},
+                        "sensors": {"1": {"type": 1, "data": {"2": 5, "3": 6, "5": 7}}},
+                    },
+                    {
+                        "time": "2025-01-07T11:23:24.439Z",
+                        "workshop": {"id": "homrh8", "participant": "8133a310-ffaf-11f0-8794-bbb756d19a96", "mode": "cycling"},
+                        "location": {"lat": 48.1769611, "lon": 16.3654902},
+                        "sensors": {"1": {"type": 1, "data": {"2": 5, "3": 7, "5": 8}}},
+                    },
+                ],
+            },
+            request_only=True,
+        )
+    ],
+)
+class CreateDeviceDataBatchAPIView(APIView):
+    serializer_class = DeviceDataBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        device_data = extract_device_block(request.data)
+        readings_data = request.data.get("readings")
+
+        if not device_data:
+            raise ValidationError("Device block ('device' or 'station') is required.")
+        if not isinstance(readings_data, list) or not readings_data:
+            raise ValidationError("'readings' must be a non-empty list.")
+        if len(readings_data) > settings.DEVICE_DATA_BATCH_MAX_READINGS:
+            raise ValidationError(
+                f"At most {settings.DEVICE_DATA_BATCH_MAX_READINGS} readings per request."
+            )
+
+        device_info = {
+            "device": device_id_from_block(device_data),
+            "firmware": device_data.get("firmware", ""),
+            "model": device_data.get("model"),
+            "apikey": device_data.get("apikey"),
+        }
+        try:
+            device, _ = get_or_create_station(station_info=device_info)
+        except ValidationError:
+            logger.warning("Device data batch 400: wrong API key for device %s", device_info["device"])
+            raise
+
+        results = [{"index": i, "status": "invalid"} for i in range(len(readings_data))]
+
+        # validate each reading on its own; keep (index, PendingReading)
+        candidates = []
+        for i, reading_data in enumerate(readings_data):
+            try:
+                candidates.append((i, _pending_reading(reading_data, device_data, reading_data)))
+            except (KeyError, TypeError, ValueError) as e:
+                results[i]["detail"] = str(e)
+
+        time_received = datetime.now(timezone.utc)
+        with transaction.atomic():
+            readings, result = store_readings(device, [p for _, p in candidates], time_received=time_received)
+        skipped = {id(reading) for reading in result.skipped_readings}
+        for (i, _), reading in zip(candidates, readings):
+            results[i]["status"] = "duplicate" if id(reading) in skipped else "created"
+
+        summary = {
+            key: sum(1 for r in results if r["status"] == key)
+            for key in ("created", "duplicate", "invalid")
+        }
+        return Response({"status": "success", **summary, "results": results}, status=status.HTTP_200_OK)
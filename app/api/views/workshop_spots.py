@@ -9,11 +9,19 @@ from rest_framework.permissions import IsAuthenticated
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
-from main.util import get_avg_temp_per_spot
+from main.enums import Dimension
 from workshops.models import Workshop, WorkshopSpot
+from workshops.spot_stats import recompute_spots, workshop_spot_stats
 
 from api.serializers import WorkshopSpotSerializer, WorkshopSpotPkSerializer
 
+# mean values listed per spot next to the full "stats"
+SPOT_MEAN_DIMENSIONS = {
+    "temperature": Dimension.TEMPERATURE,
+    "pm25": Dimension.PM2_5,
+    "humidity": Dimension.HUMIDITY,
+}
+
 
 @extend_schema(
     tags=["workshops"],
@@ -56,13 +64,16 @@ class CreateWorkshopSpotAPIView(APIView):
         circle_polygon = center.buffer(j["radius"], quadsegs=32)
         circle_polygon.transform(4326)
 
-        WorkshopSpot.objects.get_or_create(
+        workshop_spot, created = WorkshopSpot.objects.get_or_create(
             workshop=workshop,
             center=center,
             radius=j["radius"],
             area=circle_polygon,
             type=j["type"],
         )
+        if created:
+            # later readings are added on ingest (workshops.spot_stats)
+            recompute_spots([workshop_spot.pk])
 
         return Response(status=status.HTTP_201_CREATED)
 
@@ -105,7 +116,10 @@ class DeleteWorkshopSpotAPIView(APIView):
 @extend_schema(
     tags=["workshops"],
     summary="Get workshop spots",
-    description="Retrieves all spots (hot and cool areas) for a specific workshop, including their average temperatures.",
+    description=(
+        "Retrieves all spots (hot and cool areas) for a specific workshop, with the mean temperature, PM2.5 and "
+        "humidity of the readings inside each spot and mean/min/max/count per dimension id in \"stats\"."
+    ),
     parameters=[
         OpenApiParameter(
             name="pk",
@@ -117,7 +131,7 @@ class DeleteWorkshopSpotAPIView(APIView):
         )
     ],
     responses={
-        200: {"description": "List of workshop spots with coordinates, radius, type, and average temperature"},
+        200: {"description": "List of workshop spots with coordinates, radius, type, mean values and per-dimension statistics"},
         400: {"description": "Invalid workshop name"},
         404: {"description": "Workshop not found"},
     },
@@ -130,16 +144,24 @@ class GetWorkshopSpotsAPIView(APIView):
         if workshop is None:
             raise ValidationError("Workshop doesn't exists")
 
-        mean_temperature = {ws_id: mean_temp for ws_id, mean_temp in get_avg_temp_per_spot(pk)}
+        stats = workshop_spot_stats(pk)
         ret = []
         for workshop_spot in workshop.workshop_spots.all():
+            spot_stats = stats.get(workshop_spot.id, {})
             ret.append({
                 "pk": workshop_spot.pk,
                 "lon": workshop_spot.center.x,
                 "lat": workshop_spot.center.y,
                 "radius": workshop_spot.radius,
                 "type": workshop_spot.type,
-                "temperature": mean_temperature.get(workshop_spot.id, None),
+                **{
+                    name: spot_stats[dimension].mean if dimension in spot_stats else None
+                    for name, dimension in SPOT_MEAN_DIMENSIONS.items()
+                },
+                "stats": {
+                    dimension: {"mean": stat.mean, "min": stat.minimum, "max": stat.maximum, "count": stat.count}
+                    for dimension, stat in sorted(spot_stats.items())
+                },
             })
 
         return JsonResponse(ret, status=200, safe=False)
@@ -1,9 +1,12 @@
-"""Views for workshop and workshop air quality API (detail, data GET, air quality add)."""
+"""Views for workshop and workshop air quality API (detail, data GET, grid, air quality add)."""
+import json
 import logging
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.core.cache import cache
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from rest_framework.views import APIView
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
@@ -11,14 +14,44 @@ from rest_framework import status
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
-from devices.models import Device, Measurement
-from main import enums
+from devices.models import Device
+from devices.ingest import ensure_modes, ensure_participants
+from devices.locations import location_ids
+from api.workshop_data import (
+    ColumnarBuilder,
+    RowListBuilder,
+    RowPosition,
+    cache_stream,
+    collect_rows,
+    decode_cursor,
+    stream_json,
+)
+from api.workshop_grid import (
+    CELL_PIXELS,
+    DEFAULT_DIMENSION,
+    MAX_CELL_SIZE,
+    MAX_ZOOM,
+    MIN_CELL_SIZE,
+    parse_grid_params,
+    workshop_grid,
+)
+from api.workshop_tracks import iter_simplified_rows, parse_simplify_zoom
 from api.models import AirQualityRecord
-from workshops.models import Participant, Workshop
-from api.models import MobilityMode
+from main import enums
+from main.streaming import streaming_response
+from workshops.cache import (
+    DATA_TIMEOUT,
+    FINISHED_DATA_TIMEOUT,
+    get_or_lock,
+    invalidate_workshop_data,
+    workshop_data_key,
+)
+from workshops.models import Workshop
+from workshops.spot_stats import add_air_quality_records as add_air_quality_records_to_spots
 
 from api.serializers import (
     AirQualityRecordSerializer,
+    AirQualityRecordValuesSerializer,
     AirQualityRecordWorkshopSerializer,
     WorkshopSerializer,
 )
@@ -26,6 +59,13 @@ from api.serializers import (
 logger = logging.getLogger("myapp")
 
 
+def _app_device_id(device_str):
+    """Air Around BLE MAC (as sent by the app) -> Device id: byte-reversed MAC + "AAA"."""
+    mac = device_str.upper()
+    rmac = "".join(reversed([mac[i : i + 2] for i in range(0, len(mac), 2)]))
+    return f"{rmac}AAA"
+
+
 @extend_schema(
     tags=["workshops"],
     summary="Add air quality data",
@@ -67,56 +107,83 @@ class AirQualityDataAddView(APIView):
         if not isinstance(data, list):
             return Response({"error": "Expected a list of records"}, status=status.HTTP_400_BAD_REQUEST)
 
-        records = []
         errors = []
+
+        # pass 1: per-record validation without queries
+        parsed = []  # (record, device_id, time, validated values)
         for record in data:
-            try:
-                device_str = record.get("device")
-                if not device_str:
-                    errors.append({"error": "Device field is required"})
-                    continue
-                mac = device_str.upper()
-                rmac = "".join(reversed([mac[i : i + 2] for i in range(0, len(mac), 2)]))
-                device_id = f"{rmac}AAA"
-
-                device, _ = Device.objects.get_or_create(id=device_id)
-                participant, _ = Participant.objects.get_or_create(name=record.get("participant"))
-                mode, _ = MobilityMode.objects.get_or_create(name=record.get("mode"))
-                workshop = Workshop.objects.get(name=record.get("workshop"))
-                time = parse_datetime(record.get("time"))
-
-                if AirQualityRecord.objects.filter(time=time, device=device).exists():
-                    errors.append({"error": f"Record with time {time} and device {device.id} already exists"})
-                    continue
-
-                if not (workshop.start_date <= time <= workshop.end_date):
-                    errors.append({"error": f"The time {time} of the record is not within the start and end date of the workshop."})
-                    continue
-
-                air_quality_data = {
-                    **record,
-                    "device": device,
-                    "workshop": record.get("workshop"),
-                    "participant": participant,
-                    "mode": mode,
-                }
+            if not isinstance(record, dict):
+                errors.append({"error": "Expected an object"})
+                continue
+            device_str = record.get("device")
+            if not device_str:
+                errors.append({"error": "Device field is required"})
+                continue
+            time = parse_datetime(str(record.get("time") or ""))
+            if time is None:
+                errors.append({"error": "Invalid or missing time"})
+                continue
+            serializer = AirQualityRecordValuesSerializer(data=record)
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            parsed.append((record, _app_device_id(str(device_str)), time, serializer.validated_data))
 
-                serializer = AirQualityRecordSerializer(data=air_quality_data)
-                if serializer.is_valid():
-                    serializer.save()
-                    records.append(serializer.data)
-                    workshop_name = record.get("workshop")
-                    if workshop_name:
-                        cache_key = f"workshop_data_{workshop_name}"
-                        cache.delete(cache_key)
-                        logger.info(f"Invalidated cache for workshop {workshop_name}")
-                else:
-                    errors.append(serializer.errors)
-            except Workshop.DoesNotExist:
+        # pass 2: set-based lookups for all distinct workshops and existing (device, time) pairs
+        workshops = Workshop.objects.in_bulk({record.get("workshop") for record, _, _, _ in parsed if record.get("workshop")})
+        existing = set(
+            AirQualityRecord.objects.filter(
+                device_id__in={device_id for _, device_id, _, _ in parsed},
+                time__in={time for _, _, time, _ in parsed},
+            ).values_list("device_id", "time")
+        ) if parsed else set()
+
+        to_create = []
+        for record, device_id, time, values in parsed:
+            workshop = workshops.get(record.get("workshop"))
+            if workshop is None:
                 errors.append({"error": "Workshop not found"})
+                continue
+            if (device_id, time) in existing:
+                errors.append({"error": f"Record with time {time} and device {device_id} already exists"})
+                continue
+            if not (workshop.start_date <= time <= workshop.end_date):
+                errors.append({"error": f"The time {time} of the record is not within the start and end date of the workshop."})
+                continue
+            existing.add((device_id, time))  # repeated within the upload
+            to_create.append(AirQualityRecord(
+                **{**values, "time": time},
+                device_id=device_id,
+                workshop=workshop,
+                participant_id=record.get("participant") or None,
+                mode_id=record.get("mode") or None,
+            ))
+
+        created = []
+        if to_create:
+            try:
+                with transaction.atomic():
+                    # unknown devices are few per upload: created through save() for its defaults and the audit log
+                    device_ids = {r.device_id for r in to_create}
+                    known_devices = set(Device.objects.filter(pk__in=device_ids).values_list("pk", flat=True))
+                    for device_id in device_ids - known_devices:
+                        Device.objects.get_or_create(id=device_id)
+                    ensure_participants({r.participant_id: None for r in to_create if r.participant_id})
+                    ensure_modes(r.mode_id for r in to_create)
+
+                    # AirQualityRecord.save() would create one Location per record
+                    located = [r for r in to_create if r.lat is not None and r.lon is not None]
+                    for r, location_id in zip(located, location_ids([(r.lon, r.lat) for r in located])):
+                        r.location_id = location_id
+
+                    created = AirQualityRecord.objects.bulk_create(to_create)
+                    add_air_quality_records_to_spots(r.pk for r in created if r.location_id)
             except IntegrityError as e:
                 errors.append({"error": str(e)})
 
+            invalidate_workshop_data(*{r.workshop_id for r in created})
+
+        records = AirQualityRecordSerializer(created, many=True).data
         if errors:
             return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
         return Response(records, status=status.HTTP_201_CREATED)
@@ -175,10 +242,55 @@ class LegacyWorkshopDetailView(WorkshopDetailView):
             description="Workshop name (primary key)",
             required=True,
             examples=[OpenApiExample("Example workshop", value="homrh8")],
-        )
+        ),
+        OpenApiParameter(
+            name="cursor",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description=(
+                "Incremental polling: only rows added after this cursor are returned, as "
+                '{"data": [...], "cursor": "<next cursor>"}. Pass an empty value for the first request. '
+                "Responses with a cursor leave out rows written within the last minute; they are returned "
+                "by the next poll. Without the parameter the full list is returned."
+            ),
+            required=False,
+        ),
+        OpenApiParameter(
+            name="format",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description=(
+                "json (default): list of records. columnar: column arrays with epoch-second times and "
+                "dictionary-encoded device/participant/mode/display_name. binary: the columnar layout as "
+                "typed arrays (application/octet-stream, see static/js/workshop-data.js)."
+            ),
+            required=False,
+            enum=["json", "columnar", "binary"],
+        ),
+        OpenApiParameter(
+            name="simplify",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description=(
+                f"Web map zoom level (0-{MAX_ZOOM}): return the tracks of each device/participant simplified "
+                "for this zoom (Douglas-Peucker), keeping the highest and lowest readings of the selected "
+                "dimension between retained points. Rows without coordinates are left out. Not combinable "
+                "with cursor."
+            ),
+            required=False,
+        ),
+        OpenApiParameter(
+            name="dimension",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="Dimension whose extremes are kept when simplifying (default pm25).",
+            required=False,
+            enum=list(enums.AQR_DIMENSION_MAP),
+        ),
     ],
     responses={
         200: {"description": "List of air quality records with sensor measurements and location data"},
+        400: {"description": "Invalid cursor, format, simplify zoom or dimension"},
         404: {"description": "Workshop not found"},
     },
 )
@@ -186,117 +298,196 @@ class WorkshopAirQualityDataView(RetrieveAPIView):
     queryset = AirQualityRecord.objects.all()
     serializer_class = AirQualityRecordWorkshopSerializer
 
+    def perform_content_negotiation(self, request, force=False):
+        # "format" selects the payload layout of this endpoint (json/columnar/binary), not a renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    CONTENT_TYPES = {
+        "json": "application/json",
+        "columnar": "application/json",
+        "binary": "application/octet-stream",
+    }
+
     def get(self, request, pk):
-        cache_key = f"workshop_data_{pk}"
-        cached_data = cache.get(cache_key)
+        data_format = request.query_params.get("format") or "json"
+        if data_format not in self.CONTENT_TYPES:
+            return JsonResponse({"error": f"Unknown format: {data_format}"}, status=400)
+        cursor = request.query_params.get("cursor")
+        simplify = request.query_params.get("simplify")
+        if cursor is not None:
+            if simplify is not None:
+                return JsonResponse({"error": "simplify cannot be combined with cursor"}, status=400)
+            return self._get_since(request, pk, data_format, cursor)
+
+        variant = data_format
+        if simplify is not None:
+            dimension = request.query_params.get("dimension") or DEFAULT_DIMENSION
+            try:
+                zoom = parse_simplify_zoom(simplify)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            if dimension not in enums.AQR_DIMENSION_MAP:
+                return JsonResponse({"error": f"Unknown dimension: {dimension}"}, status=400)
+            variant = f"{data_format}_simplified_{zoom}_{dimension}"
+
+        # the cache holds encoded responses per generation of the workshop's data (workshops.cache);
+        # on a miss only one request rebuilds, concurrent ones wait for its result
+        cache_key = workshop_data_key(pk, variant)
+        cached_data, lock = get_or_lock(cache_key)
         if cached_data is not None:
             logger.info(f"Workshop {pk}: Returning cached data")
-            return JsonResponse(cached_data, status=200, safe=False)
+            return HttpResponse(cached_data, content_type=self.CONTENT_TYPES[data_format])
+
+        if not Workshop.objects.filter(name=pk).exists():
+            lock.release()
+            return JsonResponse({"error": "Workshop not found"}, status=404)
+
+        if data_format == "json" and simplify is None:
+            # rows are encoded chunk by chunk while the server-side cursor is read (api.workshop_data),
+            # the bytes are cached when complete unless larger than WORKSHOP_DATA_CACHE_MAX_BYTES;
+            # the lock is released then, or when the response is closed early (also if never read)
+            chunks = cache_stream(
+                stream_json(pk),
+                cache_key,
+                timeout=DATA_TIMEOUT,
+                max_bytes=settings.WORKSHOP_DATA_CACHE_MAX_BYTES,
+                lock=lock,
+            )
+            return streaming_response(request, chunks, "application/json", on_close=lock.release)
 
         try:
-            workshop_obj = Workshop.objects.get(name=pk)
-        except Workshop.DoesNotExist:
+            if simplify is None:
+                content, position = self._columnar_content(pk, data_format, RowPosition.for_cursor())
+            else:
+                content, position = self._simplified_content(pk, data_format, zoom, dimension)
+            if len(content) <= settings.WORKSHOP_DATA_CACHE_MAX_BYTES:
+                # rows held back from the cursor are included by the next build, once they are settled
+                timeout = settings.WORKSHOP_DATA_CURSOR_LAG if position.held_back else DATA_TIMEOUT
+                cache.set(cache_key, content, timeout)
+            else:
+                lock.release_uncacheable(DATA_TIMEOUT)
+        finally:
+            lock.release()
+        return HttpResponse(content, content_type=self.CONTENT_TYPES[data_format])
+
+    @staticmethod
+    def _columnar_content(pk, data_format, position):
+        builder = ColumnarBuilder()
+        collect_rows(pk, builder, position)
+        if data_format == "binary":
+            return builder.to_binary(cursor=position.cursor), position
+        return json.dumps({**builder.to_json(), "cursor": position.cursor}).encode(), position
+
+    @staticmethod
+    def _simplified_content(pk, data_format, zoom, dimension):
+        # the JSON layout has no cursor and holds back no rows
+        position = RowPosition() if data_format == "json" else RowPosition.for_cursor()
+        builder = RowListBuilder() if data_format == "json" else ColumnarBuilder()
+        for columns, row in iter_simplified_rows(pk, zoom, dimension, position):
+            builder.add(columns, row)
+        if data_format == "json":
+            return json.dumps(builder.rows).encode(), position
+        if data_format == "binary":
+            return builder.to_binary(cursor=position.cursor), position
+        return json.dumps({**builder.to_json(), "cursor": position.cursor}).encode(), position
+
+    def _get_since(self, request, pk, data_format, cursor):
+        """
+        Uncached: rows added after ``cursor`` (all rows for an empty one) with the cursor for the
+        next poll, as ``{"data": [...], "cursor": "..."}`` or in the columnar/binary layout.
+        """
+        try:
+            after_measurement, after_record = decode_cursor(cursor)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        if not Workshop.objects.filter(name=pk).exists():
             return JsonResponse({"error": "Workshop not found"}, status=404)
 
-        aqr_reverse = {v: k for k, v in enums.AQR_DIMENSION_MAP.items()}
-        measurements = Measurement.objects.filter(workshop=workshop_obj).all()
-
-        ret = []
-        logger.info(f"Workshop {pk}: Found {measurements.count()} measurements, {AirQualityRecord.objects.filter(workshop=workshop_obj).count()} AirQualityRecords")
-
-        for measurement in measurements:
-            values = {v.dimension: v.value for v in measurement.values.all()}
-
-            data = {
-                "time": measurement.time_measured.isoformat(),
-                "device": measurement.device.id,
-                "participant": measurement.participant.name if measurement.participant else "—",
-                "mode": measurement.mode.name if measurement.mode else "—",
-                "lat": None,
-                "lon": None,
-                "display_name": measurement.device.device_name if measurement.device.device_name is not None else measurement.device.id,
-            }
-            for dim_id, name in aqr_reverse.items():
-                data[name] = values[dim_id] if dim_id in values else None
-            if measurement.location and measurement.location.coordinates:
-                data["lat"] = measurement.location.coordinates.y
-                data["lon"] = measurement.location.coordinates.x
-            ret.append(data)
-
-        air_quality_records = AirQualityRecord.objects.filter(workshop=workshop_obj).select_related("device", "participant", "mode")
-        logger.info(f"Workshop {pk}: Processing {air_quality_records.count()} AirQualityRecords")
-
-        for record in air_quality_records:
-            device_name = None
-            if record.device:
-                device_id = record.device.id if hasattr(record.device, "id") else str(record.device)
-                try:
-                    device = Device.objects.get(id=device_id)
-                    if device.device_name:
-                        device_name = device.device_name
-                    else:
-                        if device_id and len(device_id) >= 3 and device_id.endswith("AAA"):
-                            try:
-                                base_id = device_id[:-3]
-                                if len(base_id) > 0:
-                                    last_char = base_id[-1]
-                                    try:
-                                        last_char_int = int(last_char, 16)
-                                        last_char_int = (last_char_int + 1) % 16
-                                        corrected_last_char = format(last_char_int, "X")
-                                        corrected_base = base_id[:-1] + corrected_last_char
-                                        corrected_device_id = corrected_base + "AAA"
-                                        corrected_device = Device.objects.get(id=corrected_device_id)
-                                        device_name = corrected_device.device_name if corrected_device.device_name else corrected_device.id
-                                        logger.info(f"Found device with corrected ID: {corrected_device_id} (original: {device_id})")
-                                    except (ValueError, Device.DoesNotExist):
-                                        device_name = device_id
-                            except Exception as e:
-                                logger.warning(f"Error correcting device ID {device_id}: {e}")
-                                device_name = device_id
-                        else:
-                            device_name = device_id
-                except Device.DoesNotExist:
-                    if device_id and len(device_id) >= 3 and device_id.endswith("AAA"):
-                        try:
-                            base_id = device_id[:-3]
-                            if len(base_id) > 0:
-                                last_char = base_id[-1]
-                                try:
-                                    last_char_int = int(last_char, 16)
-                                    last_char_int = (last_char_int + 1) % 16
-                                    corrected_last_char = format(last_char_int, "X")
-                                    corrected_base = base_id[:-1] + corrected_last_char
-                                    corrected_device_id = corrected_base + "AAA"
-                                    corrected_device = Device.objects.get(id=corrected_device_id)
-                                    device_name = corrected_device.device_name if corrected_device.device_name else corrected_device.id
-                                    logger.info(f"Found device with corrected ID: {corrected_device_id} (original: {device_id})")
-                                except (ValueError, Device.DoesNotExist):
-                                    device_name = device_id
-                        except Exception as e:
-                            logger.warning(f"Error correcting device ID {device_id}: {e}")
-                            device_name = device_id
-                    else:
-                        device_name = device_id
-
-            data = {
-                "time": record.time.isoformat() if hasattr(record.time, "isoformat") else str(record.time),
-                "device": device_name,
-                "participant": record.participant.name if record.participant else "—",
-                "mode": record.mode.name if record.mode else "—",
-                "lat": record.lat,
-                "lon": record.lon,
-                "display_name": device_name,
-                "pm1": record.pm1,
-                "pm25": record.pm25,
-                "pm10": record.pm10,
-                "temperature": record.temperature,
-                "humidity": record.humidity,
-                "voc": record.voc,
-                "nox": record.nox,
-            }
-            ret.append(data)
-
-        cache.set(cache_key, ret, 900)
-        logger.info(f"Workshop {pk}: Cached data for 15 minutes")
-        return JsonResponse(ret, status=200, safe=False)
+        position = RowPosition.for_cursor(after_measurement, after_record)
+        if data_format == "json":
+            return streaming_response(request, stream_json(pk, position, with_cursor=True), "application/json")
+        content, _ = self._columnar_content(pk, data_format, position)
+        return HttpResponse(content, content_type=self.CONTENT_TYPES[data_format])
+
+
+@extend_schema(
+    tags=["workshops"],
+    summary="Get workshop data as a spatial grid",
+    description=(
+        "Aggregates the located readings of a workshop (Measurement and legacy AirQualityRecord) into "
+        "square cells in Web Mercator. Returns one entry per non-empty cell with the cell center and the "
+        "mean, max and count of the chosen dimension. Grids of finished workshops are cached for a day "
+        "or until new data arrives."
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="pk",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.PATH,
+            description="Workshop name (primary key)",
+            required=True,
+            examples=[OpenApiExample("Example workshop", value="homrh8")],
+        ),
+        OpenApiParameter(
+            name="dimension",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="Value to aggregate (default pm25).",
+            required=False,
+            enum=list(enums.AQR_DIMENSION_MAP),
+        ),
+        OpenApiParameter(
+            name="cell",
+            type=OpenApiTypes.NUMBER,
+            location=OpenApiParameter.QUERY,
+            description=(
+                f"Cell edge in Web Mercator meters, rounded and clamped to "
+                f"{MIN_CELL_SIZE:g}-{MAX_CELL_SIZE:g}. Takes precedence over zoom."
+            ),
+            required=False,
+        ),
+        OpenApiParameter(
+            name="zoom",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description=f"Web map zoom level (0-{MAX_ZOOM}); cells are {CELL_PIXELS} px wide at this zoom.",
+            required=False,
+        ),
+    ],
+    responses={
+        200: {"description": '{"dimension": ..., "cell_size": ..., "cells": [{"lat", "lon", "mean", "max", "count"}]}'},
+        400: {"description": "Unknown dimension or invalid cell/zoom"},
+        404: {"description": "Workshop not found"},
+    },
+)
+class WorkshopGridView(APIView):
+    def get(self, request, pk):
+        try:
+            dimension, cell_size = parse_grid_params(
+                request.query_params.get("dimension"),
+                request.query_params.get("cell"),
+                request.query_params.get("zoom"),
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        cache_key = workshop_data_key(pk, f"grid_{dimension}_{cell_size:g}")
+        cached_data, lock = get_or_lock(cache_key)
+        if cached_data is not None:
+            return HttpResponse(cached_data, content_type="application/json")
+
+        try:
+            workshop = Workshop.objects.filter(name=pk).only("end_date").first()
+            if workshop is None:
+                return JsonResponse({"error": "Workshop not found"}, status=404)
+            content = json.dumps({
+                "dimension": dimension,
+                "cell_size": cell_size,
+                "cells": workshop_grid(pk, dimension, cell_size),
+            }).encode()
+            # a finished workshop's grid only changes with late uploads, which start a new generation
+            finished = workshop.end_date < timezone.now()
+            cache.set(cache_key, content, FINISHED_DATA_TIMEOUT if finished else DATA_TIMEOUT)
+        finally:
+            lock.release()
+        return HttpResponse(content, content_type="application/json")
@@ -0,0 +1,380 @@
+"""
+Rows of GET workshops/<pk>/data/, read with one pivot statement per source.
+
+Measurement + Values are pivoted in the database (one row per measurement, one column per
+dimension of ``AQR_DIMENSION_MAP``), legacy AirQualityRecord rows are read as plain columns, and
+device display names are resolved with one query for all devices. Rows are fetched in chunks
+from a server-side cursor as tuples; no model instances are built.
+
+The default JSON layout is streamed (``stream_json``) and cached as encoded bytes.
+Both sources are read in id order, so an opaque cursor holding the last id of each lets
+clients fetch only rows added since their previous request (``?cursor=``). Ids are assigned at
+insert but become visible at commit, so a slow transaction can commit ids below a cursor that was
+already handed out. Responses with a cursor therefore stop at the first row inserted (``inserted_at``,
+the database clock at insert) within the last ``WORKSHOP_DATA_CURSOR_LAG`` seconds; such rows are
+returned by the next poll. The lag must exceed the longest write transaction (flush or import batch).
+"""
+from __future__ import annotations
+
+import base64
+import json
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from devices.models import Device
+from main import enums
+
+FETCH_SIZE = 2000
+MISSING = "—"
+
+# output columns, in response order
+MEASUREMENT_COLUMNS = ("time", "device", "participant", "mode", "lat", "lon", "display_name") + tuple(
+    enums.AQR_DIMENSION_MAP
+)
+AIR_QUALITY_RECORD_COLUMNS = (
+    "time", "device", "participant", "mode", "lat", "lon", "display_name",
+    "pm1", "pm25", "pm10", "temperature", "humidity", "voc", "nox",
+)
+
+_MEASUREMENT_SQL = """
+    SELECT m.id,
+           m.inserted_at >= statement_timestamp() - make_interval(secs => %s),
+           m.time_measured,
+           m.device_id,
+           COALESCE(m.participant_id, %s),
+           COALESCE(m.mode_id, %s),
+           ST_Y(l.coordinates),
+           ST_X(l.coordinates),
+           COALESCE(d.device_name, d.id),
+           {dimensions}
+    FROM devices_measurement AS m
+    INNER JOIN devices_device d ON d.id = m.device_id
+    LEFT JOIN api_location l ON l.id = m.location_id
+    LEFT JOIN devices_measurement_values v ON v.measurement_id = m.id
+    WHERE m.workshop_id = %s AND m.id > %s
+    GROUP BY m.id, d.id, l.id
+    ORDER BY m.id
+"""
+
+_AIR_QUALITY_RECORD_SQL = """
+    SELECT a.id,
+           a.inserted_at >= statement_timestamp() - make_interval(secs => %s),
+           a.time,
+           a.device_id,
+           COALESCE(a.participant_id, %s),
+           COALESCE(a.mode_id, %s),
+           a.lat,
+           a.lon,
+           a.pm1, a.pm25, a.pm10, a.temperature, a.humidity, a.voc, a.nox
+    FROM api_airqualityrecord AS a
+    WHERE a.workshop_id = %s AND a.id > %s
+    ORDER BY a.id
+"""
+
+
+def _fetch(sql: str, params: list):
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            yield from rows
+
+
+def encode_cursor(measurement_id: int, record_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{measurement_id}.{record_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """(measurement id, air quality record id) of a cursor; "" is the start. Raises ValueError."""
+    if not cursor:
+        return 0, 0
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        measurement_id, record_id = (int(part) for part in decoded.split("."))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if measurement_id < 0 or record_id < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return measurement_id, record_id
+
+
+@dataclass
+class RowPosition:
+    """
+    Last id read of each source. With ``lag`` (seconds) reading stops at the first row inserted
+    within the last ``lag`` seconds and ``held_back`` is set; without it all rows are read.
+    """
+    measurement: int = 0
+    record: int = 0
+    lag: int | None = None
+    held_back: bool = False
+
+    @classmethod
+    def for_cursor(cls, measurement: int = 0, record: int = 0) -> RowPosition:
+        """Position for responses that hand out a cursor (held back by ``WORKSHOP_DATA_CURSOR_LAG``)."""
+        return cls(measurement, record, lag=settings.WORKSHOP_DATA_CURSOR_LAG)
+
+    @property
+    def cursor(self) -> str:
+        return encode_cursor(self.measurement, self.record)
+
+
+def iter_measurement_rows(workshop_id: str, after_id: int = 0, lag: int | None = None):
+    """
+    ``(id, recent, row)`` in id order for measurements with an id above ``after_id``; ``recent`` is
+    true for rows inserted within the last ``lag`` seconds, ``row`` is a tuple in
+    ``MEASUREMENT_COLUMNS`` order, dimensions without a value are None.
+    """
+    dimensions = ",\n           ".join(
+        f"MAX(v.value) FILTER (WHERE v.dimension = {int(dimension)})" for dimension in enums.AQR_DIMENSION_MAP.values()
+    )
+    for pk, recent, *row in _fetch(
+        _MEASUREMENT_SQL.format(dimensions=dimensions), [lag, MISSING, MISSING, workshop_id, after_id]
+    ):
+        yield pk, recent, tuple(row)
+
+
+def _corrected_device_id(device_id: str) -> str | None:
+    """App uploads may carry the MAC with the last hex digit one too low: "...E4AAA" -> "...E5AAA"."""
+    base_id = device_id[:-3]
+    try:
+        last_char = format((int(base_id[-1], 16) + 1) % 16, "X")
+    except ValueError:
+        return None
+    return base_id[:-1] + last_char + "AAA"
+
+
+def uncorrected_device_id(device_id: str) -> str | None:
+    """Inverse of :func:`_corrected_device_id`: the app upload id whose rows show this device's name."""
+    if len(device_id) <= 3 or not device_id.endswith("AAA"):
+        return None
+    base_id = device_id[:-3]
+    try:
+        last_char = format((int(base_id[-1], 16) - 1) % 16, "X")
+    except ValueError:
+        return None
+    return base_id[:-1] + last_char + "AAA"
+
+
+def _device_names(device_ids: set[str]) -> dict[str, str | None]:
+    """Display name per AirQualityRecord device id (name, or name/id of the corrected id, or the id)."""
+    corrected = {
+        device_id: _corrected_device_id(device_id)
+        for device_id in device_ids
+        if len(device_id) > 3 and device_id.endswith("AAA")
+    }
+    names = dict(
+        Device.objects.filter(id__in=device_ids | {c for c in corrected.values() if c})
+        .values_list("id", "device_name")
+    )
+
+    resolved = {}
+    for device_id in device_ids:
+        if names.get(device_id):
+            resolved[device_id] = names[device_id]
+        elif device_id == "AAA":
+            resolved[device_id] = None
+        elif corrected.get(device_id) in names:
+            corrected_id = corrected[device_id]
+            resolved[device_id] = names[corrected_id] or corrected_id
+        else:
+            resolved[device_id] = device_id
+    return resolved
+
+
+def iter_air_quality_record_rows(workshop_id: str, after_id: int = 0, lag: int | None = None):
+    """``(id, recent, row)`` like :func:`iter_measurement_rows`, ``row`` in ``AIR_QUALITY_RECORD_COLUMNS`` order."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT device_id FROM api_airqualityrecord "
+            "WHERE workshop_id = %s AND id > %s AND device_id IS NOT NULL",
+            [workshop_id, after_id],
+        )
+        device_names = _device_names({row[0] for row in cursor.fetchall()})
+
+    for pk, recent, time, device_id, participant, mode, lat, lon, *values in _fetch(
+        _AIR_QUALITY_RECORD_SQL, [lag, MISSING, MISSING, workshop_id, after_id]
+    ):
+        device_name = device_names.get(device_id)
+        yield pk, recent, (time, device_name, participant, mode, lat, lon, device_name, *values)
+
+
+def iter_rows(workshop_id: str, position: RowPosition):
+    """
+    ``(columns, row)`` for measurements, then air quality records after ``position``, which is
+    advanced while iterating (see :class:`RowPosition` for the rows held back).
+    """
+    for pk, recent, row in iter_measurement_rows(workshop_id, position.measurement, position.lag):
+        if recent:
+            position.held_back = True
+            break
+        position.measurement = pk
+        yield MEASUREMENT_COLUMNS, row
+    for pk, recent, row in iter_air_quality_record_rows(workshop_id, position.record, position.lag):
+        if recent:
+            position.held_back = True
+            break
+        position.record = pk
+        yield AIR_QUALITY_RECORD_COLUMNS, row
+
+
+def collect_rows(workshop_id: str, builder, position: RowPosition) -> RowPosition:
+    """Feed all rows after ``position`` into ``builder.add(columns, row)``; returns the advanced position."""
+    for columns, row in iter_rows(workshop_id, position):
+        builder.add(columns, row)
+    return position
+
+
+def stream_json(workshop_id: str, position: RowPosition | None = None, *, with_cursor: bool = False):
+    """
+    The default JSON response as byte chunks of ``FETCH_SIZE`` rows: ``[...]``, or
+    ``{"data": [...], "cursor": "..."}`` with ``with_cursor`` (pass a :meth:`RowPosition.for_cursor`).
+    Only one chunk of rows is held in memory at a time; the output equals ``JsonResponse(rows)``.
+    """
+    position = position or RowPosition()
+    yield b'{"data": [' if with_cursor else b"["
+    builder = RowListBuilder()
+    separator = b""
+    for columns, row in iter_rows(workshop_id, position):
+        builder.add(columns, row)
+        if len(builder.rows) >= FETCH_SIZE:
+            yield separator + ", ".join(json.dumps(data) for data in builder.rows).encode()
+            separator = b", "
+            builder.rows = []
+    if builder.rows:
+        yield separator + ", ".join(json.dumps(data) for data in builder.rows).encode()
+    if with_cursor:
+        yield b'], "cursor": ' + json.dumps(position.cursor).encode() + b"}"
+    else:
+        yield b"]"
+
+
+def cache_stream(chunks, cache_key: str, timeout: int, max_bytes: int, lock=None):
+    """
+    Pass ``chunks`` through and store their concatenation under ``cache_key`` once complete, unless
+    it grows beyond ``max_bytes`` (the copy is dropped then, so memory stays bounded). The rebuild
+    ``lock`` (workshops.cache) is released right after the cache write, or as uncacheable as soon
+    as the limit is exceeded, not only when the client has finished downloading.
+    """
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        if buffered is not None:
+            size += len(chunk)
+            if size <= max_bytes:
+                buffered.append(chunk)
+            else:
+                buffered = None
+                if lock is not None:
+                    lock.release_uncacheable(timeout)
+        yield chunk
+    if buffered is not None:
+        cache.set(cache_key, b"".join(buffered), timeout)
+        if lock is not None:
+            lock.release()
+
+
+class RowListBuilder:
+    """Default response: one dict per row with an ISO time."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, columns: tuple, row: tuple) -> None:
+        data = dict(zip(columns, row))
+        data["time"] = data["time"].isoformat()
+        self.rows.append(data)
+
+
+# value columns of the compact formats; AirQualityRecord rows have no pressure/co2/o3 (None)
+COLUMNS = MEASUREMENT_COLUMNS
+DICTIONARY_COLUMNS = ("device", "participant", "mode", "display_name")
+BINARY_MAGIC = b"LDWD"
+BINARY_VERSION = 1
+_BINARY_ALIGN = 8
+
+
+class ColumnarBuilder:
+    """
+    Collects rows of both sources as column arrays for ``format=columnar`` / ``format=binary``:
+    times as epoch seconds, device/participant/mode/display_name as indexes into per-column
+    dictionaries (in order of first appearance), all other columns as plain value arrays.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.columns = {name: [] for name in COLUMNS}
+        self._dictionaries = {name: {} for name in DICTIONARY_COLUMNS}
+
+    def add(self, columns: tuple, row: tuple) -> None:
+        values = dict(zip(columns, row))
+        for name, column in self.columns.items():
+            value = values.get(name)
+            if name == "time":
+                value = int(value.timestamp())
+            elif name in self._dictionaries:
+                value = self._dictionaries[name].setdefault(value, len(self._dictionaries[name]))
+            column.append(value)
+        self.count += 1
+
+    @property
+    def dictionaries(self) -> dict[str, list]:
+        return {name: list(entries) for name, entries in self._dictionaries.items()}
+
+    def to_json(self) -> dict:
+        return {
+            "format": "columnar",
+            "count": self.count,
+            "dictionaries": self.dictionaries,
+            "columns": self.columns,
+        }
+
+    def _binary_type(self, name: str) -> str:
+        if name == "time":
+            return "uint32"
+        if name in self._dictionaries:
+            return "uint16" if len(self._dictionaries[name]) <= 0xFFFF else "uint32"
+        if name in ("lat", "lon"):
+            return "float64"
+        return "float32"
+
+    def to_binary(self, **header_fields) -> bytes:
+        """
+        ``LDWD`` magic, uint8 version, 3 padding bytes, uint32 header length, the JSON header and the
+        columns as little-endian typed arrays. The header is padded so the data block and every column
+        start at a multiple of 8 bytes and the client can view them without copying
+        (``new Float32Array(buffer, 12 + headerLength + offset, count)``). Missing values are NaN.
+        The header lists ``count``, ``dictionaries`` and ``columns`` with name, type and byte offset
+        within the data block, plus ``header_fields`` (e.g. the cursor).
+        """
+        dtypes = {"uint16": "<u2", "uint32": "<u4", "float32": "<f4", "float64": "<f8"}
+        arrays = []
+        layout = []
+        offset = 0
+        for name, column in self.columns.items():
+            binary_type = self._binary_type(name)
+            array = np.array(column, dtype=float if binary_type.startswith("float") else None).astype(dtypes[binary_type])
+            layout.append({"name": name, "type": binary_type, "offset": offset})
+            arrays.append(array.tobytes())
+            offset += -(-array.nbytes // _BINARY_ALIGN) * _BINARY_ALIGN
+
+        header = json.dumps({
+            **header_fields,
+            "count": self.count,
+            "dictionaries": self.dictionaries,
+            "columns": layout,
+        }).encode()
+        prefix_size = len(BINARY_MAGIC) + 4 + 4
+        header += b" " * (-(prefix_size + len(header)) % _BINARY_ALIGN)
+
+        out = bytearray(BINARY_MAGIC)
+        out += struct.pack("<B3xI", BINARY_VERSION, len(header))
+        out += header
+        for data in arrays:
+            out += data
+            out += b"\0" * (-len(data) % _BINARY_ALIGN)
+        return bytes(out)
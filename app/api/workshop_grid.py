@@ -0,0 +1,104 @@
+"""
+Spatial grid of a workshop's readings for GET workshops/<pk>/grid/.
+
+Located Measurement values and AirQualityRecord columns of one dimension are snapped to a square
+grid in Web Mercator (EPSG:3857, the projection of the web map) with ``ST_SnapToGrid`` and
+aggregated per cell in one statement, so a map draws a few hundred cells instead of every point.
+"""
+from __future__ import annotations
+
+import math
+
+from django.db import connection
+
+from main import enums
+
+# dimensions stored as AirQualityRecord columns (the others exist for Measurement only)
+AIR_QUALITY_RECORD_DIMENSIONS = ("pm1", "pm25", "pm10", "temperature", "humidity", "voc", "nox")
+
+DEFAULT_DIMENSION = "pm25"
+# a cell is CELL_PIXELS wide on screen at the requested zoom level
+CELL_PIXELS = 16
+MAX_ZOOM = 22
+MIN_CELL_SIZE = 5.0
+MAX_CELL_SIZE = 50000.0
+# Web Mercator meters per pixel of a 256 px tile at zoom 0 (at the equator)
+METERS_PER_PIXEL_ZOOM_0 = 2 * math.pi * 6378137 / 256
+# Web Mercator is only defined up to ~85.05 degrees
+_MAX_LATITUDE = 85.0
+
+_MEASUREMENT_POINTS_SQL = """
+    SELECT l.coordinates AS geom, v.value
+    FROM devices_measurement AS m
+    INNER JOIN api_location l ON l.id = m.location_id
+    INNER JOIN devices_measurement_values v ON v.measurement_id = m.id AND v.dimension = %s
+    WHERE m.workshop_id = %s AND ST_Y(l.coordinates) BETWEEN %s AND %s
+"""
+
+_AIR_QUALITY_RECORD_POINTS_SQL = """
+    SELECT ST_SetSRID(ST_MakePoint(a.lon, a.lat), 4326) AS geom, a.{column} AS value
+    FROM api_airqualityrecord AS a
+    WHERE a.workshop_id = %s AND a.{column} IS NOT NULL AND a.lon IS NOT NULL AND a.lat BETWEEN %s AND %s
+"""
+
+_GRID_SQL = """
+    WITH points AS ({points}),
+    cells AS (
+        SELECT ST_X(cell) AS x, ST_Y(cell) AS y, AVG(value) AS mean, MAX(value) AS maximum, COUNT(*) AS count
+        FROM (SELECT ST_SnapToGrid(ST_Transform(geom, 3857), %s) AS cell, value FROM points) snapped
+        GROUP BY 1, 2
+    )
+    SELECT ST_Y(center), ST_X(center), mean, maximum, count
+    FROM (SELECT ST_Transform(ST_SetSRID(ST_MakePoint(x, y), 3857), 4326) AS center, * FROM cells) c
+    ORDER BY y, x
+"""
+
+
+def cell_size_for_zoom(zoom: int) -> float:
+    """Cell edge in Web Mercator meters that is ``CELL_PIXELS`` wide at web map ``zoom``."""
+    return CELL_PIXELS * METERS_PER_PIXEL_ZOOM_0 / 2 ** zoom
+
+
+def parse_grid_params(dimension: str | None, cell: str | None, zoom: str | None) -> tuple[str, float]:
+    """(dimension, cell size in meters) from query parameters; ``cell`` wins over ``zoom``. Raises ValueError."""
+    dimension = dimension or DEFAULT_DIMENSION
+    if dimension not in enums.AQR_DIMENSION_MAP:
+        raise ValueError(f"Unknown dimension: {dimension}")
+    if cell:
+        try:
+            cell_size = float(cell)
+        except ValueError:
+            raise ValueError(f"Invalid cell size: {cell}")
+    elif zoom:
+        try:
+            zoom_level = int(zoom)
+        except ValueError:
+            raise ValueError(f"Invalid zoom: {zoom}")
+        if not 0 <= zoom_level <= MAX_ZOOM:
+            raise ValueError(f"Zoom must be between 0 and {MAX_ZOOM}")
+        cell_size = cell_size_for_zoom(zoom_level)
+    else:
+        raise ValueError("Either cell or zoom is required")
+    if not math.isfinite(cell_size):
+        raise ValueError(f"Invalid cell size: {cell}")
+    # whole meters: bounded number of distinct grids (and cache keys) per workshop
+    return dimension, float(round(min(max(cell_size, MIN_CELL_SIZE), MAX_CELL_SIZE)))
+
+
+def workshop_grid(workshop_id: str, dimension: str, cell_size: float) -> list[dict]:
+    """
+    One dict per non-empty cell: center ``lat``/``lon`` and ``mean``/``max``/``count`` of
+    ``dimension`` over both sources, ordered south to north, west to east.
+    """
+    sources = [_MEASUREMENT_POINTS_SQL]
+    params = [enums.AQR_DIMENSION_MAP[dimension], workshop_id, -_MAX_LATITUDE, _MAX_LATITUDE]
+    if dimension in AIR_QUALITY_RECORD_DIMENSIONS:
+        sources.append(_AIR_QUALITY_RECORD_POINTS_SQL.format(column=dimension))
+        params += [workshop_id, -_MAX_LATITUDE, _MAX_LATITUDE]
+
+    with connection.cursor() as cursor:
+        cursor.execute(_GRID_SQL.format(points=" UNION ALL ".join(sources)), params + [cell_size])
+        return [
+            {"lat": lat, "lon": lon, "mean": mean, "max": maximum, "count": count}
+            for lat, lon, mean, maximum, count in cursor.fetchall()
+        ]
@@ -0,0 +1,124 @@
+"""
+Simplified participant tracks for GET workshops/<pk>/data/?simplify=<zoom>.
+
+Rows are grouped into tracks (device and participant), ordered by time, and each track is reduced
+with Douglas-Peucker at a tolerance of ``TOLERANCE_PIXELS`` screen pixels at the requested zoom.
+Between two points that survive, the readings with the highest and the lowest value of the
+selected dimension are kept as well, so peaks along a straight stretch are not smoothed away.
+Rows without coordinates cannot be drawn as a track and are left out.
+"""
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from .workshop_data import RowPosition, iter_rows
+from .workshop_grid import METERS_PER_PIXEL_ZOOM_0, MAX_ZOOM
+
+TOLERANCE_PIXELS = 2.0
+_METERS_PER_DEGREE = 111320.0
+
+
+def parse_simplify_zoom(zoom: str) -> int:
+    """Zoom level of ``?simplify=``. Raises ValueError."""
+    try:
+        zoom_level = int(zoom)
+    except ValueError:
+        raise ValueError(f"Invalid zoom: {zoom}")
+    if not 0 <= zoom_level <= MAX_ZOOM:
+        raise ValueError(f"Zoom must be between 0 and {MAX_ZOOM}")
+    return zoom_level
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """Boolean mask of the points of the polyline (x, y) kept at ``tolerance`` (same unit as x/y)."""
+    keep = np.zeros(len(x), dtype=bool)
+    if not len(x):
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, len(x) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = math.hypot(dx, dy)
+        if length:
+            distances = np.abs(px * dy - py * dx) / length
+        else:
+            distances = np.hypot(px, py)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def _first_per_segment(segments: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Index of the first position of each segment in ``order`` (positions sorted by segment)."""
+    ordered_segments = segments[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ordered_segments[1:] != ordered_segments[:-1]
+    return order[first]
+
+
+def keep_extremes(values: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """
+    ``keep`` plus, for every stretch from one kept point up to the next, the positions of the
+    largest and smallest ``values`` in it (NaN values are never selected).
+    """
+    if not keep.any() or np.isnan(values).all():
+        return keep
+    segments = np.cumsum(keep) - 1
+    missing = np.isnan(values)
+    maxima = _first_per_segment(segments, np.lexsort((np.where(missing, np.inf, -values), segments)))
+    minima = _first_per_segment(segments, np.lexsort((np.where(missing, np.inf, values), segments)))
+    keep = keep.copy()
+    for positions in (maxima, minima):
+        keep[positions[~missing[positions]]] = True
+    return keep
+
+
+def simplify_track(lat: np.ndarray, lon: np.ndarray, values: np.ndarray, zoom: int) -> np.ndarray:
+    """Mask of the points of one time-ordered track kept at ``zoom``."""
+    if len(lat) <= 2:
+        return np.ones(len(lat), dtype=bool)
+    # local equirectangular projection in meters; fine at the extent of one workshop
+    cos_lat = math.cos(math.radians(float(np.mean(lat))))
+    x = lon * _METERS_PER_DEGREE * cos_lat
+    y = lat * _METERS_PER_DEGREE
+    tolerance = TOLERANCE_PIXELS * METERS_PER_PIXEL_ZOOM_0 * cos_lat / 2 ** zoom
+    return keep_extremes(values, douglas_peucker(x, y, tolerance))
+
+
+def iter_simplified_rows(workshop_id: str, zoom: int, dimension: str, position: RowPosition):
+    """
+    ``(columns, row)`` like :func:`api.workshop_data.iter_rows` (from the start, ``position`` is
+    advanced to the last id of each source), reduced to the simplified tracks, in id order.
+    """
+    rows = []
+    tracks = defaultdict(list)
+    for columns, row in iter_rows(workshop_id, position):
+        data = dict(zip(columns, row))
+        if data["lat"] is None or data["lon"] is None:
+            continue
+        value = data.get(dimension)
+        tracks[data["device"], data["participant"]].append(
+            (data["time"], len(rows), data["lat"], data["lon"], math.nan if value is None else value)
+        )
+        rows.append((columns, row))
+
+    keep = np.zeros(len(rows), dtype=bool)
+    for points in tracks.values():
+        points.sort()
+        indexes = np.array([point[1] for point in points])
+        lat, lon, values = np.array([point[2:] for point in points], dtype=float).T
+        keep[indexes[simplify_track(lat, lon, values, zoom)]] = True
+
+    for index in np.flatnonzero(keep):
+        yield rows[index]
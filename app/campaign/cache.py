@@ -0,0 +1,30 @@
+"""
+Cache of the room current values shown on the campaign detail page.
+
+One entry per campaign holds ``{room pk: current values}`` (main.util.campaign_room_current_values).
+Ingest into a room and deleting a measurement drop the entry of its campaign on commit
+(:func:`invalidate_room_current_values`); the timeout bounds staleness after other changes (moved
+measurements, room edits).
+"""
+from __future__ import annotations
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Room
+
+CURRENT_VALUES_TIMEOUT = 300
+
+
+def current_values_key(campaign_id) -> str:
+    return f"campaign_room_current_values_{campaign_id}"
+
+
+def invalidate_room_current_values(*room_ids) -> None:
+    """Drop the cached current values of the campaigns of ``room_ids`` (on commit inside a transaction)."""
+    room_ids = {r for r in room_ids if r}
+    if not room_ids:
+        return
+    campaign_ids = set(Room.objects.filter(pk__in=room_ids).values_list('campaign_id', flat=True))
+    keys = [current_values_key(campaign_id) for campaign_id in campaign_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
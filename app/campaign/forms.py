@@ -7,6 +7,7 @@ from organizations.models import Organization
 
 from .models import Campaign, Room
 from devices.models import Device
+from devices.identity import invalidate_device_identity
 from accounts.models import CustomUser
 
 from crispy_forms.helper import FormHelper
@@ -151,6 +152,11 @@ class RoomDeviceForm(forms.ModelForm):
 
         # Update the ForeignKey for the devices
         if commit:
+            invalidate_device_identity(
+                *Device.objects.filter(current_room=room).values_list("pk", flat=True),
+                *selected_devices.values_list("pk", flat=True),
+            )
+
             # Unassign the devices previously linked to the room
             Device.objects.filter(current_room=room).update(current_room=None)
 
@@ -207,6 +213,11 @@ class UserDeviceForm(forms.ModelForm):
 
         # Update the ForeignKey for the devices
         if commit:
+            invalidate_device_identity(
+                *Device.objects.filter(current_user=user, current_campaign=self.campaign).values_list("pk", flat=True),
+                *selected_devices.values_list("pk", flat=True),
+            )
+
             # Unassign the devices previously linked to the room
             Device.objects.filter(current_user=user, current_campaign=self.campaign).update(current_user=None)
 
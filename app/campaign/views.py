@@ -1,7 +1,4 @@
-import statistics
-import numpy as np
-
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta
 from django.core.exceptions import PermissionDenied
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
@@ -10,17 +7,24 @@ from django.views.generic import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.db.models import Max, Q
 from django.contrib import messages
+from django.core.cache import cache
 
 
+from .cache import CURRENT_VALUES_TIMEOUT, current_values_key
 from .models import Campaign, Room
-from devices.models import Values
+from devices.latest_values import latest_means
+from devices.rollups import chart_series
 from .forms import CampaignForm, CampaignUserForm, RoomDeviceForm, UserDeviceForm
 from accounts.models import CustomUser
 from main.enums import Dimension, SensorModel
-from functools import reduce
-from main.util import room_calculate_current_values
+from main.util import campaign_room_current_values, room_calculate_current_values
+
+
+# the 24 h charts (minute buckets) are recomputed at most once per minute per room / participant
+CHART_RANGE = timedelta(days=1)
+CHART_BUCKET = timedelta(minutes=1)
+CHART_CACHE_TIMEOUT = 60
 
 
 class CampaignsHomeView(ListView):
@@ -73,16 +77,16 @@ class CampaignsDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         campaign = self.object
 
-        room_current_values = {}
-        for room in campaign.rooms.all():
-            room_current_values[room.pk] = room_calculate_current_values(room)
-
-            print(room_current_values[room.pk])
-            # for better dispaying set alle values that are None to '- '
-            for i in range(0, len(room_current_values[room.pk]), 2):
-                if room_current_values[room.pk][i] is None:
-                    room_current_values[room.pk][i] = '- '
-            print(room_current_values[room.pk])
+        room_current_values = cache.get_or_set(
+            current_values_key(campaign.pk),
+            lambda: campaign_room_current_values(campaign),
+            CURRENT_VALUES_TIMEOUT,
+        )
+        # for better dispaying set alle values that are None to '- '
+        room_current_values = {
+            room_pk: ['- ' if i % 2 == 0 and value is None else value for i, value in enumerate(values)]
+            for room_pk, values in room_current_values.items()
+        }
 
         context['room_current_values'] = room_current_values
 
@@ -257,31 +261,12 @@ class RoomDetailView(LoginRequiredMixin, DetailView):
 
         # dimensions to be displayed
         target_dimensions = (Dimension.TEMPERATURE, Dimension.PM2_5, Dimension.CO2, Dimension.TVOC)
-        time_range = timedelta(days=1)
-        start_time = datetime.now(timezone.utc) - time_range
-
-        all_values = Values.objects.filter(
-            measurement__time_measured__gt = start_time,
-            measurement__room = room,
-        ).filter(
-            # Get only the values with target dimension
-            reduce(lambda a, b: a | b, [Q(dimension = dim) for dim in target_dimensions], Q())
-        ).values(
-            'dimension',
-            'value',
-            'measurement__time_measured'
-        )
 
-        sum_24h = np.zeros((len(target_dimensions), int(time_range.total_seconds() // 60)))
-        cnt_24h = np.zeros_like(sum_24h)
-        dim_id = {dim: i for i, dim in enumerate(target_dimensions)}
+        def compute_chart():
+            # readings taken in this room only (a device may have reported from another room)
+            return chart_series(None, target_dimensions, CHART_RANGE, CHART_BUCKET, room_id=room.pk)
 
-        for val in all_values:
-            sum_24h[dim_id[val['dimension']]][int((val['measurement__time_measured'] - start_time).total_seconds() // 60)] += val['value']
-            cnt_24h[dim_id[val['dimension']]][int((val['measurement__time_measured'] - start_time).total_seconds() // 60)] += 1
-        
-        data_24h = sum_24h / cnt_24h
-        labels = [(start_time + timedelta(minutes=i)).strftime("%H:%M") for i in range(int(time_range.total_seconds() // 60))]
+        chart = cache.get_or_set(f'room_chart_{room.pk}', compute_chart, CHART_CACHE_TIMEOUT)
 
         # Werte ins Context-Objekt packen
         context['current_temperature'] = f'{current_temperature:.2f}' if current_temperature else None
@@ -292,8 +277,8 @@ class RoomDetailView(LoginRequiredMixin, DetailView):
         context['co2_color'] = co2_color  
         context['current_tvoc'] = f'{current_tvoc:.2f}' if current_tvoc else None
         context['tvoc_color'] = tvoc_color
-        context['data_24h'] = np.nan_to_num(data_24h, nan=0).tolist()
-        context['labels'] = labels
+        context['data_24h'] = chart.data
+        context['labels'] = chart.labels
 
 
         return context
@@ -321,75 +306,38 @@ class ParticipantDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         user = self.object
 
-        max_time_measured_per_device = user.measurements.values('device').annotate(max_time_measured=Max('time_measured'))
-
-        measurements = []
-        for entry in max_time_measured_per_device:
-            measurements.extend(user.measurements.filter(device = entry['device'], time_measured = entry['max_time_measured']).all())
-
-        def get_current_mean(dimension):
-            """
-            Gibt den Durchschnittswert über alle neuesten Measurements für eine gegebene Dimension zurück.
-            Wenn keine Werte vorliegen, wird None zurückgegeben.
-            """
-            # Für jedes Measurement sammeln wir alle Values der gesuchten Dimension
-            # und bilden einen Mittelwert für dieses Measurement.
-            # Anschließend bilden wir aus diesen Mittelwerten den Gesamtmittelwert.
-            measurement_means = []
-            for m in measurements:
-                dim_values = [val.value for val in m.values.all() if val.dimension == dimension]
-                if dim_values:  # Nur wenn tatsächlich Werte vorhanden sind
-                    measurement_means.append(statistics.mean(dim_values))
-
-            # Falls keine Werte gefunden, None zurückgeben
-            if measurement_means:
-                return statistics.mean(measurement_means)
-            return None
+        # latest value of each of the user's sensors (devices.latest_values, one query)
+        means = latest_means((Dimension.TEMPERATURE, Dimension.UVI), user=user)
 
         # Temperatur
-        current_temperature = get_current_mean(Dimension.TEMPERATURE)
+        current_temperature = means[Dimension.TEMPERATURE]
         temperature_color = Dimension.get_color(Dimension.TEMPERATURE, current_temperature) if current_temperature is not None else None
 
         # VOC Index
-        current_uvi = get_current_mean(Dimension.UVI)
+        current_uvi = means[Dimension.UVI]
         uvi_color = Dimension.get_color(Dimension.UVI, current_uvi) if current_uvi is not None else None
 
         # dimensions to be displayed
         target_dimensions = (Dimension.TEMPERATURE, Dimension.UVI)
-        time_range = timedelta(days=1)
-        start_time = datetime.now(timezone.utc) - time_range
-
-        all_values = Values.objects.filter(
-            measurement__time_measured__gt = start_time,
-            measurement__user = user,
-            measurement__device__current_campaign = self.campaign
-        ).filter(
-            # Get only the values with target dimension
-            reduce(lambda a, b: a | b, [Q(dimension = dim) for dim in target_dimensions], Q())
-        ).values(
-            'dimension',
-            'value',
-            'measurement__time_measured'
-        )
 
-        sum_24h = np.zeros((len(target_dimensions), int(time_range.total_seconds() // 60)))
-        cnt_24h = np.zeros_like(sum_24h)
-        dim_id = {dim: i for i, dim in enumerate(target_dimensions)}
+        def compute_chart():
+            # readings of this user only (a device may be shared with other users)
+            return chart_series(
+                None, target_dimensions, CHART_RANGE, CHART_BUCKET,
+                user_id=user.pk, current_campaign_id=self.campaign.pk,
+            )
 
-        for val in all_values:
-            sum_24h[dim_id[val['dimension']]][int((val['measurement__time_measured'] - start_time).total_seconds() // 60)] += val['value']
-            cnt_24h[dim_id[val['dimension']]][int((val['measurement__time_measured'] - start_time).total_seconds() // 60)] += 1
-        
-        data_24h = sum_24h / cnt_24h
-        labels = [(start_time + timedelta(minutes=i)).strftime("%H:%M") for i in range(int(time_range.total_seconds() // 60))]
+        chart = cache.get_or_set(
+            f'participant_chart_{self.campaign.pk}_{user.pk}', compute_chart, CHART_CACHE_TIMEOUT
+        )
 
         # Werte ins Context-Objekt packen
         context['current_temperature'] = f'{current_temperature:.2f}' if current_temperature is not None else None
         context['temperature_color'] = temperature_color
         context['current_uvi'] = f'{current_uvi:.2f}' if current_uvi is not None else None
         context['uvi_color'] = uvi_color 
-        context['data_24h'] = np.nan_to_num(data_24h, nan=0).tolist()
-        context['labels'] = labels
+        context['data_24h'] = chart.data
+        context['labels'] = chart.labels
 
         context['campaign'] = self.campaign
         context['device_list'] = user.current_devices.filter(current_campaign=self.campaign)
@@ -0,0 +1,56 @@
+"""
+Collapse duplicate Measurement rows (same device, time_measured, sensor_model) in small chunks.
+
+Used by migration 0032 (before the unique constraint is added) and by the
+``collapse_duplicate_measurements`` command, which can be run ahead of the deploy so the
+migration itself finds nothing left to do. Plain SQL on the physical tables so the migration
+does not depend on the current model classes.
+"""
+from __future__ import annotations
+
+from django.db import connection, transaction
+
+DUPLICATES_TABLE = "measurement_duplicates_tmp"
+
+
+def collapse_duplicate_measurements(chunk_size: int = 1000, log=None) -> tuple[int, int]:
+    """
+    Keep the oldest row (lowest id) per (device, time_measured, sensor_model) and delete the rest
+    together with their Values. Duplicate ids are collected once into a temporary table; each
+    chunk is then deleted in its own short transaction so Values is never locked for long.
+
+    Returns (measurements_deleted, values_deleted).
+    """
+    measurements_deleted = values_deleted = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {DUPLICATES_TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE {DUPLICATES_TABLE} AS
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY device_id, time_measured, sensor_model ORDER BY id
+                ) AS rn
+                FROM devices_measurement
+            ) ranked
+            WHERE rn > 1
+            """
+        )
+        cursor.execute(f"CREATE INDEX ON {DUPLICATES_TABLE} (id)")
+        try:
+            while True:
+                with transaction.atomic():
+                    cursor.execute(f"SELECT id FROM {DUPLICATES_TABLE} ORDER BY id LIMIT %s", [chunk_size])
+                    ids = [row[0] for row in cursor.fetchall()]
+                    if not ids:
+                        break
+                    cursor.execute("DELETE FROM devices_values WHERE measurement_id = ANY(%s)", [ids])
+                    values_deleted += cursor.rowcount
+                    cursor.execute("DELETE FROM devices_measurement WHERE id = ANY(%s)", [ids])
+                    measurements_deleted += cursor.rowcount
+                    cursor.execute(f"DELETE FROM {DUPLICATES_TABLE} WHERE id = ANY(%s)", [ids])
+                if log:
+                    log(f"Deleted {measurements_deleted} duplicate measurements ({values_deleted} values)")
+        finally:
+            cursor.execute(f"DROP TABLE IF EXISTS {DUPLICATES_TABLE}")
+    return measurements_deleted, values_deleted
@@ -0,0 +1,63 @@
+"""
+Device identity cache for the ingest endpoints.
+
+Status and data POSTs only need a handful of Device columns (api_key, model, firmware,
+current room/user/campaign and the status flags) to authenticate and attribute a reading.
+The Device row is cached per id so the common case does no device query at all; it is
+invalidated on ``Device.save``/``delete`` (again after commit) and wherever devices are reassigned with a
+queryset ``update()``. ``DEVICE_IDENTITY_CACHE_TTL`` bounds staleness for anything else
+(e.g. SET_NULL when a room is deleted).
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+
+from .models import Device
+
+
+def invalidate_device_identity(*device_ids: str) -> None:
+    """For writes that bypass Device.save (queryset ``update()``)."""
+    Device.invalidate_identity_cache(*device_ids)
+
+
+def get_device_identity(device_id: str) -> Device | None:
+    """Device ``device_id`` from the cache, falling back to (and filling from) the database."""
+    key = Device.identity_cache_key(device_id)
+    device = cache.get(key)
+    if device is None:
+        device = Device.objects.filter(pk=device_id).first()
+        if device is not None:
+            cache.set(key, device, settings.DEVICE_IDENTITY_CACHE_TTL)
+    return device
+
+
+def authenticate_device(device_info: dict) -> Device:
+    """
+    Return the Device for ``device_info`` ({"device", "firmware", "model", "apikey"}) after checking
+    its api key. A wrong key raises ValidationError before anything is written. Unknown devices are
+    registered with the key they present (as before); firmware/model are written only when changed.
+    """
+    device = get_device_identity(device_info["device"])
+
+    if device is None:
+        device, _ = Device.objects.get_or_create(
+            id=device_info["device"],
+            defaults={
+                "model": device_info["model"],
+                "firmware": device_info["firmware"],
+                "api_key": device_info.get("apikey"),
+            },
+        )
+
+    if device.api_key != device_info.get("apikey"):
+        raise ValidationError("Wrong API Key")
+
+    if device.firmware != device_info["firmware"] or device.model != device_info["model"]:
+        device.firmware = device_info["firmware"]
+        device.model = device_info["model"]
+        # full save: a first model assignment also sets auto_number and device_name
+        device.save()
+
+    return device
@@ -0,0 +1,290 @@
+"""Bulk, insert-or-ignore write path for device readings (Measurement + Values)."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db import connection
+from django.utils import timezone
+
+from api.models import Location, MobilityMode
+from campaign.cache import invalidate_room_current_values
+from workshops.cache import invalidate_workshop_data
+from workshops.models import Participant, Workshop
+from workshops.spot_stats import add_measurements as add_measurements_to_spots
+
+from .latest_values import add_measurements as add_measurements_to_latest_values
+from .locations import dedupe_enabled, location_ids
+from .packed_values import packed_enabled
+from .models import Device, Measurement, Values
+from .rollups import add_measurements as add_measurements_to_rollups
+
+
+@dataclass
+class Reading:
+    """
+    One timestamped device reading.
+
+    ``sensors`` is the payload shape of POST /v1/devices/data/:
+    ``{sensor_id: {"type": <SensorModel>, "data": {<Dimension>: value}}}``.
+    """
+
+    time_measured: datetime
+    sensors: dict
+    workshop_id: str | None = None
+    participant_id: str | None = None
+    mode_id: str | None = None
+    location_id: int | None = None
+    # overrides the time_received passed to write_readings (readings flushed from the ingest buffer)
+    time_received: datetime | None = None
+
+
+@dataclass
+class PendingReading:
+    """
+    A validated reading whose workshop context and location are not resolved to rows yet
+    (see :func:`store_readings`). ``workshop`` is ``{"id", "participant", "mode"}``.
+    """
+
+    time_measured: datetime
+    sensors: dict
+    workshop: dict | None = None
+    lat: float | None = None
+    lon: float | None = None
+    time_received: datetime | None = None
+
+    def to_payload(self) -> dict:
+        """JSON-serialisable form (ingest buffer)."""
+        return {
+            "time": self.time_measured.isoformat(),
+            "sensors": self.sensors,
+            "workshop": self.workshop,
+            "lat": self.lat,
+            "lon": self.lon,
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict, *, time_received: datetime | None = None) -> PendingReading:
+        return cls(
+            time_measured=datetime.fromisoformat(payload["time"]),
+            sensors=payload["sensors"],
+            workshop=payload.get("workshop"),
+            lat=payload.get("lat"),
+            lon=payload.get("lon"),
+            time_received=time_received,
+        )
+
+
+@dataclass
+class WriteResult:
+    """Outcome of :func:`write_readings`."""
+
+    created: list[Measurement] = field(default_factory=list)
+    # (time_measured, sensor_model) pairs that were already stored (or repeated in the input)
+    skipped: list[tuple[datetime, int]] = field(default_factory=list)
+    # readings of which not a single sensor was inserted
+    skipped_readings: list[Reading] = field(default_factory=list)
+
+
+_INSERT_COLUMNS = (
+    "time_received",
+    "time_measured",
+    "sensor_model",
+    "device_id",
+    "room_id",
+    "user_id",
+    "workshop_id",
+    "location_id",
+    "mode_id",
+    "participant_id",
+    "packed_dimensions",
+    "packed_values",
+)
+
+
+# keeps one statement well below PostgreSQL's 65535 bind parameter limit
+_INSERT_BATCH_SIZE = 5000
+
+
+def _insert_measurements(measurements: list[Measurement]) -> dict[tuple[datetime, int], int]:
+    """
+    INSERT ... ON CONFLICT DO NOTHING on (device, time_measured, sensor_model).
+    Returns {(time_measured, sensor_model): id} for the rows that were actually inserted.
+    """
+    row = "(" + ", ".join(["%s"] * len(_INSERT_COLUMNS)) + ")"
+    inserted = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(measurements), _INSERT_BATCH_SIZE):
+            batch = measurements[start:start + _INSERT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {Measurement._meta.db_table} ({', '.join(_INSERT_COLUMNS)}) "
+                f"VALUES {', '.join([row] * len(batch))} "
+                "ON CONFLICT (device_id, time_measured, sensor_model) DO NOTHING "
+                "RETURNING id, time_measured, sensor_model",
+                [getattr(m, column) for m in batch for column in _INSERT_COLUMNS],
+            )
+            for pk, time_measured, sensor_model in cursor.fetchall():
+                inserted[(time_measured, sensor_model)] = pk
+    return inserted
+
+
+def write_readings(device: Device, readings: list[Reading], *, time_received: datetime) -> WriteResult:
+    """
+    Insert all sensors of ``readings`` with one insert-or-ignore statement for Measurement and one
+    bulk insert for Values (none with packed value storage), then move ``device.last_update`` to the newest inserted time_measured.
+
+    Rows that collide with the (device, time_measured, sensor_model) unique constraint are skipped
+    by the database instead of being probed for beforehand, so concurrent retries cannot insert
+    duplicates. All rows are built (and values converted) before the first insert, so malformed
+    sensor data raises before anything is written. Callers are expected to wrap this in a transaction.
+    """
+    result = WriteResult()
+    packed = packed_enabled()
+    rows = []  # (reading, measurement, values)
+    for reading in readings:
+        # naive times are stored in the current time zone; make that explicit so the
+        # (time_measured, sensor_model) keys compare equal to what RETURNING hands back
+        if timezone.is_naive(reading.time_measured):
+            reading.time_measured = timezone.make_aware(reading.time_measured)
+        for sensor_data in reading.sensors.values():
+            measurement = Measurement(
+                sensor_model=int(sensor_data["type"]),
+                device=device,
+                time_measured=reading.time_measured,
+                time_received=reading.time_received or time_received,
+                room_id=device.current_room_id,
+                user_id=device.current_user_id,
+                workshop_id=reading.workshop_id,
+                participant_id=reading.participant_id,
+                mode_id=reading.mode_id,
+                location_id=reading.location_id,
+            )
+            values = [
+                Values(dimension=int(dimension), value=float(value), measurement=measurement)
+                for dimension, value in sensor_data["data"].items()
+            ]
+            if packed:
+                # VALUES_STORAGE = "packed": stored with the measurement row (devices.packed_values)
+                measurement.packed_dimensions = [v.dimension for v in values]
+                measurement.packed_values = [v.value for v in values]
+                values = []
+            rows.append((reading, measurement, values))
+
+    if not rows:
+        return result
+
+    inserted = _insert_measurements([measurement for _, measurement, _ in rows])
+
+    values = []
+    inserted_readings = set()
+    for reading, measurement, measurement_values in rows:
+        # pop: a key repeated within ``readings`` is inserted once, the repeat counts as skipped
+        pk = inserted.pop((measurement.time_measured, measurement.sensor_model), None)
+        if pk is None:
+            result.skipped.append((measurement.time_measured, measurement.sensor_model))
+            continue
+        measurement.pk = pk
+        measurement._state.adding = False
+        result.created.append(measurement)
+        inserted_readings.add(id(reading))
+        values.extend(measurement_values)
+    result.skipped_readings = [reading for reading in readings if id(reading) not in inserted_readings]
+
+    if not result.created:
+        return result
+
+    Values.objects.bulk_create(values)
+    add_measurements_to_rollups(m.pk for m in result.created)
+    add_measurements_to_latest_values(m.pk for m in result.created)
+    # running per-spot aggregates; only located workshop readings can lie in a spot
+    add_measurements_to_spots(m.pk for m in result.created if m.workshop_id and m.location_id)
+
+    # queryset update: skips Device.save() bookkeeping and the auditlog entry per reading
+    last_update = max(measurement.time_measured for measurement in result.created)
+    Device.objects.filter(pk=device.pk).update(last_update=last_update)
+    device.last_update = last_update
+
+    # cached workshop data responses go stale on commit (workshops.cache)
+    invalidate_workshop_data(*{measurement.workshop_id for measurement in result.created})
+    # cached room current values of the campaign page (campaign.cache)
+    invalidate_room_current_values(*{measurement.room_id for measurement in result.created})
+
+    return result
+
+
+def resolve_workshops(workshop_ids) -> set[str]:
+    """Subset of ``workshop_ids`` that exist, in one query."""
+    workshop_ids = {w for w in workshop_ids if w}
+    if not workshop_ids:
+        return set()
+    return set(Workshop.objects.filter(name__in=workshop_ids).values_list("name", flat=True))
+
+
+def ensure_participants(workshop_by_participant: dict[str, str | None]) -> None:
+    """
+    Create missing participants with ``get_or_create(name=..., defaults={"workshop": ...})``, so they
+    are audit logged; existing rows are left untouched and cost one query for all names.
+    """
+    if not workshop_by_participant:
+        return
+    known = set(Participant.objects.filter(name__in=workshop_by_participant).values_list("name", flat=True))
+    for name, workshop_id in workshop_by_participant.items():
+        if name not in known:
+            Participant.objects.get_or_create(name=name, defaults={"workshop_id": workshop_id})
+
+
+def ensure_modes(mode_names) -> None:
+    """Create missing mobility modes (title from name) in one statement."""
+    mode_names = {m for m in mode_names if m}
+    if not mode_names:
+        return
+    MobilityMode.objects.bulk_create(
+        [MobilityMode(name=name, title=name.title(), description="") for name in mode_names],
+        ignore_conflicts=True,
+    )
+
+
+def store_readings(device: Device, pending: list[PendingReading], *, time_received: datetime) -> tuple[list[Reading], WriteResult]:
+    """
+    Resolve workshops, participants, mobility modes and locations for ``pending`` with one statement
+    each (per distinct value, not per reading), then :func:`write_readings`. Per-reading locations
+    created for readings that turn out to be complete duplicates are removed again.
+
+    Returns the Readings (parallel to ``pending``) and the write result. Callers are expected to wrap
+    this in a transaction.
+    """
+    readings = [
+        Reading(time_measured=p.time_measured, sensors=p.sensors, time_received=p.time_received)
+        for p in pending
+    ]
+
+    known_workshops = resolve_workshops(p.workshop["id"] for p in pending if p.workshop)
+    participants = {}
+    modes = set()
+    for p, reading in zip(pending, readings):
+        if not p.workshop:
+            continue
+        if p.workshop["id"] in known_workshops:
+            reading.workshop_id = p.workshop["id"]
+        if p.workshop.get("participant"):
+            reading.participant_id = p.workshop["participant"]
+            participants.setdefault(reading.participant_id, reading.workshop_id)
+        if p.workshop.get("mode"):
+            reading.mode_id = p.workshop["mode"]
+            modes.add(reading.mode_id)
+
+    ensure_participants(participants)
+    ensure_modes(modes)
+
+    located = [(p, reading) for p, reading in zip(pending, readings) if p.lat is not None and p.lon is not None]
+    for (_, reading), location_id in zip(located, location_ids([(p.lon, p.lat) for p, _ in located])):
+        reading.location_id = location_id
+
+    # duplicates (stored before or repeated within ``pending``) are skipped by the unique constraint
+    result = write_readings(device, readings, time_received=time_received)
+    # shared (deduplicated) locations are kept, other readings may reference them
+    orphaned_locations = [reading.location_id for reading in result.skipped_readings if reading.location_id]
+    if orphaned_locations and not dedupe_enabled():
+        Location.objects.filter(pk__in=orphaned_locations).delete()
+
+    return readings, result
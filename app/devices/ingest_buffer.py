@@ -0,0 +1,193 @@
+"""
+Write-behind ingest (``INGEST_MODE = "buffered"``).
+
+The data and status endpoints authenticate the device (cached, devices.identity), validate the
+payload and store it as one IngestBuffer row, so a request costs a single small insert. The
+``flush_ingest_buffer`` command moves buffered rows into Measurement/Values, DeviceLogs and
+DeviceStatus in large batches; several flushers can run side by side (``SKIP LOCKED``).
+
+Above ``INGEST_BUFFER_HIGH_WATER_MARK`` buffered rows the endpoints answer 503 with Retry-After
+so devices keep the data in their own offline buffer instead of piling onto a lagging flusher.
+Buffered requests were already acknowledged, so rows whose flush fails are kept and retried;
+after ``INGEST_BUFFER_MAX_ATTEMPTS`` failures they stay as dead letters (``attempts``,
+``last_error``) until ``flush_ingest_buffer --retry-failed`` requeues them. Duplicates are not
+reported to the device in this mode; the unique constraint on Measurement drops them at flush time.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from .ingest import PendingReading, store_readings
+from .models import Device, DeviceLogs, IngestBuffer
+from .status_recording import record_device_statuses
+
+logger = logging.getLogger("myapp")
+
+INGEST_SYNC = "sync"
+INGEST_BUFFERED = "buffered"
+
+_DEPTH_CACHE_KEY = "ingest_buffer_depth"
+
+
+def buffering_enabled() -> bool:
+    return settings.INGEST_MODE == INGEST_BUFFERED
+
+
+def _pending():
+    """Buffered rows still to be flushed (dead letters excluded)."""
+    return IngestBuffer.objects.filter(attempts__lt=settings.INGEST_BUFFER_MAX_ATTEMPTS)
+
+
+def buffer_full() -> bool:
+    """Buffer depth at or above the high-water mark (count cached for a few seconds)."""
+    depth = cache.get(_DEPTH_CACHE_KEY)
+    if depth is None:
+        depth = _pending().count()
+        cache.set(_DEPTH_CACHE_KEY, depth, settings.INGEST_BUFFER_DEPTH_CACHE_SECONDS)
+    return depth >= settings.INGEST_BUFFER_HIGH_WATER_MARK
+
+
+def _battery(device_data: dict) -> dict:
+    battery = device_data.get("battery") or {}
+    return {"voltage": battery.get("voltage"), "percentage": battery.get("percentage")}
+
+
+def enqueue_data(device: Device, reading: PendingReading | None, time_received) -> IngestBuffer:
+    """Buffer one data request; ``reading`` None records only the device contact (no sensor data)."""
+    return IngestBuffer.objects.create(
+        kind=IngestBuffer.KIND_DATA,
+        device_id=device.pk,
+        time_received=time_received,
+        payload={"reading": reading.to_payload() if reading else None},
+    )
+
+
+def enqueue_status(device: Device, device_data: dict, sensor_list, status_list: list, time_received) -> IngestBuffer:
+    """Buffer one status request (battery, merged sensor_list and the status_list lines)."""
+    return IngestBuffer.objects.create(
+        kind=IngestBuffer.KIND_STATUS,
+        device_id=device.pk,
+        time_received=time_received,
+        payload={
+            "battery": _battery(device_data),
+            "sensor_list": sensor_list,
+            "status_list": [
+                {
+                    "time": status_data["time"],
+                    "level": status_data.get("level", 1),
+                    "message": status_data.get("message", ""),
+                }
+                for status_data in status_list
+            ],
+        },
+    )
+
+
+@dataclass
+class FlushResult:
+    entries: int = 0
+    measurements: int = 0
+    skipped: int = 0
+    logs: int = 0
+    failed: int = 0
+
+
+def _flush_device(device: Device, entries: list[IngestBuffer], result: FlushResult) -> None:
+    pending = [
+        PendingReading.from_payload(entry.payload["reading"], time_received=entry.time_received)
+        for entry in entries
+        if entry.kind == IngestBuffer.KIND_DATA and entry.payload.get("reading")
+    ]
+    if pending:
+        _, written = store_readings(device, pending, time_received=pending[0].time_received)
+        result.measurements += len(written.created)
+        result.skipped += len(written.skipped)
+
+    logs = [
+        DeviceLogs(
+            device=device,
+            timestamp=parse_datetime(line["time"]),
+            level=line["level"],
+            message=line["message"],
+        )
+        for entry in entries
+        if entry.kind == IngestBuffer.KIND_STATUS
+        for line in entry.payload["status_list"]
+    ]
+    DeviceLogs.objects.bulk_create(logs)
+    result.logs += len(logs)
+
+    # one status snapshot per request, as in sync mode (coalesced there if DEVICE_STATUS_RECORDING = "changes")
+    snapshots = []
+    for entry in entries:
+        battery = entry.payload.get("battery") or {}
+        snapshots.append({
+            "time_received": entry.time_received,
+            "battery_voltage": battery.get("voltage"),
+            "battery_soc": battery.get("percentage"),
+            "sensor_list": entry.payload.get("sensor_list"),
+        })
+    record_device_statuses(device, snapshots)
+
+
+def _mark_failed(entries: list[IngestBuffer], error: str, result: FlushResult) -> None:
+    IngestBuffer.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+        attempts=F("attempts") + 1, last_error=error,
+    )
+    result.failed += len(entries)
+
+
+def flush_ingest_buffer(batch_size: int) -> FlushResult:
+    """
+    Move up to ``batch_size`` buffered rows (oldest first) into their tables in one transaction.
+    Rows locked by a concurrent flusher are skipped. Only the rows that were written are deleted:
+    the rows of a device whose flush fails are logged and kept with their attempt counted, so one
+    bad payload cannot block the buffer and a transient error does not lose acknowledged data.
+    """
+    result = FlushResult()
+    with transaction.atomic():
+        entries = list(_pending().select_for_update(skip_locked=True).order_by("id")[:batch_size])
+        if not entries:
+            return result
+        result.entries = len(entries)
+
+        by_device = defaultdict(list)
+        for entry in entries:
+            by_device[entry.device_id].append(entry)
+        devices = Device.objects.in_bulk(list(by_device))
+
+        flushed = []
+        for device_id, device_entries in by_device.items():
+            device = devices.get(device_id)
+            if device is None:
+                logger.warning("ingest buffer: device %s no longer exists, keeping %d rows", device_id, len(device_entries))
+                _mark_failed(device_entries, f"device {device_id} does not exist", result)
+                continue
+            try:
+                with transaction.atomic():
+                    _flush_device(device, device_entries, result)
+            except Exception as error:
+                logger.exception(
+                    "ingest buffer: flushing rows %s of device %s failed, keeping them for a retry",
+                    [entry.pk for entry in device_entries],
+                    device_id,
+                )
+                _mark_failed(device_entries, repr(error), result)
+                continue
+            flushed.extend(entry.pk for entry in device_entries)
+
+        IngestBuffer.objects.filter(pk__in=flushed).delete()
+    return result
+
+
+def retry_failed() -> int:
+    """Requeue the dead letters (e.g. after fixing the cause); returns their number."""
+    return IngestBuffer.objects.filter(attempts__gte=settings.INGEST_BUFFER_MAX_ATTEMPTS).update(attempts=0)
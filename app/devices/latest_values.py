@@ -0,0 +1,109 @@
+"""
+Newest value per (device, sensor model, dimension) (LatestValue), maintained at ingest.
+
+:func:`add_measurements` (called by ``devices.ingest.write_readings``) upserts the newest value of
+each inserted (device, sensor model, dimension) with one statement; a row is only replaced by a
+reading at least as new, so late or backfilled readings leave it alone. :func:`rebuild_latest_values`
+recomputes rows from Measurement after deletes or moves (``manage.py rebuild_latest_values`` for
+all devices). Current-value cards then aggregate a few indexed rows with :func:`latest_means`
+(:func:`latest_means_by` for many rooms at once), counting only the values of each device's newest
+reading, so a sensor that stopped reporting does not keep its old value in the mean.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Avg, OuterRef, Subquery
+
+from .models import LatestValue
+
+_UPSERT_SQL = """
+    INSERT INTO {table} AS l (device_id, sensor_model, dimension, value, time_measured, room_id, user_id)
+    SELECT DISTINCT ON (m.device_id, m.sensor_model, v.dimension)
+           m.device_id, m.sensor_model, v.dimension, v.value, m.time_measured, m.room_id, m.user_id
+    FROM devices_measurement_values v
+    INNER JOIN devices_measurement m ON m.id = v.measurement_id
+    WHERE {where}
+    ORDER BY m.device_id, m.sensor_model, v.dimension, m.time_measured DESC
+    ON CONFLICT (device_id, sensor_model, dimension) DO UPDATE SET
+        value = EXCLUDED.value,
+        time_measured = EXCLUDED.time_measured,
+        room_id = EXCLUDED.room_id,
+        user_id = EXCLUDED.user_id
+    WHERE EXCLUDED.time_measured >= l.time_measured
+"""
+
+
+def _upsert(where: str, params: list) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(_UPSERT_SQL.format(table=LatestValue._meta.db_table, where=where), params)
+
+
+def add_measurements(measurement_ids) -> None:
+    """Move the latest values forward to newly inserted measurements (where they are newer)."""
+    measurement_ids = list(measurement_ids)
+    if measurement_ids:
+        _upsert("m.id = ANY(%s)", [measurement_ids])
+
+
+def rebuild_latest_values(device_ids=None) -> None:
+    """Recompute the latest values of ``device_ids`` (all devices for None) from Measurement."""
+    with transaction.atomic():
+        if device_ids is None:
+            LatestValue.objects.all().delete()
+            _upsert("TRUE", [])
+            return
+        device_ids = list(device_ids)
+        if device_ids:
+            LatestValue.objects.filter(device_id__in=device_ids).delete()
+            _upsert("m.device_id = ANY(%s)", [device_ids])
+
+
+def _current(dimensions, fields=(), **filters):
+    """
+    Latest values of ``dimensions`` matching ``filters`` that belong to the newest reading of their
+    device (among the rows matching ``filters`` with the same ``fields``).
+    """
+    newest = (
+        LatestValue.objects.filter(device=OuterRef('device'), **filters, **{f: OuterRef(f) for f in fields})
+        .order_by('-time_measured')
+        .values('time_measured')[:1]
+    )
+    return LatestValue.objects.filter(dimension__in=dimensions, time_measured=Subquery(newest), **filters)
+
+
+def latest_means(dimensions, **filters) -> dict[int, float | None]:
+    """
+    ``{dimension: mean}`` of the latest values matching ``filters`` (e.g. ``room=room``) over all
+    devices and sensors, in one query; None for dimensions without a value. Per device only the
+    values measured at its newest matching reading count.
+    """
+    dimensions = [int(d) for d in dimensions]
+    means = dict.fromkeys(dimensions)
+    rows = (
+        _current(dimensions, **filters)
+        .values_list('dimension')
+        .annotate(mean=Avg('value'))
+        .order_by()
+    )
+    means.update(rows)
+    return means
+
+
+def latest_means_by(field: str, dimensions, **filters) -> dict:
+    """
+    ``{value of field: {dimension: mean}}`` like :func:`latest_means`, grouped by ``field``
+    (e.g. ``"room"``) in one query. Groups without any value are missing.
+    """
+    dimensions = [int(d) for d in dimensions]
+    means = defaultdict(lambda: dict.fromkeys(dimensions))
+    rows = (
+        _current(dimensions, (field,), **filters)
+        .values_list(field, 'dimension')
+        .annotate(mean=Avg('value'))
+        .order_by()
+    )
+    for key, dimension, mean in rows:
+        means[key][dimension] = mean
+    return dict(means)
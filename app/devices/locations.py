@@ -0,0 +1,180 @@
+"""
+Location rows for measurement coordinates.
+
+With ``LOCATION_STORAGE = "per_reading"`` (default) every located reading gets its own
+``api.Location`` row. With ``"dedupe"`` readings with the same coordinates (rounded to
+``LOCATION_KEY_DECIMALS``, 7 decimals ~ 1 cm) share one row, found by its unique
+``coordinates_key``: stationary Air Stations then reference a single Location instead of one
+per reading, and spatial joins (workshop spots) test each distinct position once. The key includes
+the height where there is one (readings have none), so rows at different heights stay apart.
+
+Only measurements and air quality records share rows (``SHARED_RELATIONS``); they reference
+Location with ``on_delete=PROTECT``, so deleting a shared row cannot delete the readings of other
+devices. Locations of workshop images are never merged or keyed.
+
+The key is always computed by PostgreSQL (``_KEY_SQL``), for new rows and in the backfill, so
+both agree on rounding and formatting.
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+
+from api.models import Location
+
+LOCATION_KEY_DECIMALS = 7
+LOCATION_KEY_HEIGHT_DECIMALS = 2
+# related names of the Location references that may share a row
+SHARED_RELATIONS = ("measurements", "air_quality_records")
+STORAGE_PER_READING = "per_reading"
+STORAGE_DEDUPE = "dedupe"
+
+DEDUPE_TABLE = "location_duplicates_tmp"
+
+_KEY_SQL = (
+    f"round(({{lon}})::numeric, {LOCATION_KEY_DECIMALS})::text || ',' || "
+    f"round(({{lat}})::numeric, {LOCATION_KEY_DECIMALS})::text || "
+    f"coalesce(',' || round(({{height}})::numeric, {LOCATION_KEY_HEIGHT_DECIMALS})::text, '')"
+)
+
+
+def dedupe_enabled() -> bool:
+    return settings.LOCATION_STORAGE == STORAGE_DEDUPE
+
+
+def location_ids(points: list[tuple[float, float]]) -> list[int]:
+    """
+    Location ids for ``(lon, lat)`` pairs, parallel to ``points``. Per-reading storage inserts one
+    row per point; dedupe storage inserts the missing keys with ON CONFLICT DO NOTHING and reads
+    all ids back in a second statement (safe against concurrent writers of the same position).
+    Callers are expected to wrap this in a transaction.
+    """
+    if not points:
+        return []
+    if not dedupe_enabled():
+        return [location.pk for location in Location.objects.bulk_create(
+            [Location(coordinates=Point(float(lon), float(lat), srid=4326)) for lon, lat in points]
+        )]
+
+    lons = [float(lon) for lon, _ in points]
+    lats = [float(lat) for _, lat in points]
+    key = _KEY_SQL.format(lon="p.lon", lat="p.lat", height="NULL")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {Location._meta.db_table} (coordinates, coordinates_key)
+            SELECT DISTINCT ON (key) ST_SetSRID(ST_MakePoint(lon, lat), 4326), key
+            FROM (SELECT lon, lat, {key} AS key FROM unnest(%s::float8[], %s::float8[]) AS p (lon, lat)) k
+            ON CONFLICT (coordinates_key) DO NOTHING
+            """,
+            [lons, lats],
+        )
+        cursor.execute(
+            f"""
+            SELECT p.ord, l.id
+            FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS p (lon, lat, ord)
+            JOIN {Location._meta.db_table} l ON l.coordinates_key = {key}
+            """,
+            [lons, lats],
+        )
+        ids = dict(cursor.fetchall())
+    return [ids[i] for i in range(1, len(points) + 1)]
+
+
+def _location_references(shared: bool = True) -> list[tuple[str, str]]:
+    """(table, column) of the foreign keys to Location that may (``shared``) or may not share rows."""
+    return [
+        (relation.related_model._meta.db_table, relation.field.column)
+        for relation in Location._meta.related_objects
+        if relation.many_to_one and (relation.get_accessor_name() in SHARED_RELATIONS) == shared
+    ]
+
+
+def _not_referenced_elsewhere(alias: str) -> str:
+    """SQL condition: Location ``alias`` has no references outside ``SHARED_RELATIONS``."""
+    return " AND ".join(
+        f"NOT EXISTS (SELECT 1 FROM {table} r WHERE r.{column} = {alias}.id)"
+        for table, column in _location_references(shared=False)
+    ) or "TRUE"
+
+
+def dedupe_locations(chunk_size: int = 10000, log=None) -> tuple[int, int]:
+    """
+    Backfill for switching to ``LOCATION_STORAGE = "dedupe"``: merge Location rows with the same
+    rounded coordinates and height into the one with the lowest id (a row that already has a key
+    wins), point the measurements and air quality records at it, delete the duplicates and set
+    ``coordinates_key`` on the rest. Locations of workshop images are left alone. Duplicate ids are collected once into a
+    temporary table and merged in chunks, each in its own short transaction, so it can run on a
+    live database and be restarted.
+
+    Returns (locations_deleted, references_updated).
+    """
+    table = Location._meta.db_table
+    key = _KEY_SQL.format(lon="ST_X(coordinates)", lat="ST_Y(coordinates)", height="height")
+    deleted = updated = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {DEDUPE_TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE {DEDUPE_TABLE} AS
+            SELECT id, keep_id FROM (
+                SELECT id, first_value(id) OVER (
+                    PARTITION BY {key} ORDER BY coordinates_key IS NULL, id
+                ) AS keep_id
+                FROM {table} l
+                WHERE {_not_referenced_elsewhere("l")}
+            ) ranked
+            WHERE id <> keep_id
+            """
+        )
+        cursor.execute(f"CREATE INDEX ON {DEDUPE_TABLE} (id)")
+        try:
+            while True:
+                with transaction.atomic():
+                    cursor.execute(f"SELECT id, keep_id FROM {DEDUPE_TABLE} ORDER BY id LIMIT %s", [chunk_size])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    ids = [row[0] for row in rows]
+                    keep_ids = [row[1] for row in rows]
+                    for ref_table, column in _location_references():
+                        cursor.execute(
+                            f"""
+                            UPDATE {ref_table} SET {column} = d.keep_id
+                            FROM unnest(%s::bigint[], %s::bigint[]) AS d (id, keep_id)
+                            WHERE {ref_table}.{column} = d.id
+                            """,
+                            [ids, keep_ids],
+                        )
+                        updated += cursor.rowcount
+                    cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s)", [ids])
+                    deleted += cursor.rowcount
+                    cursor.execute(f"DELETE FROM {DEDUPE_TABLE} WHERE id = ANY(%s)", [ids])
+                if log:
+                    log(f"Merged {deleted} duplicate locations ({updated} references updated)")
+        finally:
+            cursor.execute(f"DROP TABLE IF EXISTS {DEDUPE_TABLE}")
+
+        # Rows written meanwhile may repeat a position: one per key is updated, a later run merges the rest
+        row_key = _KEY_SQL.format(lon="ST_X(l.coordinates)", lat="ST_Y(l.coordinates)", height="l.height")
+        while True:
+            with transaction.atomic():
+                cursor.execute(
+                    f"""
+                    UPDATE {table} SET coordinates_key = {key}
+                    WHERE id IN (
+                        SELECT DISTINCT ON ({row_key}) l.id FROM {table} l
+                        WHERE l.coordinates_key IS NULL AND {_not_referenced_elsewhere("l")}
+                          AND NOT EXISTS (SELECT 1 FROM {table} k WHERE k.coordinates_key = {row_key})
+                        LIMIT %s
+                    )
+                    """,
+                    [chunk_size],
+                )
+                keyed = cursor.rowcount
+            if not keyed:
+                break
+            if log:
+                log(f"Set coordinates_key on {keyed} locations")
+    return deleted, updated
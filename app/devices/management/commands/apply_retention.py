@@ -0,0 +1,54 @@
+"""Apply RETENTION_POLICIES to device logs and status rows (devices.retention)."""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from devices.retention import apply_retention, table_stats
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete or downsample device logs and status rows past their retention (RETENTION_POLICIES) in "
+        "small batches, dropping whole expired partitions where possible, and report rows removed and "
+        "space freed per policy. Safe to run repeatedly, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows deleted per statement.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be removed.")
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="VACUUM ANALYZE the affected tables afterwards, so freed space is reusable right away.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        reports = apply_retention(
+            batch_size=options["batch_size"], dry_run=options["dry_run"], log=self.stdout.write
+        )
+
+        verb = "would remove" if options["dry_run"] else "removed"
+        for report in reports:
+            line = f"{report.policy}: {verb} {report.rows_removed} rows"
+            if report.partitions_dropped:
+                line += f" ({len(report.partitions_dropped)} partitions: {', '.join(report.partitions_dropped)})"
+            line += (
+                f", ~{_megabytes(report.bytes_freed_estimate)} freed by deletes, "
+                f"table {_megabytes(report.bytes_before)} -> {_megabytes(report.bytes_after)}"
+            )
+            self.stdout.write(line)
+
+        tables = {report.policy.model_class._meta.db_table for report in reports}
+        if options["vacuum"] and not options["dry_run"]:
+            with connection.cursor() as cursor:
+                for table in sorted(tables):
+                    cursor.execute(f"VACUUM ANALYZE {table}")
+                    self.stdout.write(f"{table}: vacuumed, {_megabytes(table_stats(table)[0])}")
+
+        total = sum(report.rows_removed for report in reports)
+        self.stdout.write(self.style.SUCCESS(f"Done: {verb} {total} rows."))
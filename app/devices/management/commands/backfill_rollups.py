@@ -0,0 +1,68 @@
+"""Fill the hour/day Values rollups from the stored history (devices.rollups)."""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from devices.models import Measurement
+from devices.rollups import day_range, rebuild_rollups
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise CommandError(f"Invalid date: {value} (expected YYYY-MM-DD)")
+
+
+def _rebuild_chunk(start, end):
+    try:
+        rebuild_rollups(start, end - timedelta(microseconds=1))
+    finally:
+        # each worker thread opened its own connection
+        connections.close_all()
+    return start, end
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the Values rollups for a range of UTC days (default: all stored measurements), in "
+        "chunks of whole days processed by parallel workers, one transaction per chunk. Chunks are "
+        "recomputed from scratch, so the command can be interrupted and re-run, and it also repairs "
+        "ranges after measurements were deleted. Migration 0040 only fills the last day; run this "
+        "once after upgrading for the older history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day (YYYY-MM-DD, UTC). Default: first measurement.")
+        parser.add_argument("--end", help="Last day (YYYY-MM-DD, UTC, inclusive). Default: last measurement.")
+        parser.add_argument("--days", type=int, default=1, help="Days per chunk.")
+        parser.add_argument("--workers", type=int, default=4, help="Chunks processed in parallel.")
+
+    def handle(self, *args, **options):
+        bounds = Measurement.objects.aggregate(first=Min("time_measured"), last=Max("time_measured"))
+        if bounds["first"] is None:
+            self.stdout.write("No measurements.")
+            return
+        start = _parse_date(options["start"]) if options["start"] else bounds["first"]
+        end = _parse_date(options["end"]) if options["end"] else bounds["last"]
+        start, end = day_range(start, end)
+        if options["days"] < 1 or options["workers"] < 1:
+            raise CommandError("--days and --workers must be at least 1")
+
+        chunk = timedelta(days=options["days"])
+        chunks = []
+        while start < end:
+            chunks.append((start, min(start + chunk, end)))
+            start += chunk
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = [executor.submit(_rebuild_chunk, chunk_start, chunk_end) for chunk_start, chunk_end in chunks]
+            for future in as_completed(futures):
+                chunk_start, chunk_end = future.result()
+                done += 1
+                self.stdout.write(f"[{done}/{len(chunks)}] {chunk_start:%Y-%m-%d} - {chunk_end:%Y-%m-%d}")
+        self.stdout.write(self.style.SUCCESS(f"Done: {len(chunks)} chunks."))
@@ -0,0 +1,24 @@
+"""Delete duplicate measurements (same device, time_measured, sensor_model) in small chunks."""
+from django.core.management.base import BaseCommand
+
+from devices.dedupe import collapse_duplicate_measurements
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep the oldest Measurement per (device, time_measured, sensor_model) and delete the others "
+        "with their Values, one short transaction per chunk. Run before migrating to devices 0032 on "
+        "large databases so the migration has nothing left to collapse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Measurements deleted per transaction.")
+
+    def handle(self, *args, **options):
+        measurements, values = collapse_duplicate_measurements(
+            chunk_size=options["chunk_size"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {measurements} duplicate measurements and {values} values deleted."
+        ))
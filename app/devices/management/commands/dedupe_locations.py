@@ -0,0 +1,57 @@
+"""Merge Location rows with identical coordinates (backfill for LOCATION_STORAGE = "dedupe")."""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.models import Location
+from devices.locations import dedupe_locations
+from workshops.spot_stats import WORKSHOP_SPOT_STATS_SQL
+
+WORKSHOP_LOCATIONS_SQL = """
+    SELECT m.id, ST_X(l.coordinates), ST_Y(l.coordinates)
+    FROM devices_measurement AS m
+    LEFT JOIN api_location l ON l.id = m.location_id
+    WHERE m.workshop_id = %s
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Point measurements and air quality records at one Location per position (and height) and "
+        "delete the duplicates, one short transaction per chunk; workshop image locations are left alone. Run after setting LOCATION_STORAGE=dedupe. "
+        "With --explain, the workshop spot statistics and workshop data location joins are explained before and after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000, help="Locations merged per transaction.")
+        parser.add_argument(
+            "--explain",
+            metavar="WORKSHOP",
+            action="append",
+            default=[],
+            help="Print EXPLAIN ANALYZE of the location joins for this workshop before and after (repeatable).",
+        )
+
+    def _explain(self, workshops, label):
+        with connection.cursor() as cursor:
+            for workshop in workshops:
+                for name, sql, params in (
+                    ("spot statistics", WORKSHOP_SPOT_STATS_SQL, [workshop, workshop]),
+                    ("workshop data locations", WORKSHOP_LOCATIONS_SQL, [workshop]),
+                ):
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                    self.stdout.write(f"-- {label}: {name} for workshop {workshop}")
+                    for (line,) in cursor.fetchall():
+                        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        before = Location.objects.count()
+        self._explain(options["explain"], "before")
+        deleted, updated = dedupe_locations(
+            chunk_size=options["chunk_size"],
+            log=self.stdout.write,
+        )
+        self._explain(options["explain"], "after")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {deleted} duplicate locations merged ({updated} references updated), "
+            f"{before} -> {before - deleted} locations."
+        ))
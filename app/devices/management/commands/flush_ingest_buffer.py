@@ -0,0 +1,38 @@
+"""Move buffered device requests (INGEST_MODE = "buffered") into Measurement/Values/DeviceLogs."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from devices.ingest_buffer import flush_ingest_buffer, retry_failed
+
+
+class Command(BaseCommand):
+    help = (
+        "Flush the ingest buffer in batches. Without --loop it drains the buffer once and exits; "
+        "with --loop it keeps polling (run as a separate process next to the web workers). "
+        "Several flushers may run concurrently."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Buffered requests per transaction.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when empty.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when the buffer is empty (--loop).")
+        parser.add_argument(
+            "--retry-failed", action="store_true",
+            help="First requeue the requests kept after INGEST_BUFFER_MAX_ATTEMPTS failed flushes.",
+        )
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            self.stdout.write(f"requeued {retry_failed()} failed requests")
+        while True:
+            result = flush_ingest_buffer(options["batch_size"])
+            if result.entries:
+                self.stdout.write(
+                    f"flushed {result.entries} requests: {result.measurements} measurements "
+                    f"({result.skipped} duplicates skipped), {result.logs} log lines, {result.failed} failed"
+                )
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
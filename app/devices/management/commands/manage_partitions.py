@@ -0,0 +1,71 @@
+"""Create upcoming monthly partitions and detach old ones (devices.partitions)."""
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devices.partitions import (
+    PARTITIONED_TABLES,
+    add_months,
+    convert_table,
+    detach_partitions,
+    ensure_partitions,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly partitions of the time-series tables: create partitions --months-ahead "
+        "months ahead and, with --keep-months, detach partitions that only hold older rows (moved to "
+        "--archive-schema, or dropped with --drop). Run daily. --convert first turns tables that are not "
+        "partitioned yet into partitioned ones (exclusive lock, maintenance window)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--table",
+            action="append",
+            default=[],
+            choices=sorted(PARTITIONED_TABLES),
+            help="Only this table (repeatable). Default: all partitioned tables.",
+        )
+        parser.add_argument("--convert", action="store_true", help="Partition tables that are not partitioned yet.")
+        parser.add_argument("--months-ahead", type=int, default=3, help="Months to create partitions for in advance.")
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            help="Detach partitions that end before the first day of the month this many months ago.",
+        )
+        parser.add_argument("--archive-schema", help="Move detached partitions into this schema.")
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop detached partitions (their rows are deleted, measurements with their values).",
+        )
+
+    def handle(self, *args, **options):
+        if options["drop"] and options["archive_schema"]:
+            raise CommandError("--drop and --archive-schema are mutually exclusive")
+        if options["months_ahead"] < 0 or (options["keep_months"] is not None and options["keep_months"] < 0):
+            raise CommandError("--months-ahead and --keep-months must not be negative")
+
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        for table in options["table"] or PARTITIONED_TABLES:
+            if not is_partitioned(table):
+                if not options["convert"]:
+                    self.stdout.write(f"{table}: not partitioned (use --convert)")
+                    continue
+                convert_table(table, months_ahead=options["months_ahead"], log=self.stdout.write)
+            else:
+                ensure_partitions(table, months_ahead=options["months_ahead"], log=self.stdout.write)
+
+            if options["keep_months"] is not None:
+                cutoff = add_months(this_month, -options["keep_months"])
+                detach_partitions(
+                    table,
+                    datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc),
+                    archive_schema=options["archive_schema"],
+                    drop=options["drop"],
+                    log=self.stdout.write,
+                )
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,70 @@
+"""Move Values rows into the packed arrays of their measurements (backfill for VALUES_STORAGE = "packed")."""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from devices.packed_values import pack_values, storage_sizes, unpack_values
+from workshops.spot_stats import WORKSHOP_SPOT_STATS_SQL
+
+WORKSHOP_VALUES_SQL = """
+    SELECT v.dimension, COUNT(*), AVG(v.value)
+    FROM devices_measurement AS m
+    INNER JOIN devices_measurement_values v ON v.measurement_id = m.id
+    WHERE m.workshop_id = %s
+    GROUP BY v.dimension
+"""
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the values of existing measurements as arrays in the measurement row and delete their Values "
+        "rows, one short transaction per chunk. Run after setting VALUES_STORAGE=packed; --unpack converts "
+        "back. Prints the size of both tables before and after; with --explain, the value reads of a workshop "
+        "are explained before and after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Measurements converted per transaction.")
+        parser.add_argument("--unpack", action="store_true", help="Move packed values back into Values rows.")
+        parser.add_argument(
+            "--explain",
+            metavar="WORKSHOP",
+            action="append",
+            default=[],
+            help="Print EXPLAIN ANALYZE of the value reads for this workshop before and after (repeatable).",
+        )
+
+    def _explain(self, workshops, label):
+        with connection.cursor() as cursor:
+            for workshop in workshops:
+                for name, sql, params in (
+                    ("spot statistics", WORKSHOP_SPOT_STATS_SQL, [workshop, workshop]),
+                    ("workshop values", WORKSHOP_VALUES_SQL, [workshop]),
+                ):
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                    self.stdout.write(f"-- {label}: {name} for workshop {workshop}")
+                    for (line,) in cursor.fetchall():
+                        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        before = storage_sizes()
+        self._explain(options["explain"], "before")
+        convert = unpack_values if options["unpack"] else pack_values
+        converted = convert(chunk_size=options["chunk_size"], log=self.stdout.write)
+        self._explain(options["explain"], "after")
+        after = storage_sizes()
+
+        for table, size in before.items():
+            self.stdout.write(f"{table}: {_megabytes(size)} -> {_megabytes(after[table])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {converted} measurements converted, "
+            f"{_megabytes(sum(before.values()))} -> {_megabytes(sum(after.values()))} in total."
+        ))
+        if not options["unpack"]:
+            self.stdout.write(
+                "Deleted Values rows are reused by new rows after VACUUM; to return the space to the "
+                "operating system run VACUUM FULL devices_values (locks the table) or pg_repack."
+            )
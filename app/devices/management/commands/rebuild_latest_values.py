@@ -0,0 +1,19 @@
+"""Recompute the latest values of the current-value cards from Measurement (devices.latest_values)."""
+from django.core.management.base import BaseCommand
+
+from devices.latest_values import rebuild_latest_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the latest value per device, sensor model and dimension from the stored "
+        "measurements, in one transaction. Run once after migrating to devices 0036 (the migration "
+        "only creates the table) and to repair the values after bulk changes outside the app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--device", action="append", dest="devices", help="Only this device (repeatable).")
+
+    def handle(self, *args, **options):
+        rebuild_latest_values(options["devices"])
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,73 @@
+from django.db import migrations, models
+
+from devices.dedupe import collapse_duplicate_measurements
+
+
+INDEX_NAME = 'measurement_device_time_sensor_uniq'
+
+
+def collapse_duplicates(apps, schema_editor):
+    collapse_duplicate_measurements(chunk_size=1000)
+
+
+def drop_invalid_index(apps, schema_editor):
+    """
+    A concurrent build that failed (e.g. a duplicate was ingested while it ran) leaves an INVALID
+    index that CREATE ... IF NOT EXISTS would skip; drop it so a rerun builds it again.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace',
+            [INDEX_NAME],
+        )
+        row = cursor.fetchone()
+    if row and row[0]:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    # chunks commit on their own and the index is built CONCURRENTLY
+    atomic = False
+
+    dependencies = [
+        ('devices', '0031_devicestatus_device_time_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='measurement',
+                    constraint=models.UniqueConstraint(
+                        fields=('device', 'time_measured', 'sensor_model'),
+                        name='measurement_device_time_sensor_uniq',
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_invalid_index, migrations.RunPython.noop),
+                migrations.RunSQL(
+                    sql=(
+                        'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS measurement_device_time_sensor_uniq '
+                        'ON devices_measurement (device_id, time_measured, sensor_model)'
+                    ),
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS measurement_device_time_sensor_uniq',
+                ),
+                migrations.RunSQL(
+                    # a run that stopped after this statement already added the constraint
+                    sql=(
+                        'DO $$ BEGIN '
+                        "IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'measurement_device_time_sensor_uniq') THEN "
+                        'ALTER TABLE devices_measurement ADD CONSTRAINT measurement_device_time_sensor_uniq '
+                        'UNIQUE USING INDEX measurement_device_time_sensor_uniq; '
+                        'END IF; END $$'
+                    ),
+                    reverse_sql=(
+                        'ALTER TABLE devices_measurement DROP CONSTRAINT IF EXISTS measurement_device_time_sensor_uniq'
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0032_measurement_device_time_sensor_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_seen',
+            field=models.DateTimeField(
+                blank=True,
+                help_text='Last status or data request from the device (also when no DeviceStatus row was recorded).',
+                null=True,
+            ),
+        ),
+    ]
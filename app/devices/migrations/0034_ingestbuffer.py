@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0033_device_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestBuffer',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('data', 'Data'), ('status', 'Status')], max_length=10)),
+                ('device_id', models.CharField(max_length=255)),
+                ('time_received', models.DateTimeField()),
+                ('payload', models.JSONField()),
+            ],
+        ),
+    ]
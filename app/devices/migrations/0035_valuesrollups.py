@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0034_ingestbuffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValuesMinuteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('count', models.BigIntegerField()),
+                ('total', models.FloatField()),
+                ('total_squares', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.device')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'dimension', 'bucket'), name='values_minute_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ValuesHourRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('count', models.BigIntegerField()),
+                ('total', models.FloatField()),
+                ('total_squares', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.device')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'dimension', 'bucket'), name='values_hour_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ValuesDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('count', models.BigIntegerField()),
+                ('total', models.FloatField()),
+                ('total_squares', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.device')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'dimension', 'bucket'), name='values_day_rollup_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0009_remove_organization_owner_remove_organization_users_and_more'),
+        ('devices', '0035_valuesrollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_model', models.IntegerField()),
+                ('dimension', models.IntegerField()),
+                ('value', models.FloatField()),
+                ('time_measured', models.DateTimeField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_values', to='devices.device')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='latest_values', to='campaign.room')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='latest_values', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'sensor_model', 'dimension'), name='latest_value_uniq')],
+            },
+        ),
+    ]
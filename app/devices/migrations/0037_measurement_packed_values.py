@@ -0,0 +1,34 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0036_latestvalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='packed_dimensions',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.SmallIntegerField(), blank=True, null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='packed_values',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, null=True, size=None),
+        ),
+        # read adapter for raw SQL: the values of every measurement, from Values rows or the packed arrays
+        migrations.RunSQL(
+            """
+            CREATE VIEW devices_measurement_values AS
+            SELECT measurement_id, dimension, value FROM devices_values
+            UNION ALL
+            SELECT m.id, p.dimension, p.value
+            FROM devices_measurement m
+            CROSS JOIN LATERAL unnest(m.packed_dimensions, m.packed_values) AS p (dimension, value)
+            """,
+            "DROP VIEW devices_measurement_values",
+        ),
+    ]
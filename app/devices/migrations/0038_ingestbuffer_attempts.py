@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0037_measurement_packed_values'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestbuffer',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestbuffer',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+import devices.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0038_ingestbuffer_attempts'),
+    ]
+
+    operations = [
+        # existing rows stay NULL: adding the column with a volatile default would rewrite the table
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    """
+                    ALTER TABLE devices_measurement ADD COLUMN inserted_at timestamp with time zone NULL;
+                    ALTER TABLE devices_measurement ALTER COLUMN inserted_at SET DEFAULT clock_timestamp();
+                    """,
+                    "ALTER TABLE devices_measurement DROP COLUMN inserted_at",
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='measurement',
+                    name='inserted_at',
+                    field=models.DateTimeField(blank=True, db_default=devices.models.ClockTimestamp(), editable=False, null=True),
+                ),
+            ],
+        ),
+    ]
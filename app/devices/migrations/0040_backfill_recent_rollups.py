@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# Rollups of the last day (from the start of yesterday, UTC), so recent charts are complete right
+# after the upgrade; older history is filled by ``manage.py backfill_rollups``. Frozen SQL
+# (devices.rollups at the time of writing), to be independent of later code changes.
+UNITS = (
+    ("hour", "devices_valueshourrollup"),
+    ("day", "devices_valuesdayrollup"),
+)
+
+START = "date_trunc('day', now(), 'UTC') - interval '1 day'"
+
+UPSERT = """
+    INSERT INTO {table} AS r (device_id, dimension, bucket, count, total, total_squares, minimum, maximum)
+    SELECT m.device_id, v.dimension, date_trunc('{unit}', m.time_measured, 'UTC'),
+           COUNT(*), SUM(v.value), SUM(v.value * v.value), MIN(v.value), MAX(v.value)
+    FROM devices_measurement_values v
+    INNER JOIN devices_measurement m ON m.id = v.measurement_id
+    WHERE m.time_measured >= {start}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (device_id, dimension, bucket) DO UPDATE SET
+        count = r.count + EXCLUDED.count,
+        total = r.total + EXCLUDED.total,
+        total_squares = r.total_squares + EXCLUDED.total_squares,
+        minimum = LEAST(r.minimum, EXCLUDED.minimum),
+        maximum = GREATEST(r.maximum, EXCLUDED.maximum)
+"""
+
+BACKFILL_SQL = [
+    sql
+    for unit, table in UNITS
+    for sql in (
+        f"DELETE FROM {table} WHERE bucket >= {START}",
+        UPSERT.format(table=table, unit=unit, start=START),
+    )
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0039_measurement_inserted_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# One branch per measurement instead of a UNION ALL of two tables: a join on measurement_id (or a
+# filter on devices_measurement) is then planned on devices_measurement first, and each row reads
+# its Values through the measurement_id index plus its own arrays, instead of unnesting the
+# arrays of every measurement before the join.
+LATERAL_VIEW_SQL = """
+    CREATE OR REPLACE VIEW devices_measurement_values AS
+    SELECT m.id AS measurement_id, v.dimension, v.value
+    FROM devices_measurement m
+    CROSS JOIN LATERAL (
+        SELECT dimension, value FROM devices_values WHERE measurement_id = m.id
+        UNION ALL
+        SELECT * FROM unnest(m.packed_dimensions, m.packed_values)
+    ) AS v (dimension, value)
+"""
+
+UNION_VIEW_SQL = """
+    CREATE OR REPLACE VIEW devices_measurement_values AS
+    SELECT measurement_id, dimension, value FROM devices_values
+    UNION ALL
+    SELECT m.id, p.dimension, p.value
+    FROM devices_measurement m
+    CROSS JOIN LATERAL unnest(m.packed_dimensions, m.packed_values) AS p (dimension, value)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0040_backfill_recent_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(LATERAL_VIEW_SQL, UNION_VIEW_SQL),
+    ]
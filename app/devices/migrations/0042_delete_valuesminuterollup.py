@@ -0,0 +1,14 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0041_measurement_values_view_lateral'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ValuesMinuteRollup',
+        ),
+    ]
@@ -0,0 +1,18 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_location_key_height_protect'),
+        ('devices', '0042_delete_valuesminuterollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='location',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='measurements', to='api.location'),
+        ),
+    ]
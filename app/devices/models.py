@@ -1,5 +1,8 @@
+from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.core.cache import cache
 from django.db import models, transaction
+from django.db.models import Func
 from django.utils import timezone
 from organizations.models import Organization
 from campaign.models import Room
@@ -11,6 +14,12 @@ from auditlog.models import AuditlogHistoryField
 from main.enums import LdProduct
 
 
+class ClockTimestamp(Func):
+    """``clock_timestamp()``: the time of the insert itself, not the start of its transaction."""
+    template = "clock_timestamp()"
+    output_field = models.DateTimeField()
+
+
 class Device(models.Model):
     """
     Device model.
@@ -21,6 +30,11 @@ class Device(models.Model):
     firmware = models.CharField(max_length=255, blank=True)
     btmac_address = models.CharField(max_length=12, null=True, blank=True)
     last_update = models.DateTimeField(null=True, blank=True)
+    last_seen = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last status or data request from the device (also when no DeviceStatus row was recorded).",
+    )
     notes = models.TextField(null=True, blank=True)
     api_key = models.CharField(max_length=64, null=True)
     auto_number = models.IntegerField(null=True, blank=True)
@@ -41,7 +55,45 @@ class Device(models.Model):
 
     history = AuditlogHistoryField(pk_indexable=False)
 
+    @staticmethod
+    def identity_cache_key(device_id):
+        """Cache key of the device row cached by the ingest endpoints (devices.identity)."""
+        return f"device_identity_{device_id}"
+
+    @classmethod
+    def invalidate_identity_cache(cls, *device_ids):
+        """
+        Drop the cached rows now and again once the transaction commits: a concurrent request
+        may cache the old row in between, which the second delete removes.
+        """
+        keys = [cls.identity_cache_key(device_id) for device_id in device_ids]
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        device = super().from_db(db, field_names, values)
+        # the name as loaded, so save() notices renames
+        device._loaded_device_name = device.__dict__.get('device_name')
+        return device
+
     def save(self, *args, **kwargs):
+        self._save(*args, **kwargs)
+        self.invalidate_identity_cache(self.pk)
+        loaded_name = self.__dict__.get('_loaded_device_name')
+        name = self.__dict__.get('device_name', loaded_name)
+        if '_loaded_device_name' in self.__dict__ and name != loaded_name:
+            from workshops.cache import invalidate_device_workshop_data
+
+            # cached workshop data shows device names
+            invalidate_device_workshop_data(self.pk)
+        self._loaded_device_name = name
+
+    def delete(self, *args, **kwargs):
+        self.invalidate_identity_cache(self.pk)
+        return super().delete(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
         # if the model id is not set or the auto_number is already set we don't
         # need to update the auto_number
         if self.model is None:
@@ -158,13 +210,39 @@ class Measurement(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, related_name='measurements')
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, related_name='measurements')
     workshop = models.ForeignKey('workshops.Workshop', on_delete=models.CASCADE, null=True, related_name='measurements')
-    location = models.ForeignKey('api.Location', on_delete=models.CASCADE, null=True, related_name='measurements')
+    location = models.ForeignKey('api.Location', on_delete=models.PROTECT, null=True, related_name='measurements')
     mode = models.ForeignKey('api.MobilityMode', on_delete=models.CASCADE, null=True, blank=True, related_name='measurements')
     participant = models.ForeignKey('workshops.Participant', on_delete=models.CASCADE, null=True, blank=True, related_name='measurements')
+    # VALUES_STORAGE = "packed" (devices.packed_values): the values as parallel arrays instead of Values rows
+    packed_dimensions = ArrayField(models.SmallIntegerField(), null=True, blank=True)
+    packed_values = ArrayField(models.FloatField(), null=True, blank=True)
+    # set by the database; workshop data cursors hold back rows inserted within the last
+    # WORKSHOP_DATA_CURSOR_LAG seconds (api.workshop_data). NULL for rows older than the column
+    inserted_at = models.DateTimeField(null=True, blank=True, editable=False, db_default=ClockTimestamp())
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'time_measured', 'sensor_model'],
+                name='measurement_device_time_sensor_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f'Measurement {self.id} from Device {self.device.id}'
 
+    def get_values(self):
+        """
+        The values of this measurement in either storage layout: its Values rows (prefetch
+        ``values`` when reading many measurements), or unsaved Values built from the packed arrays.
+        """
+        if self.packed_dimensions is not None:
+            return [
+                Values(dimension=dimension, value=value, measurement=self)
+                for dimension, value in zip(self.packed_dimensions, self.packed_values)
+            ]
+        return list(self.values.all())
+
 
 class Values(models.Model):
     """
@@ -178,4 +256,82 @@ class Values(models.Model):
         return f'Value {self.id} for Measurement {self.measurement.id}'
 
 
+class ValuesRollup(models.Model):
+    """
+    Count/sum/sum of squares/min/max of one dimension of a device over one time bucket
+    (UTC-aligned), maintained at ingest and rebuilt by ``manage.py backfill_rollups`` (devices.rollups).
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='+')
+    dimension = models.IntegerField()
+    bucket = models.DateTimeField()
+    count = models.BigIntegerField()
+    total = models.FloatField()
+    total_squares = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        abstract = True
+
+
+class ValuesHourRollup(ValuesRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'dimension', 'bucket'], name='values_hour_rollup_uniq'),
+        ]
+
+
+class ValuesDayRollup(ValuesRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'dimension', 'bucket'], name='values_day_rollup_uniq'),
+        ]
+
+
+class LatestValue(models.Model):
+    """
+    Newest value of one dimension of a device's sensor, with the room and user of that reading.
+    Upserted at ingest (devices.latest_values) so current-value cards read one row per sensor and
+    dimension instead of searching Measurement for the newest reading.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='latest_values')
+    sensor_model = models.IntegerField()
+    dimension = models.IntegerField()
+    value = models.FloatField()
+    time_measured = models.DateTimeField()
+    room = models.ForeignKey(Room, null=True, blank=True, on_delete=models.SET_NULL, related_name='latest_values')
+    user = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL, related_name='latest_values')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_model', 'dimension'], name='latest_value_uniq'),
+        ]
+
+    def __str__(self):
+        return f'Latest value {self.dimension} of {self.device_id} ({self.sensor_model})'
+
+
+class IngestBuffer(models.Model):
+    """
+    Staging row for INGEST_MODE = "buffered": an accepted, validated data or status request
+    waiting for ``manage.py flush_ingest_buffer`` (devices.ingest_buffer). Rows whose flush failed
+    ``INGEST_BUFFER_MAX_ATTEMPTS`` times stay as dead letters with their ``last_error``.
+    """
+    KIND_DATA = 'data'
+    KIND_STATUS = 'status'
+    KIND_CHOICES = [(KIND_DATA, 'Data'), (KIND_STATUS, 'Status')]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # plain column instead of a FK: one cheap insert per request, device rows are resolved at flush
+    device_id = models.CharField(max_length=255)
+    time_received = models.DateTimeField()
+    payload = models.JSONField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'IngestBuffer {self.id} ({self.kind}) for Device {self.device_id}'
+
+
 auditlog.register(Device)
\ No newline at end of file
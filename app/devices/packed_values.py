@@ -0,0 +1,146 @@
+"""
+Storage layout of measurement values.
+
+With ``VALUES_STORAGE = "rows"`` (default) every value is a ``Values`` row (dimension, value,
+measurement FK). With ``"packed"`` new measurements keep their values in their own row as two
+parallel arrays (``Measurement.packed_dimensions`` / ``packed_values``), so a 10-dimension reading
+is one row instead of eleven plus their index entries.
+
+Both layouts can be present at once. Readers do not need to know which one a measurement uses:
+raw SQL reads the ``devices_measurement_values`` view (measurement_id, dimension, value), which
+combines Values rows and the unnested arrays, and Python code calls ``Measurement.get_values()``
+or :func:`distinct_dimensions`. Existing rows are converted with ``manage.py pack_values``
+(:func:`pack_values`), and back with ``--unpack``.
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F, Func
+
+from .models import Measurement, Values
+
+STORAGE_ROWS = "rows"
+STORAGE_PACKED = "packed"
+
+# tables whose size pack_values changes
+STORAGE_TABLES = (Values._meta.db_table, Measurement._meta.db_table)
+
+_PACK_SQL = """
+    WITH chunk AS (
+        SELECT DISTINCT measurement_id FROM devices_values
+        WHERE measurement_id > %s
+        ORDER BY measurement_id
+        LIMIT %s
+    ),
+    packed AS (
+        SELECT v.measurement_id,
+               array_agg(v.dimension ORDER BY v.id) AS dimensions,
+               array_agg(v.value ORDER BY v.id) AS vals
+        FROM devices_values v
+        INNER JOIN chunk USING (measurement_id)
+        GROUP BY v.measurement_id
+    )
+    updated AS (
+        UPDATE devices_measurement m
+        SET packed_dimensions = COALESCE(m.packed_dimensions, '{}') || p.dimensions::smallint[],
+            packed_values = COALESCE(m.packed_values, '{}') || p.vals
+        FROM packed p
+        WHERE m.id = p.measurement_id
+        RETURNING m.id
+    )
+    SELECT (SELECT max(measurement_id) FROM chunk), ARRAY(SELECT id FROM updated)
+"""
+
+_DELETE_ROWS_SQL = "DELETE FROM devices_values WHERE measurement_id = ANY(%s)"
+
+_UNPACK_SQL = """
+    WITH chunk AS (
+        SELECT id, packed_dimensions, packed_values FROM devices_measurement
+        WHERE packed_dimensions IS NOT NULL AND id > %s
+        ORDER BY id
+        LIMIT %s
+    ),
+    inserted AS (
+        INSERT INTO devices_values (measurement_id, dimension, value)
+        SELECT c.id, p.dimension, p.value
+        FROM chunk c
+        CROSS JOIN LATERAL unnest(c.packed_dimensions, c.packed_values) AS p (dimension, value)
+    )
+    updated AS (
+        UPDATE devices_measurement m
+        SET packed_dimensions = NULL, packed_values = NULL
+        FROM chunk c
+        WHERE m.id = c.id
+        RETURNING m.id
+    )
+    SELECT (SELECT max(id) FROM chunk), ARRAY(SELECT id FROM updated)
+"""
+
+
+def packed_enabled() -> bool:
+    return settings.VALUES_STORAGE == STORAGE_PACKED
+
+
+def distinct_dimensions(measurements) -> set[int]:
+    """Dimensions stored for the measurements of a queryset, over both layouts (two queries)."""
+    measurements = measurements.order_by().prefetch_related(None)
+    dimensions = set(
+        Values.objects.filter(measurement__in=measurements)
+        .values_list('dimension', flat=True)
+        .distinct()
+    )
+    dimensions.update(
+        measurements.filter(packed_dimensions__isnull=False)
+        .annotate(dimension=Func(F('packed_dimensions'), function='unnest', output_field=models.IntegerField()))
+        .values_list('dimension', flat=True)
+        .distinct()
+    )
+    return dimensions
+
+
+def storage_sizes() -> dict[str, int]:
+    """On-disk size in bytes (including indexes and TOAST) of each of ``STORAGE_TABLES``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT t, pg_total_relation_size(t::regclass) FROM unnest(%s::text[]) AS t",
+            [list(STORAGE_TABLES)],
+        )
+        return dict(cursor.fetchall())
+
+
+def _convert(sql: str, cleanup_sql: str | None, chunk_size: int, log, label: str) -> int:
+    """
+    Run ``sql`` (returning the last scanned measurement id and the converted ids) and ``cleanup_sql``
+    per chunk. The cursor follows the scanned ids: Values rows without a measurement (the FK is gone
+    on a partitioned table) convert nothing but must not end the scan.
+    """
+    converted = last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            with transaction.atomic():
+                cursor.execute(sql, [last_id, chunk_size])
+                scanned_to, ids = cursor.fetchone()
+                if scanned_to is None:
+                    break
+                if cleanup_sql and ids:
+                    cursor.execute(cleanup_sql, [ids])
+            converted += len(ids)
+            last_id = scanned_to
+            if log:
+                log(f"{label} {converted} measurements")
+    return converted
+
+
+def pack_values(chunk_size: int = 5000, log=None) -> int:
+    """
+    Backfill for ``VALUES_STORAGE = "packed"``: move the Values rows of every measurement into its
+    packed arrays and delete them, ``chunk_size`` measurements per short transaction, in id order,
+    so it can run on a live database and be restarted. Returns the number of measurements packed.
+    """
+    return _convert(_PACK_SQL, _DELETE_ROWS_SQL, chunk_size, log, "Packed")
+
+
+def unpack_values(chunk_size: int = 5000, log=None) -> int:
+    """Reverse of :func:`pack_values` (e.g. before switching back to ``"rows"``)."""
+    return _convert(_UNPACK_SQL, None, chunk_size, log, "Unpacked")
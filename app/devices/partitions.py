@@ -0,0 +1,335 @@
+"""
+Monthly range partitioning of the time-series tables.
+
+``PARTITIONED_TABLES`` maps each table to its partition key. :func:`convert_table` turns an
+existing table into a table partitioned by month of that column: the old table is renamed to
+``<table>_legacy`` and attached as the partition for everything before next month, new rows go
+to monthly partitions ``<table>_pYYYYMM`` created ahead of time by :func:`ensure_partitions`.
+Rows beyond them (e.g. a device clock far in the future) go to the DEFAULT partition
+``<table>_default`` instead of failing, and are moved into their month once it is created.
+Old months are detached (and moved to an archive schema or dropped) by :func:`detach_partitions`,
+which replaces row-by-row deletes of whole months. ``manage.py manage_partitions`` runs all three.
+
+The models are unchanged: ids still come from the table's sequence and stay unique, but the
+primary key in the database becomes (id, <partition key>), and unique constraints must include
+the partition key (the Measurement (device, time_measured, sensor_model) constraint does).
+Foreign keys that point at a converted table cannot be kept and are dropped; this is the FK of
+``Values.measurement``, whose rows are still deleted with their measurement by the ORM and with
+a dropped partition by :func:`detach_partitions`, and which packed value storage
+(devices.packed_values) does without. Values itself has no time
+column and is not partitioned.
+
+Converting takes an exclusive lock on the table for the duration (metadata changes and one
+index build for the new primary key); run it in a maintenance window.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from workshops.models import WorkshopSpot
+from workshops.spot_stats import recompute_spots
+
+from .latest_values import rebuild_latest_values
+from .models import LatestValue
+from .rollups import rebuild_rollups
+
+# table -> partition key column
+PARTITIONED_TABLES = {
+    "devices_measurement": "time_measured",
+    "devices_devicestatus": "time_received",
+    "devices_devicelogs": "timestamp",
+}
+LEGACY_SUFFIX = "_legacy"
+# PostgreSQL truncates identifiers beyond this length
+_MAX_IDENTIFIER = 63
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def is_partitioned(table: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def partitions(table: str) -> list[tuple[str, datetime | None, datetime | None]]:
+    """``(name, lower bound, upper bound)`` of the partitions of ``table``, oldest first (None = unbounded)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            INNER JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            [table],
+        )
+        rows = cursor.fetchall()
+        result = []
+        for name, bound in rows:
+            if bound == "DEFAULT":
+                result.append((name, None, None))
+                continue
+            # FOR VALUES FROM ('2025-01-01 00:00:00+00') TO ('2025-02-01 00:00:00+00') / FROM (MINVALUE)
+            lower, upper = bound.split(" FROM (", 1)[1].split(") TO (", 1)
+            upper = upper.rstrip(")")
+            result.append((name, _parse_bound(cursor, lower), _parse_bound(cursor, upper)))
+    return sorted(result, key=lambda p: p[2] or datetime.max.replace(tzinfo=dt_timezone.utc))
+
+
+def _parse_bound(cursor, literal: str) -> datetime | None:
+    if literal in ("MINVALUE", "MAXVALUE"):
+        return None
+    cursor.execute(f"SELECT {literal}::timestamptz")
+    return cursor.fetchone()[0]
+
+
+def _constraints(cursor, table: str, kinds: str) -> list[tuple[str, str, str]]:
+    """``(name, type, definition)`` of the constraints of ``table`` of the given pg_constraint types."""
+    cursor.execute(
+        """
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype = ANY(%s)
+        ORDER BY conname
+        """,
+        [table, list(kinds)],
+    )
+    return cursor.fetchall()
+
+
+def _legacy_name(name: str) -> str:
+    return name[:_MAX_IDENTIFIER - len(LEGACY_SUFFIX)] + LEGACY_SUFFIX
+
+
+def convert_table(table: str, months_ahead: int = 3, log=None) -> list[str]:
+    """
+    Convert ``table`` (one of ``PARTITIONED_TABLES``) into a monthly partitioned table in one
+    transaction, see the module docstring. Returns the foreign keys that referenced it and were
+    dropped, as ``"<table>.<constraint>"``.
+    """
+    column = PARTITIONED_TABLES[table]
+    legacy = _legacy_name(table)
+    boundary = add_months(_month_start(datetime.now(dt_timezone.utc).date()), 1)
+    dropped = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned(table):
+            raise ValueError(f"{table} is already partitioned")
+        cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+
+        # views reading the table are recreated on top of the partitioned table
+        cursor.execute(
+            """
+            SELECT DISTINCT v.relname, pg_get_viewdef(v.oid)
+            FROM pg_depend d
+            INNER JOIN pg_rewrite r ON r.oid = d.objid
+            INNER JOIN pg_class v ON v.oid = r.ev_class
+            WHERE d.refobjid = to_regclass(%s) AND v.oid <> d.refobjid
+            """,
+            [table],
+        )
+        views = cursor.fetchall()
+        for view, _ in views:
+            cursor.execute(f"DROP VIEW {view}")
+
+        # foreign keys pointing at the table would need the partition key; they are dropped
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+            [table],
+        )
+        for referencing_table, name in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {name}")
+            dropped.append(f"{referencing_table}.{name}")
+
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id'), attidentity <> '' FROM pg_attribute "
+            "WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+            [table, table],
+        )
+        sequence, is_identity = cursor.fetchone()
+
+        # free the names of constraints and indexes for the partitioned table
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        constraints = _constraints(cursor, legacy, "puf")
+        for name, _, _ in constraints:
+            cursor.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {_legacy_name(name)}")
+        cursor.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            INNER JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = to_regclass(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.oid)
+            """,
+            [legacy],
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {_legacy_name(name)}")
+
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE ({column})"
+        )
+        if is_identity:
+            # a partition cannot have its own identity column; the parent continues the sequence
+            cursor.execute("SELECT nextval(%s)", [sequence])
+            (next_id,) = cursor.fetchone()
+            cursor.execute(f"ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY")
+            cursor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {int(next_id)})"
+            )
+        elif sequence:
+            # the copied default keeps using the sequence; it must outlive the legacy table
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})")
+        # matching unique index on the legacy table, so attaching it does not build one
+        cursor.execute(f"CREATE UNIQUE INDEX {_legacy_name(table + '_pk')} ON {legacy} (id, {column})")
+        for name, kind, definition in constraints:
+            if kind != "p":
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        for name, definition in indexes:
+            # captured before the index was renamed: only the table name differs
+            cursor.execute(re.sub(rf"( ON (?:\S+\.)?){legacy} ", rf"\g<1>{table} ", definition, count=1))
+
+        # the legacy table's matching indexes are attached to the parent's, none are rebuilt
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%s)",
+            [_bound(boundary)],
+        )
+
+        for view, definition in views:
+            cursor.execute(f"CREATE VIEW {view} AS {definition}")
+
+    if log:
+        log(f"{table}: partitioned by month of {column}, existing rows in {legacy}")
+        for foreign_key in dropped:
+            log(f"{table}: dropped foreign key {foreign_key}")
+    ensure_partitions(table, months_ahead=months_ahead, log=log)
+    return dropped
+
+
+def _create_partition(cursor, table: str, month: date) -> tuple[str, int]:
+    """
+    Create the partition of ``month`` and move the rows of that month out of the DEFAULT partition
+    into it (a partition overlapping rows of the DEFAULT partition cannot be attached). The DEFAULT
+    partition is locked meanwhile, so no rows of the month arrive there in between. Returns
+    (name, rows moved).
+    """
+    column = PARTITIONED_TABLES[table]
+    default = default_partition_name(table)
+    name = partition_name(table, month)
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    cursor.execute(f"LOCK TABLE {default} IN ACCESS EXCLUSIVE MODE")
+    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved",
+        [lower, upper],
+    )
+    moved = cursor.rowcount
+    # builds the partition's indexes and clones the parent's constraints
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [lower, upper])
+    return name, moved
+
+
+def ensure_partitions(table: str, months_ahead: int = 3, log=None) -> list[str]:
+    """
+    Create the DEFAULT partition of ``table`` if missing and the missing monthly partitions up to
+    ``months_ahead`` months after this one, each in its own transaction.
+    """
+    last = _month_start(datetime.now(dt_timezone.utc).date())
+    upper_bounds = [upper for _, _, upper in partitions(table) if upper is not None]
+    month = _month_start(max(upper_bounds).date()) if upper_bounds else last
+    created = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {default_partition_name(table)} PARTITION OF {table} DEFAULT")
+        while month <= add_months(last, months_ahead):
+            with transaction.atomic():
+                name, moved = _create_partition(cursor, table, month)
+            created.append(name)
+            if log and moved:
+                log(f"{table}: moved {moved} rows from the default partition to {name}")
+            month = add_months(month, 1)
+    if log and created:
+        log(f"{table}: created partitions {', '.join(created)}")
+    return created
+
+
+def _drop_measurements(cursor, name: str) -> None:
+    """
+    Drop the detached Measurement partition ``name`` together with the Values of its rows (no
+    foreign key deletes them), and recompute the rollups, latest values and workshop spot stats
+    that included them.
+    """
+    cursor.execute(
+        f"""
+        SELECT min(time_measured), max(time_measured), array_agg(DISTINCT device_id),
+               array_agg(DISTINCT workshop_id) FILTER (WHERE workshop_id IS NOT NULL)
+        FROM {name}
+        """
+    )
+    first, last, device_ids, workshop_ids = cursor.fetchone()
+    cursor.execute(f"DELETE FROM devices_values v USING {name} m WHERE v.measurement_id = m.id")
+    cursor.execute(f"DROP TABLE {name}")
+    if first is None:
+        return
+    rebuild_rollups(first, last, device_ids=device_ids)
+    rebuild_latest_values(set(
+        LatestValue.objects.filter(device_id__in=device_ids, time_measured__lte=last).values_list("device_id", flat=True)
+    ))
+    if workshop_ids:
+        recompute_spots(WorkshopSpot.objects.filter(workshop_id__in=workshop_ids).values_list("pk", flat=True))
+
+
+def detach_partitions(table: str, before: datetime, archive_schema: str | None = None, drop: bool = False, log=None) -> list[str]:
+    """
+    Detach the partitions of ``table`` that only hold rows before ``before``. A detached
+    partition is a plain table: it is moved to ``archive_schema`` (for dumping or querying later)
+    or, with ``drop``, deleted; a dropped Measurement partition takes its Values and its share of
+    the derived tables with it (the Values of an archived one stay). Returns the names of the
+    detached partitions.
+    """
+    detached = []
+    with connection.cursor() as cursor:
+        if archive_schema:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+        for name, _, upper in partitions(table):
+            if upper is None or upper > before:
+                continue
+            with transaction.atomic():
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                if drop and table == "devices_measurement":
+                    _drop_measurements(cursor, name)
+                elif drop:
+                    cursor.execute(f"DROP TABLE {name}")
+                elif archive_schema:
+                    cursor.execute(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+            detached.append(name)
+            if log:
+                log(f"{table}: {'dropped' if drop else 'detached'} {name}")
+    return detached
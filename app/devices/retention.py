@@ -0,0 +1,192 @@
+"""
+Retention of the high-volume device tables and the Values rollups (``manage.py apply_retention``).
+
+``RETENTION_POLICIES`` is a list of policies. Each has a ``model`` (one of ``RETENTION_MODELS``),
+optional ORM ``filter`` lookups (e.g. ``{"level": 0}``) and ``keep_days``. Matching rows older
+than ``keep_days`` are deleted. With ``downsample`` ("hour" or "day") they are not deleted but
+thinned instead: only the newest row per device and UTC hour/day is kept.
+
+Deletes run in batches of ``batch_size`` rows, each one short statement. If the table is
+partitioned by month (devices.partitions), a policy without ``filter`` and ``downsample`` first
+drops the partitions that only hold expired rows. Every run reports rows removed and the space
+freed; deleted rows are reused by new rows after (auto)VACUUM, dropped partitions return their
+space immediately.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import F, Min, Window
+from django.db.models.functions import RowNumber, Trunc
+
+from .partitions import detach_partitions, is_partitioned, partitions
+
+# model -> time column the age of a row is measured by
+RETENTION_MODELS = {
+    "devices.DeviceLogs": "timestamp",
+    "devices.DeviceStatus": "time_received",
+    "devices.ValuesHourRollup": "bucket",
+    "devices.ValuesDayRollup": "bucket",
+}
+DOWNSAMPLE_UNITS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+@dataclass
+class RetentionPolicy:
+    model: str
+    keep_days: int
+    filter: dict = field(default_factory=dict)
+    downsample: str | None = None
+
+    @classmethod
+    def from_setting(cls, policy: dict) -> RetentionPolicy:
+        unknown = set(policy) - {"model", "keep_days", "filter", "downsample"}
+        if unknown:
+            raise ImproperlyConfigured(f"RETENTION_POLICIES: unknown keys {sorted(unknown)}")
+        if policy.get("model") not in RETENTION_MODELS:
+            raise ImproperlyConfigured(f"RETENTION_POLICIES: model must be one of {sorted(RETENTION_MODELS)}")
+        if not isinstance(policy.get("keep_days"), int) or policy["keep_days"] < 0:
+            raise ImproperlyConfigured("RETENTION_POLICIES: keep_days must be a non-negative integer")
+        if policy.get("downsample") not in (None, *DOWNSAMPLE_UNITS):
+            raise ImproperlyConfigured(f"RETENTION_POLICIES: downsample must be one of {sorted(DOWNSAMPLE_UNITS)}")
+        return cls(**policy)
+
+    def __str__(self):
+        conditions = ", ".join(f"{key}={value}" for key, value in self.filter.items())
+        action = f"downsample to {self.downsample}" if self.downsample else "delete"
+        return f"{self.model}{f' ({conditions})' if conditions else ''}: {action} after {self.keep_days} days"
+
+    @property
+    def model_class(self):
+        return apps.get_model(self.model)
+
+    @property
+    def time_field(self) -> str:
+        return RETENTION_MODELS[self.model]
+
+    def cutoff(self, now: datetime) -> datetime:
+        """Rows before this are expired; aligned to whole buckets when downsampling."""
+        cutoff = now - timedelta(days=self.keep_days)
+        if self.downsample:
+            width = DOWNSAMPLE_UNITS[self.downsample]
+            cutoff = datetime.fromtimestamp(cutoff.timestamp() // width.total_seconds() * width.total_seconds(), dt_timezone.utc)
+        return cutoff
+
+    def expired(self, now: datetime):
+        return self.model_class.objects.filter(**self.filter, **{f"{self.time_field}__lt": self.cutoff(now)})
+
+
+@dataclass
+class RetentionReport:
+    policy: RetentionPolicy
+    rows_removed: int = 0
+    partitions_dropped: list[str] = field(default_factory=list)
+    bytes_before: int = 0
+    bytes_after: int = 0
+    # rows removed by deletes times the average row size before the run
+    bytes_freed_estimate: int = 0
+
+
+def load_policies() -> list[RetentionPolicy]:
+    return [RetentionPolicy.from_setting(policy) for policy in settings.RETENTION_POLICIES]
+
+
+def table_stats(table: str) -> tuple[int, int]:
+    """(bytes including indexes and TOAST, estimated rows) of ``table`` and all of its partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(pg_total_relation_size(t.relid)), 0), COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)
+            FROM pg_partition_tree(%s::regclass) t
+            INNER JOIN pg_class c ON c.oid = t.relid
+            WHERE t.isleaf
+            """,
+            [table],
+        )
+        size, rows = cursor.fetchone()
+    return int(size), int(rows)
+
+
+def _drop_partitions(table: str, cutoff: datetime, report: RetentionReport, dry_run: bool) -> datetime | None:
+    """Drop the partitions that end before ``cutoff``; returns the end of the last one (None: none)."""
+    expired = [(name, upper) for name, _, upper in partitions(table) if upper is not None and upper <= cutoff]
+    with connection.cursor() as cursor:
+        for name, _ in expired:
+            cursor.execute(f"SELECT COUNT(*) FROM {name}")
+            report.rows_removed += cursor.fetchone()[0]
+    if not dry_run:
+        detach_partitions(table, cutoff, drop=True)
+    report.partitions_dropped = [name for name, _ in expired]
+    return max((upper for _, upper in expired), default=None)
+
+
+def _delete_batches(model, rows, batch_size: int) -> int:
+    """Delete the rows of queryset ``rows`` in batches of primary keys; returns the number deleted."""
+    deleted = 0
+    while ids := list(rows.values_list("pk", flat=True)[:batch_size]):
+        deleted += model.objects.filter(pk__in=ids).delete()[0]
+    return deleted
+
+
+def _downsampled_rows(policy: RetentionPolicy, rows):
+    """All but the newest row per device and downsample bucket."""
+    time_field = policy.time_field
+    return rows.annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F("device_id"), Trunc(time_field, policy.downsample, tzinfo=dt_timezone.utc)],
+            order_by=[F(time_field).desc(), F("pk").desc()],
+        )
+    ).filter(rank__gt=1)
+
+
+def apply_policy(policy: RetentionPolicy, now: datetime | None = None, batch_size: int = 5000,
+                 dry_run: bool = False) -> RetentionReport:
+    """Apply one policy; with ``dry_run`` only count what would be removed."""
+    now = now or datetime.now(dt_timezone.utc)
+    model = policy.model_class
+    table = model._meta.db_table
+    cutoff = policy.cutoff(now)
+    report = RetentionReport(policy)
+    report.bytes_before, rows_before = table_stats(table)
+    row_size = report.bytes_before / rows_before if rows_before else 0
+
+    expired = policy.expired(now)
+    if not policy.filter and not policy.downsample and is_partitioned(table):
+        dropped_until = _drop_partitions(table, cutoff, report, dry_run)
+        if dropped_until:
+            expired = expired.filter(**{f"{policy.time_field}__gte": dropped_until})
+    deleted = 0
+    if policy.downsample:
+        # one UTC day at a time, so the window only ranks a day of rows per statement
+        first = expired.aggregate(first=Min(policy.time_field))["first"]
+        day = first.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) if first else cutoff
+        while day < cutoff:
+            rows = _downsampled_rows(policy, expired.filter(**{
+                f"{policy.time_field}__gte": day, f"{policy.time_field}__lt": min(day + timedelta(days=1), cutoff),
+            }))
+            deleted += rows.count() if dry_run else _delete_batches(model, rows, batch_size)
+            day += timedelta(days=1)
+    else:
+        deleted = expired.count() if dry_run else _delete_batches(model, expired, batch_size)
+
+    report.rows_removed += deleted
+    report.bytes_freed_estimate = int(deleted * row_size)
+    report.bytes_after = report.bytes_before if dry_run else table_stats(table)[0]
+    return report
+
+
+def apply_retention(batch_size: int = 5000, dry_run: bool = False, log=None) -> list[RetentionReport]:
+    """Apply all ``RETENTION_POLICIES`` in order."""
+    now = datetime.now(dt_timezone.utc)
+    reports = []
+    for policy in load_policies():
+        if log:
+            log(f"Applying {policy}")
+        reports.append(apply_policy(policy, now=now, batch_size=batch_size, dry_run=dry_run))
+    return reports
@@ -0,0 +1,267 @@
+"""
+Hour/day rollups of Values per (device, dimension).
+
+Every write adds its values to both rollup tables with one statement
+(:func:`add_measurements`, called by ``devices.ingest.write_readings``): the inserted values are
+read back once and upserted into each table as count/sum/sum of squares/min/max. Buckets are
+aligned to UTC. History is filled, and ranges are repaired after deletes, by
+:func:`rebuild_rollups` (``manage.py backfill_rollups``), which recomputes whole UTC days. Old
+buckets are removed by ``RETENTION_POLICIES`` (devices.retention).
+
+:func:`rollup_series` answers chart queries from the coarsest table that resolves the requested
+bucket width, so long ranges read a few hundred day rows instead of millions of Values;
+:func:`chart_series` turns it into the label/data arrays of the dashboard charts (the 30-day device
+chart reads hour rollups). Buckets finer than an hour, and charts of a room or user (whose devices
+may also report elsewhere), are bucketed from the matching measurements with
+:func:`measurement_series`, which is meant for short ranges (the 24 h room and participant charts).
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+
+from .models import ValuesDayRollup, ValuesHourRollup
+
+# (date_trunc unit, bucket width, model), finest first
+RESOLUTIONS = (
+    ("hour", timedelta(hours=1), ValuesHourRollup),
+    ("day", timedelta(days=1), ValuesDayRollup),
+)
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# default bucket width: the finest resolution with at most this many buckets in the range
+MAX_POINTS = 2000
+
+_POINTS_SQL = """
+    SELECT m.device_id, v.dimension, m.time_measured AS time, v.value
+    FROM devices_measurement_values v
+    INNER JOIN devices_measurement m ON m.id = v.measurement_id
+    WHERE {where}
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO {table} AS r (device_id, dimension, bucket, count, total, total_squares, minimum, maximum)
+    SELECT device_id, dimension, date_trunc('{unit}', time, 'UTC'),
+           COUNT(*), SUM(value), SUM(value * value), MIN(value), MAX(value)
+    FROM points
+    GROUP BY 1, 2, 3
+    ON CONFLICT (device_id, dimension, bucket) DO UPDATE SET
+        count = r.count + EXCLUDED.count,
+        total = r.total + EXCLUDED.total,
+        total_squares = r.total_squares + EXCLUDED.total_squares,
+        minimum = LEAST(r.minimum, EXCLUDED.minimum),
+        maximum = GREATEST(r.maximum, EXCLUDED.maximum)
+"""
+
+
+def _rollup_sql(where: str) -> str:
+    """One statement: the selected values as ``points``, upserted into every rollup table."""
+    upserts = [
+        _UPSERT_SQL.format(table=model._meta.db_table, unit=unit)
+        for unit, _, model in RESOLUTIONS
+    ]
+    # data-modifying CTEs always run to completion, whether or not the main query reads them
+    ctes = ",\n".join(f"rollup_{i} AS ({sql})" for i, sql in enumerate(upserts[:-1]))
+    return f"WITH points AS ({_POINTS_SQL.format(where=where)}),\n{ctes}\n{upserts[-1]}"
+
+
+def add_measurements(measurement_ids) -> None:
+    """Add the values of newly inserted measurements to the rollups."""
+    measurement_ids = list(measurement_ids)
+    if measurement_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(_rollup_sql("m.id = ANY(%s)"), [measurement_ids])
+
+
+def _floor(time: datetime, width: timedelta) -> datetime:
+    return _EPOCH + (time - _EPOCH) // width * width
+
+
+def day_range(start: datetime, end: datetime) -> tuple[datetime, datetime]:
+    """The whole UTC days covering [start, end]."""
+    day = timedelta(days=1)
+    return _floor(start, day), _floor(end, day) + day
+
+
+def rebuild_rollups(first: datetime, last: datetime, device_ids=None) -> None:
+    """
+    Recompute all rollups of the UTC days from ``first`` to ``last`` (inclusive) from Values, for
+    ``device_ids`` (all devices for None), in one transaction. Idempotent; used for the backfill
+    and after measurements were deleted or moved.
+    """
+    start, end = day_range(first, last)
+    device_filter, params = "", []
+    if device_ids is not None:
+        device_ids = list(device_ids)
+        if not device_ids:
+            return
+        device_filter, params = " AND device_id = ANY(%s)", [device_ids]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for _, _, model in RESOLUTIONS:
+            cursor.execute(
+                f"DELETE FROM {model._meta.db_table} WHERE bucket >= %s AND bucket < %s{device_filter}",
+                [start, end, *params],
+            )
+        cursor.execute(
+            _rollup_sql(
+                "m.time_measured >= %s AND m.time_measured < %s"
+                + (" AND m.device_id = ANY(%s)" if params else "")
+            ),
+            [start, end, *params],
+        )
+
+
+@dataclass
+class RollupBucket:
+    time: datetime
+    dimension: int
+    count: int
+    mean: float
+    minimum: float
+    maximum: float
+    stddev: float
+
+
+def choose_resolution(start: datetime, end: datetime, bucket: timedelta | None = None):
+    """
+    (bucket width, rollup model): without ``bucket`` the finest resolution with at most
+    ``MAX_POINTS`` buckets in the range, otherwise the coarsest table whose width divides ``bucket``.
+    """
+    if bucket is None:
+        for _, width, model in RESOLUTIONS:
+            if (end - start) / width <= MAX_POINTS:
+                return width, model
+        _, width, model = RESOLUTIONS[-1]
+        return width, model
+    for _, width, model in reversed(RESOLUTIONS):
+        if bucket >= width and bucket % width == timedelta(0):
+            return bucket, model
+    raise ValueError(f"Bucket width must be a multiple of {RESOLUTIONS[0][1]}")
+
+
+_SERIES_SQL = """
+    SELECT date_bin(%s, bucket, %s) AS time, dimension,
+           SUM(count), SUM(total), SUM(total_squares), MIN(minimum), MAX(maximum)
+    FROM {table}
+    WHERE device_id = ANY(%s) AND dimension = ANY(%s) AND bucket >= %s AND bucket < %s
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+
+def rollup_series(device_ids, dimensions, start: datetime, end: datetime, bucket: timedelta | None = None):
+    """
+    :class:`RollupBucket` per bucket and dimension over all ``device_ids`` in [start, end), read from
+    the coarsest rollup that resolves the bucket width (see :func:`choose_resolution`). Buckets are
+    aligned to the Unix epoch (UTC midnight), ``start`` is widened to the start of its bucket.
+    """
+    device_ids, dimensions = list(device_ids), [int(d) for d in dimensions]
+    width, model = choose_resolution(start, end, bucket)
+    if not device_ids or not dimensions:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _SERIES_SQL.format(table=model._meta.db_table),
+            [width, _EPOCH, device_ids, dimensions, _floor(start, width), end],
+        )
+        return _buckets(cursor.fetchall())
+
+
+_MEASUREMENT_SERIES_SQL = """
+    SELECT date_bin(%s, m.time_measured, %s) AS time, v.dimension,
+           COUNT(*), SUM(v.value), SUM(v.value * v.value), MIN(v.value), MAX(v.value)
+    FROM devices_measurement m
+    INNER JOIN devices_device d ON d.id = m.device_id
+    INNER JOIN devices_measurement_values v ON v.measurement_id = m.id
+    WHERE m.time_measured >= %s AND m.time_measured < %s AND v.dimension = ANY(%s) AND {where}
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+# measurement_series filters -> column
+_MEASUREMENT_FILTERS = {
+    "device_ids": "m.device_id = ANY(%s)",
+    "room_id": "m.room_id = %s",
+    "user_id": "m.user_id = %s",
+    "current_campaign_id": "d.current_campaign_id = %s",
+}
+
+
+def _buckets(rows) -> list[RollupBucket]:
+    series = []
+    for time, dimension, count, total, total_squares, minimum, maximum in rows:
+        mean = total / count
+        series.append(RollupBucket(
+            time=time,
+            dimension=dimension,
+            count=count,
+            mean=mean,
+            minimum=minimum,
+            maximum=maximum,
+            stddev=math.sqrt(max(total_squares / count - mean * mean, 0.0)),
+        ))
+    return series
+
+
+def measurement_series(dimensions, start: datetime, end: datetime, bucket: timedelta, **filters) -> list[RollupBucket]:
+    """
+    Like :func:`rollup_series`, bucketed from the measurements matching ``filters`` (``device_ids``,
+    ``room_id``, ``user_id``, ``current_campaign_id`` of the device): only the readings taken in the
+    room or by the user count, not everything their devices reported. One indexed range scan; meant
+    for short ranges.
+    """
+    dimensions = [int(d) for d in dimensions]
+    unknown = set(filters) - set(_MEASUREMENT_FILTERS)
+    if unknown:
+        raise TypeError(f"Unknown filters: {sorted(unknown)}")
+    if not dimensions:
+        return []
+    where = " AND ".join(_MEASUREMENT_FILTERS[name] for name in filters) or "TRUE"
+    params = [list(value) if name == "device_ids" else value for name, value in filters.items()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _MEASUREMENT_SERIES_SQL.format(where=where),
+            [bucket, _EPOCH, _floor(start, bucket), end, dimensions, *params],
+        )
+        return _buckets(cursor.fetchall())
+
+
+@dataclass
+class ChartSeries:
+    """Ready-to-plot series: one label per bucket and one row of means per dimension (0 without data)."""
+    labels: list[str]
+    data: list[list[float]]
+
+
+def chart_series(device_ids, dimensions, time_range: timedelta, bucket: timedelta,
+                 label_format: str = "%H:%M", end: datetime | None = None, **filters) -> ChartSeries:
+    """
+    Means of ``dimensions`` over ``device_ids`` per ``bucket`` for the ``time_range`` up to ``end``
+    (now), bucketed in the database: from the rollups (:func:`rollup_series`) if ``bucket`` is a
+    multiple of the finest one, otherwise from the measurements (:func:`measurement_series`). With
+    ``filters`` (see :func:`measurement_series`; ``device_ids`` may be None then) only the matching
+    measurements count. The last bucket is the one containing ``end``.
+    """
+    end = end or datetime.now(dt_timezone.utc)
+    start = _floor(end, bucket) - time_range + bucket
+    slots = time_range // bucket
+    dimensions = [int(d) for d in dimensions]
+
+    data = np.zeros((len(dimensions), slots))
+    if filters or bucket % RESOLUTIONS[0][1]:
+        if device_ids is not None:
+            filters["device_ids"] = device_ids
+        series = measurement_series(dimensions, start, end, bucket, **filters)
+    else:
+        series = rollup_series(device_ids, dimensions, start, end, bucket=bucket)
+    if series:
+        rows = np.array([dimensions.index(b.dimension) for b in series])
+        columns = np.array([(b.time - start) // bucket for b in series])
+        in_range = (columns >= 0) & (columns < slots)
+        data[rows[in_range], columns[in_range]] = np.array([b.mean for b in series])[in_range]
+
+    labels = [(start + i * bucket).strftime(label_format) for i in range(slots)]
+    return ChartSeries(labels=labels, data=data.tolist())
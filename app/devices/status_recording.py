@@ -0,0 +1,116 @@
+"""
+DeviceStatus recording for the ingest endpoints.
+
+``DEVICE_STATUS_RECORDING = "always"`` writes one DeviceStatus row per status/data request (the
+historical behaviour). ``"changes"`` writes a row only when the reported battery voltage/SoC moved
+beyond ``DEVICE_STATUS_BATTERY_VOLTAGE_DELTA`` / ``DEVICE_STATUS_BATTERY_SOC_DELTA``, the sensor
+list differs, or ``DEVICE_STATUS_HEARTBEAT_SECONDS`` passed since the last recorded row.
+``Device.last_seen`` is bumped by the requests that do not record a row, so the last contact of a
+device is the later of ``last_seen`` and its newest DeviceStatus ``time_received``.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Device, DeviceStatus
+
+RECORD_ALWAYS = "always"
+RECORD_CHANGES = "changes"
+
+_SNAPSHOT_FIELDS = ("time_received", "battery_voltage", "battery_soc", "sensor_list")
+
+
+def _snapshot_cache_key(device_id: str) -> str:
+    return f"device_status_snapshot_{device_id}"
+
+
+def _cache_snapshot(device: Device, snapshot: dict) -> None:
+    cache.set(_snapshot_cache_key(device.pk), snapshot, settings.DEVICE_STATUS_HEARTBEAT_SECONDS)
+
+
+def _last_snapshot(device: Device) -> dict | None:
+    """Last recorded status of ``device`` (cached; one indexed query on a miss, which fills the cache)."""
+    snapshot = cache.get(_snapshot_cache_key(device.pk))
+    if snapshot is None:
+        snapshot = (
+            DeviceStatus.objects.filter(device=device)
+            .order_by("-time_received")
+            .values(*_SNAPSHOT_FIELDS)
+            .first()
+        )
+        if snapshot is not None:
+            _cache_snapshot(device, snapshot)
+    return snapshot
+
+
+def _touch(device: Device, now) -> None:
+    # queryset update: no Device.save() bookkeeping, auditlog entry or identity cache invalidation
+    Device.objects.filter(pk=device.pk).update(last_seen=now)
+    device.last_seen = now
+
+
+def _moved(previous, current, delta) -> bool:
+    """Values that are not reported (None) never count as a change."""
+    if current is None:
+        return False
+    if previous is None:
+        return True
+    return abs(float(current) - float(previous)) >= delta
+
+
+def status_changed(previous: dict, battery_voltage, battery_soc, sensor_list, now) -> bool:
+    if now - previous["time_received"] >= timedelta(seconds=settings.DEVICE_STATUS_HEARTBEAT_SECONDS):
+        return True
+    if _moved(previous["battery_voltage"], battery_voltage, settings.DEVICE_STATUS_BATTERY_VOLTAGE_DELTA):
+        return True
+    if _moved(previous["battery_soc"], battery_soc, settings.DEVICE_STATUS_BATTERY_SOC_DELTA):
+        return True
+    return sensor_list is not None and sensor_list != previous["sensor_list"]
+
+
+def record_device_statuses(device: Device, snapshots: list[dict]) -> list[DeviceStatus]:
+    """
+    Record the status snapshots (dicts of ``time_received``, ``battery_voltage``, ``battery_soc``
+    and ``sensor_list``, oldest first) of ``device`` with one bulk insert, and at most one
+    ``last_seen`` update when the newest of them was coalesced. Returns the new rows.
+    """
+    changes_only = settings.DEVICE_STATUS_RECORDING == RECORD_CHANGES
+    previous = _last_snapshot(device) if changes_only else None
+    rows = []
+    coalesced_until = None
+    for snapshot in snapshots:
+        if previous is not None and not status_changed(
+            previous, snapshot["battery_voltage"], snapshot["battery_soc"], snapshot["sensor_list"], snapshot["time_received"]
+        ):
+            coalesced_until = snapshot["time_received"]
+            continue
+        # bulk_create keeps time_received: DeviceStatus.save() would stamp the current time instead
+        rows.append(DeviceStatus(device=device, **snapshot))
+        if changes_only:
+            previous = snapshot
+
+    DeviceStatus.objects.bulk_create(rows)
+    if coalesced_until is not None and (not rows or coalesced_until > rows[-1].time_received):
+        _touch(device, coalesced_until)
+    if changes_only and rows:
+        _cache_snapshot(device, {field: getattr(rows[-1], field) for field in _SNAPSHOT_FIELDS})
+    return rows
+
+
+def record_device_status(device: Device, *, battery_voltage=None, battery_soc=None, sensor_list=None, now=None) -> DeviceStatus | None:
+    """
+    Depending on ``DEVICE_STATUS_RECORDING``, create a DeviceStatus or only bump ``device.last_seen``.
+    Returns the new row, or None when the snapshot was coalesced into the previous one.
+    ``now`` defaults to the current time.
+    """
+    rows = record_device_statuses(device, [{
+        "time_received": now or timezone.now(),
+        "battery_voltage": battery_voltage,
+        "battery_soc": battery_soc,
+        "sensor_list": sensor_list,
+    }])
+    return rows[0] if rows else None
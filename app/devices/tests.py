@@ -3,18 +3,28 @@ import json
 import zipfile
 from io import BytesIO
 
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
+from django.core.cache import cache
 from django.db import connection
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
 from django.utils import timezone
 
-from devices.models import Device, DeviceLogs, DeviceStatus, Measurement
+from devices.ingest import Reading, write_readings
+from devices.models import Device, DeviceLogs, DeviceStatus, LatestValue, Measurement, Values, ValuesDayRollup, ValuesHourRollup
+from devices.latest_values import latest_means, rebuild_latest_values
+from devices.packed_values import distinct_dimensions, pack_values, unpack_values
+from devices.partitions import add_months, convert_table, detach_partitions, ensure_partitions, is_partitioned, partition_name, partitions
+from devices.retention import apply_retention
+from devices.rollups import chart_series, rebuild_rollups, rollup_series
 from devices.views import AirStationsOverviewView, DeviceListView, DeviceMoveMeasurementsView
 from main.enums import LdProduct, Dimension
 from api.models import AirQualityRecord
+from campaign.models import Campaign, Room
+from campaign.cache import current_values_key
+from main.util import campaign_room_current_values, room_calculate_current_values
 
 
 class DeviceListViewTests(TestCase):
@@ -361,6 +371,377 @@ class DeviceMoveMeasurementsTests(TestCase):
         self.assertEqual(self.source.measurements.count(), 1)
 
 
+class ValuesRollupTests(TestCase):
+    """Hour/day rollups: maintained by write_readings, rebuilt from Values, read by rollup_series."""
+
+    def setUp(self):
+        self.device = Device.objects.create(id="ROLLUP01")
+        self.start = datetime(2024, 3, 1, 10, 0, tzinfo=dt_timezone.utc)
+
+    def _write(self, offsets_and_values):
+        readings = [
+            Reading(
+                time_measured=self.start + offset,
+                sensors={"1": {"type": 1, "data": {Dimension.PM2_5: value}}},
+            )
+            for offset, value in offsets_and_values
+        ]
+        write_readings(self.device, readings, time_received=self.start)
+
+    def test_write_readings_updates_every_resolution(self):
+        self._write([(timedelta(seconds=10), 4.0), (timedelta(seconds=20), 8.0)])
+        self._write([(timedelta(minutes=5), 12.0)])
+
+        hour = ValuesHourRollup.objects.get(device=self.device)
+        self.assertEqual((hour.bucket, hour.count, hour.minimum, hour.maximum), (self.start, 3, 4.0, 12.0))
+        self.assertEqual(hour.total_squares, 16.0 + 64.0 + 144.0)
+        day = ValuesDayRollup.objects.get(device=self.device)
+        self.assertEqual((day.bucket, day.count), (self.start.replace(hour=0), 3))
+
+    def test_rebuild_after_delete(self):
+        self._write([(timedelta(seconds=10), 4.0), (timedelta(seconds=20), 8.0)])
+        Measurement.objects.filter(device=self.device, time_measured=self.start + timedelta(seconds=20)).delete()
+
+        rebuild_rollups(self.start, self.start)
+
+        day = ValuesDayRollup.objects.get(device=self.device)
+        self.assertEqual((day.count, day.maximum), (1, 4.0))
+
+    def test_rollup_series_uses_coarsest_resolution(self):
+        self._write([(timedelta(minutes=0), 2.0), (timedelta(minutes=30), 4.0), (timedelta(hours=2), 9.0)])
+
+        end = self.start + timedelta(days=30)
+        with CaptureQueriesContext(connection) as queries:
+            series = rollup_series([self.device.pk], [Dimension.PM2_5], self.start, end)
+        self.assertIn(ValuesHourRollup._meta.db_table, queries.captured_queries[0]["sql"])
+        self.assertEqual([(b.time, b.count, b.mean) for b in series], [
+            (self.start, 2, 3.0),
+            (self.start + timedelta(hours=2), 1, 9.0),
+        ])
+
+        (day,) = rollup_series([self.device.pk], [Dimension.PM2_5], self.start, end, bucket=timedelta(days=1))
+        self.assertEqual((day.count, day.minimum, day.maximum), (3, 2.0, 9.0))
+
+    def test_chart_series_fills_buckets_up_to_end(self):
+        self._write([(timedelta(minutes=1), 2.0), (timedelta(minutes=12), 4.0), (timedelta(minutes=14), 6.0)])
+
+        end = self.start + timedelta(minutes=59, seconds=30)
+        chart = chart_series(
+            [self.device.pk], [Dimension.TEMPERATURE, Dimension.PM2_5],
+            timedelta(hours=1), timedelta(minutes=10), end=end,
+        )
+        self.assertEqual(chart.labels, ["10:00", "10:10", "10:20", "10:30", "10:40", "10:50"])
+        self.assertEqual(chart.data, [
+            [0.0] * 6,
+            [2.0, 5.0, 0.0, 0.0, 0.0, 0.0],
+        ])
+
+    def test_chart_series_reads_hour_rollups_for_hourly_buckets(self):
+        self._write([(timedelta(minutes=1), 2.0), (timedelta(hours=1, minutes=5), 4.0)])
+
+        end = self.start + timedelta(hours=1, minutes=30)
+        with CaptureQueriesContext(connection) as queries:
+            chart = chart_series([self.device.pk], [Dimension.PM2_5], timedelta(hours=2), timedelta(hours=1), end=end)
+        self.assertIn(ValuesHourRollup._meta.db_table, queries.captured_queries[0]["sql"])
+        self.assertEqual(chart.data, [[2.0, 4.0]])
+
+    def test_device_detail_chart_from_hour_rollups(self):
+        get_user_model().objects.create_superuser(username="rollupadmin", email="rollup@example.com", password="testpass123")
+        self.client.login(username="rollupadmin", password="testpass123")
+        now = timezone.now()
+        self.start = now - timedelta(hours=2)
+        self._write([(timedelta(0), 5.0)])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("device-detail", args=[self.device.pk]))
+        self.assertTrue(any(ValuesHourRollup._meta.db_table in q["sql"] for q in queries.captured_queries))
+        (dataset,) = response.context["measurement_chart"]["datasets"]
+        self.assertEqual(dataset["data"][-3:], [5.0, 0.0, 0.0])
+
+    def test_room_chart_counts_only_readings_in_the_room(self):
+        campaign = Campaign.objects.create(name="Rollup", start_date=self.start, end_date=self.start + timedelta(days=30))
+        room, other_room = (Room.objects.create(campaign=campaign, name=name) for name in ("Room 1", "Room 2"))
+        self.device.current_room = other_room
+        self.device.save()
+        self._write([(timedelta(minutes=1), 20.0)])
+        self.device.current_room = room
+        self.device.save()
+        self._write([(timedelta(minutes=2), 4.0)])
+
+        end = self.start + timedelta(minutes=9)
+        chart = chart_series(None, [Dimension.PM2_5], timedelta(minutes=10), timedelta(minutes=10), end=end, room_id=room.pk)
+        self.assertEqual(chart.data, [[4.0]])
+
+
+
+class LatestValueTests(TestCase):
+    """LatestValue: upserted by write_readings, rebuilt after deletes, read by the current-value cards."""
+
+    def setUp(self):
+        start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        self.campaign = Campaign.objects.create(name="Latest", start_date=start, end_date=start + timedelta(days=30))
+        self.room = Room.objects.create(campaign=self.campaign, name="Room 1")
+        self.device = Device.objects.create(id="LATEST01", current_room=self.room)
+        self.other = Device.objects.create(id="LATEST02", current_room=self.room)
+        self.time = start + timedelta(days=1)
+
+    def _write(self, device, offset, data, sensor_model=1):
+        reading = Reading(time_measured=self.time + offset, sensors={"1": {"type": sensor_model, "data": data}})
+        write_readings(device, [reading], time_received=self.time)
+
+    def test_newer_reading_replaces_older_is_ignored(self):
+        self._write(self.device, timedelta(minutes=5), {Dimension.PM2_5: 7.0})
+        self._write(self.device, timedelta(minutes=1), {Dimension.PM2_5: 3.0})
+
+        latest = LatestValue.objects.get(device=self.device)
+        self.assertEqual((latest.value, latest.time_measured, latest.room), (7.0, self.time + timedelta(minutes=5), self.room))
+
+    def test_room_current_values_in_one_query(self):
+        self._write(self.device, timedelta(0), {Dimension.PM2_5: 4.0, Dimension.CO2: 600.0})
+        self._write(self.other, timedelta(0), {Dimension.PM2_5: 8.0})
+
+        with CaptureQueriesContext(connection) as queries:
+            current = room_calculate_current_values(self.room)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((current[0], current[2], current[4], current[6]), (None, 6.0, 600.0, None))
+
+    def test_stale_sensor_is_left_out(self):
+        self._write(self.device, timedelta(0), {Dimension.PM2_5: 20.0}, sensor_model=2)
+        self._write(self.device, timedelta(minutes=5), {Dimension.PM2_5: 6.0})
+
+        self.assertEqual(latest_means([Dimension.PM2_5], room=self.room), {Dimension.PM2_5: 6.0})
+        self.assertEqual(campaign_room_current_values(self.campaign)[self.room.pk][2], 6.0)
+
+    def test_rebuild_after_delete(self):
+        self._write(self.device, timedelta(minutes=1), {Dimension.PM2_5: 3.0})
+        self._write(self.device, timedelta(minutes=5), {Dimension.PM2_5: 7.0})
+        Measurement.objects.filter(device=self.device, time_measured=self.time + timedelta(minutes=5)).delete()
+
+        rebuild_latest_values([self.device.pk])
+
+        self.assertEqual(latest_means([Dimension.PM2_5], device=self.device), {Dimension.PM2_5: 3.0})
+
+    def test_campaign_room_current_values_in_two_queries(self):
+        empty_room = Room.objects.create(campaign=self.campaign, name="Room 2")
+        self._write(self.device, timedelta(0), {Dimension.PM2_5: 4.0})
+
+        with CaptureQueriesContext(connection) as queries:
+            current = campaign_room_current_values(self.campaign)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(current[self.room.pk][2], 4.0)
+        self.assertEqual(current[empty_room.pk], [None] * 8)
+
+    def test_ingest_into_room_drops_cached_campaign_values(self):
+        cache.set(current_values_key(self.campaign.pk), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            self._write(self.device, timedelta(0), {Dimension.PM2_5: 4.0})
+        self.assertIsNone(cache.get(current_values_key(self.campaign.pk)))
+
+    def test_delete_view_drops_cached_campaign_values(self):
+        self._write(self.device, timedelta(0), {Dimension.PM2_5: 4.0})
+        measurement = Measurement.objects.get(device=self.device)
+        cache.set(current_values_key(self.campaign.pk), {})
+        self.client.force_login(get_user_model().objects.create_superuser(username="admin", email="admin@test.com", password="testpass123"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("measurement-delete", kwargs={"pk": self.device.pk, "measurement_pk": measurement.pk}))
+
+        self.assertIsNone(cache.get(current_values_key(self.campaign.pk)))
+        self.assertEqual(latest_means([Dimension.PM2_5], room=self.room), {Dimension.PM2_5: None})
+
+
+
+class PackedValuesTests(TestCase):
+    """VALUES_STORAGE = "packed": arrays on the measurement row, read through the same adapters as Values rows."""
+
+    def setUp(self):
+        self.device = Device.objects.create(id="PACKED01")
+        self.time = datetime(2024, 3, 1, 10, 0, tzinfo=dt_timezone.utc)
+
+    def _write(self, offset, data):
+        reading = Reading(time_measured=self.time + offset, sensors={"1": {"type": 1, "data": data}})
+        return write_readings(self.device, [reading], time_received=self.time).created[0]
+
+    def test_packed_write_creates_no_value_rows(self):
+        with override_settings(VALUES_STORAGE="packed"):
+            measurement = self._write(timedelta(0), {Dimension.PM2_5: 4.0, Dimension.TEMPERATURE: 21.5})
+
+        self.assertFalse(Values.objects.exists())
+        measurement.refresh_from_db()
+        self.assertEqual(measurement.packed_dimensions, [Dimension.PM2_5, Dimension.TEMPERATURE])
+        self.assertEqual([(v.dimension, v.value) for v in measurement.get_values()], [(Dimension.PM2_5, 4.0), (Dimension.TEMPERATURE, 21.5)])
+        # the raw SQL readers (rollups, latest values) see packed values through the view
+        self.assertEqual(ValuesHourRollup.objects.get(device=self.device, dimension=Dimension.PM2_5).total, 4.0)
+        self.assertEqual(latest_means([Dimension.TEMPERATURE], device=self.device), {Dimension.TEMPERATURE: 21.5})
+
+    def test_pack_and_unpack_existing_rows(self):
+        self._write(timedelta(0), {Dimension.PM2_5: 4.0, Dimension.CO2: 600.0})
+        with override_settings(VALUES_STORAGE="packed"):
+            self._write(timedelta(minutes=1), {Dimension.PM2_5: 6.0})
+        measurements = Measurement.objects.filter(device=self.device)
+        self.assertEqual(distinct_dimensions(measurements), {Dimension.PM2_5, Dimension.CO2})
+
+        self.assertEqual(pack_values(chunk_size=1), 1)
+        self.assertFalse(Values.objects.exists())
+        first = measurements.get(time_measured=self.time)
+        self.assertEqual(sorted(zip(first.packed_dimensions, first.packed_values)), [(Dimension.PM2_5, 4.0), (Dimension.CO2, 600.0)])
+        self.assertEqual(distinct_dimensions(measurements), {Dimension.PM2_5, Dimension.CO2})
+
+        self.assertEqual(unpack_values(), 2)
+        self.assertEqual(Values.objects.count(), 3)
+        self.assertFalse(measurements.filter(packed_dimensions__isnull=False).exists())
+
+    def test_pack_continues_past_values_without_measurement(self):
+        orphaned = self._write(timedelta(0), {Dimension.PM2_5: 4.0})
+        packed = self._write(timedelta(minutes=1), {Dimension.PM2_5: 6.0})
+        # no FK on a partitioned Values table (here: deferred, never checked in the test transaction)
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM devices_measurement WHERE id = %s", [orphaned.pk])
+
+        self.assertEqual(pack_values(chunk_size=1), 1)
+        packed.refresh_from_db()
+        self.assertEqual((packed.packed_dimensions, packed.packed_values), ([Dimension.PM2_5], [6.0]))
+
+
+
+class PartitionTests(TestCase):
+    """Monthly partitioning keeps the ORM working and turns old months into detachable partitions."""
+
+    def test_convert_and_detach_device_logs(self):
+        device = Device.objects.create(id="PARTITION01")
+        old = DeviceLogs.objects.create(device=device, timestamp=datetime(2020, 1, 1, tzinfo=dt_timezone.utc), level=0, message="old")
+
+        convert_table("devices_devicelogs", months_ahead=2)
+
+        self.assertTrue(is_partitioned("devices_devicelogs"))
+        names = [name for name, _, _ in partitions("devices_devicelogs")]
+        self.assertEqual((names[0], names[-1]), ("devices_devicelogs_legacy", "devices_devicelogs_default"))
+        self.assertEqual(len(names), 4)  # legacy (up to next month) + the next two months + default
+
+        next_month = add_months(timezone.now().date().replace(day=1), 1)
+        new = DeviceLogs.objects.create(
+            device=device, timestamp=datetime(next_month.year, next_month.month, 2, tzinfo=dt_timezone.utc), level=1, message="new",
+        )
+        self.assertGreater(new.pk, old.pk)
+        self.assertEqual(list(DeviceLogs.objects.order_by("timestamp").values_list("message", flat=True)), ["old", "new"])
+
+        detached = detach_partitions(
+            "devices_devicelogs", datetime(next_month.year, next_month.month, 1, tzinfo=dt_timezone.utc), drop=True,
+        )
+        self.assertEqual(detached, ["devices_devicelogs_legacy"])
+        self.assertEqual(list(DeviceLogs.objects.values_list("message", flat=True)), ["new"])
+
+    def test_future_rows_go_to_default_partition_until_their_month_exists(self):
+        device = Device.objects.create(id="PARTITION02")
+        convert_table("devices_devicelogs", months_ahead=1)
+        future = add_months(timezone.now().date().replace(day=1), 24)
+        DeviceLogs.objects.create(
+            device=device, timestamp=datetime(future.year, future.month, 3, tzinfo=dt_timezone.utc), level=1, message="future",
+        )
+
+        created = ensure_partitions("devices_devicelogs", months_ahead=24)
+
+        self.assertIn(partition_name("devices_devicelogs", future), created)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT message FROM {partition_name('devices_devicelogs', future)}")
+            self.assertEqual(cursor.fetchall(), [("future",)])
+            cursor.execute("SELECT count(*) FROM devices_devicelogs_default")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_convert_and_drop_measurements(self):
+        device = Device.objects.create(id="PARTITION03")
+        old_time = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        next_month = add_months(timezone.now().date().replace(day=1), 1)
+        new_time = datetime(next_month.year, next_month.month, 2, tzinfo=dt_timezone.utc)
+
+        def write(time, value):
+            reading = Reading(time_measured=time, sensors={"1": {"type": 1, "data": {Dimension.PM2_5: value}}})
+            return write_readings(device, [reading], time_received=time).created[0]
+
+        old = write(old_time, 4.0)
+        dropped = convert_table("devices_measurement", months_ahead=2)
+
+        self.assertTrue(is_partitioned("devices_measurement"))
+        self.assertTrue(any(name.startswith("devices_values.") for name in dropped))
+        new = write(new_time, 8.0)
+        self.assertGreater(new.pk, old.pk)
+        # the values view was recreated on top of the partitioned table
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT measurement_id, value FROM devices_measurement_values ORDER BY measurement_id")
+            self.assertEqual(cursor.fetchall(), [(old.pk, 4.0), (new.pk, 8.0)])
+
+        detached = detach_partitions(
+            "devices_measurement", datetime(next_month.year, next_month.month, 1, tzinfo=dt_timezone.utc), drop=True,
+        )
+
+        self.assertEqual(detached, ["devices_measurement_legacy"])
+        self.assertEqual(list(Measurement.objects.values_list("pk", flat=True)), [new.pk])
+        self.assertFalse(Values.objects.filter(measurement_id=old.pk).exists())
+        self.assertEqual(list(ValuesDayRollup.objects.filter(device=device).values_list("bucket", flat=True)), [new_time])
+        self.assertEqual(LatestValue.objects.get(device=device).value, 8.0)
+
+
+
+@override_settings(RETENTION_POLICIES=[
+    {"model": "devices.DeviceLogs", "filter": {"level": 0}, "keep_days": 14},
+    {"model": "devices.DeviceStatus", "keep_days": 30, "downsample": "hour"},
+])
+class RetentionTests(TestCase):
+    """apply_retention deletes expired debug logs and thins old status rows to one per device and hour."""
+
+    def setUp(self):
+        self.device = Device.objects.create(id="RETENTION01")
+        self.now = timezone.now()
+
+    def test_expired_debug_logs_deleted_in_batches(self):
+        old = self.now - timedelta(days=20)
+        DeviceLogs.objects.bulk_create(
+            [DeviceLogs(device=self.device, timestamp=old, level=0, message=f"debug {i}") for i in range(5)]
+            + [
+                DeviceLogs(device=self.device, timestamp=old, level=1, message="info"),
+                DeviceLogs(device=self.device, timestamp=self.now, level=0, message="recent debug"),
+            ]
+        )
+
+        logs_report, _ = apply_retention(batch_size=2)
+
+        self.assertEqual(logs_report.rows_removed, 5)
+        self.assertEqual(
+            sorted(DeviceLogs.objects.values_list("message", flat=True)), ["info", "recent debug"]
+        )
+
+    def test_old_status_downsampled_to_newest_per_hour(self):
+        hour = (self.now - timedelta(days=40)).replace(minute=0, second=0, microsecond=0)
+        DeviceStatus.objects.bulk_create(
+            [DeviceStatus(device=self.device, time_received=hour + timedelta(minutes=m), battery_soc=m) for m in (5, 20, 50)]
+            + [DeviceStatus(device=self.device, time_received=hour + timedelta(hours=1), battery_soc=99)]
+            + [DeviceStatus(device=self.device, time_received=self.now - timedelta(minutes=m), battery_soc=m) for m in (1, 2)]
+        )
+
+        dry_run = apply_retention(dry_run=True)[1]
+        self.assertEqual((dry_run.rows_removed, DeviceStatus.objects.count()), (2, 6))
+
+        status_report = apply_retention()[1]
+        self.assertEqual(status_report.rows_removed, 2)
+        self.assertEqual(
+            sorted(DeviceStatus.objects.values_list("battery_soc", flat=True)), [1, 2, 50, 99]
+        )
+
+    @override_settings(RETENTION_POLICIES=[{"model": "devices.ValuesHourRollup", "keep_days": 400}])
+    def test_old_hour_rollups_deleted(self):
+        def bucket(time):
+            return ValuesHourRollup(
+                device=self.device, dimension=Dimension.PM2_5, bucket=time,
+                count=1, total=1.0, total_squares=1.0, minimum=1.0, maximum=1.0,
+            )
+        ValuesHourRollup.objects.bulk_create([bucket(self.now - timedelta(days=401)), bucket(self.now - timedelta(days=1))])
+
+        (report,) = apply_retention()
+
+        self.assertEqual(report.rows_removed, 1)
+        self.assertEqual(ValuesHourRollup.objects.get().bucket, self.now - timedelta(days=1))
+
+
 class DeviceDataDownloadTests(TestCase):
     """device-data-download returns a ZIP with device metadata and CSV appendices."""
 
@@ -404,3 +785,29 @@ class DeviceDataDownloadTests(TestCase):
             meta = json.loads(zf.read("device.json").decode("utf-8"))
         self.assertEqual(meta["device"]["id"], "devdl1234567890")
         self.assertIn("device_name", meta["device"])
+
+
+class DeviceLogsCSVTests(TestCase):
+    """device-logs-csv streams the device logs as CSV, newest first."""
+
+    def setUp(self):
+        get_user_model().objects.create_superuser(
+            username="admin",
+            email="admin@test.com",
+            password="testpass123",
+        )
+        self.device = Device.objects.create(id="devlogs123456", model=LdProduct.AIR_STATION)
+        now = timezone.now().replace(microsecond=0)
+        DeviceLogs.objects.create(device=self.device, timestamp=now - timedelta(minutes=1), level=1, message="older")
+        DeviceLogs.objects.create(device=self.device, timestamp=now, level=2, message="newer, with comma")
+
+    def test_superuser_gets_streamed_csv(self):
+        self.client.login(username="admin", password="testpass123")
+        r = self.client.get(reverse("device-logs-csv", kwargs={"pk": self.device.id}))
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        self.assertIn("device_devlogs123456_logs.csv", r["Content-Disposition"])
+        lines = b"".join(r.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "timestamp,level,message")
+        self.assertTrue(lines[1].endswith(',2,"newer, with comma"'))
+        self.assertTrue(lines[2].endswith(",1,older"))
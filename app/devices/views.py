@@ -5,6 +5,7 @@ import zipfile
 from collections import Counter, defaultdict
 from datetime import timedelta
 import csv
+import itertools
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.template.response import TemplateResponse
@@ -23,21 +24,33 @@ from django.core.paginator import Paginator
 from django.db import transaction
 from django.contrib import messages
 
-from .models import Device, DeviceStatus, DeviceLogs, Measurement, Values
+from .models import Device, DeviceStatus, DeviceLogs, Measurement, Values, ValuesDayRollup
+from .latest_values import rebuild_latest_values
+from .packed_values import distinct_dimensions
+from .rollups import chart_series, rebuild_rollups
 from accounts.models import CustomUser
 from .forms import DeviceForm, DeviceNotesForm, DeviceApikeyForm
 from .luftdaten_station_apikey import StationApikeySyncError, sync_station_apikey
 from main.enums import SensorModel, Dimension, LdProduct
+from main.streaming import streaming_response
 from organizations.models import Organization
+from campaign.cache import invalidate_room_current_values
 from campaign.models import Room
-from workshops.models import Workshop
+from workshops.cache import invalidate_workshop_data
+from workshops.models import Workshop, WorkshopSpot
+from workshops.spot_stats import recompute_spots
 from api.models import AirQualityRecord
-from django.db.models import Count, Min, Max, Q, OuterRef, Subquery
-from django.db.models.functions import Length
+from django.db.models import Count, Exists, Min, Max, Prefetch, Q, OuterRef, Subquery
+from django.db.models.functions import Greatest, Length
 
 
 logger = logging.getLogger('myapp')
 
+# measurement chart of the device detail page: hourly means of 30 days, read from the hour rollups
+DEVICE_CHART_RANGE = timedelta(days=30)
+DEVICE_CHART_BUCKET = timedelta(hours=1)
+DEVICE_CHART_DIMENSIONS = (Dimension.PM2_5, Dimension.PM10_0, Dimension.TEMPERATURE, Dimension.HUMIDITY, Dimension.CO2)
+
 
 def air_station_sensor_names(device):
     """
@@ -113,7 +126,8 @@ class DeviceListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
             .annotate(id_len=Length('id'))
             .filter(id_len__gte=15)
             .select_related('current_organization')
-            .annotate(latest_status_time=Subquery(latest_status.values('time_received')[:1]))
+            # last_seen is only bumped by requests that did not record a DeviceStatus row
+            .annotate(latest_status_time=Greatest('last_seen', Subquery(latest_status.values('time_received')[:1])))
             .order_by('id')
         )
 
@@ -211,6 +225,18 @@ class DeviceDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
             context['battery_times'] = json.dumps(battery_times, cls=DjangoJSONEncoder)
             context['battery_charges'] = json.dumps(battery_charges, cls=DjangoJSONEncoder)
             context['battery_voltages'] = json.dumps(battery_voltages, cls=DjangoJSONEncoder)
+
+        chart = chart_series(
+            [device.pk], DEVICE_CHART_DIMENSIONS, DEVICE_CHART_RANGE, DEVICE_CHART_BUCKET, label_format='%d.%m. %H:00'
+        )
+        context['measurement_chart'] = {
+            'labels': chart.labels,
+            'datasets': [
+                {'label': f'{Dimension.get_name(dimension)} ({Dimension.get_unit(dimension)})', 'data': data}
+                for dimension, data in zip(DEVICE_CHART_DIMENSIONS, chart.data)
+                if any(data)
+            ],
+        }
         
         # query changes
         organization_changes = device.history.filter(changes__icontains = '"current_organization"').all().order_by('-timestamp')
@@ -306,9 +332,9 @@ class DeviceDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
         }
 
         sensors = defaultdict(list)
-        # add available sensors
-        q = Measurement.objects.filter(device=device, time_measured=device.last_update).all()
-        if not q:
+        # add available sensors: the latest values of the last reading, one lookup (devices.latest_values)
+        latest_values = device.latest_values.filter(time_measured=device.last_update).order_by('sensor_model', 'dimension')
+        if not latest_values:
             try:
                 status = device.status_list.filter(sensor_list__isnull=False).latest('time_received')
             except DeviceStatus.DoesNotExist:
@@ -317,9 +343,8 @@ class DeviceDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
                 for data in status.sensor_list:
                     sensors[SensorModel.get_sensor_name(data['model_id'])].extend(Dimension.get_name(dim) for dim in data['dimension_list'])
         else:
-            for measurement in q:
-                for value in measurement.values.all():
-                    sensors[SensorModel.get_sensor_name(measurement.sensor_model)].append(Dimension.get_name(value.dimension))
+            for latest in latest_values:
+                sensors[SensorModel.get_sensor_name(latest.sensor_model)].append(Dimension.get_name(latest.dimension))
 
         context['sensors'] = dict(sensors)
 
@@ -367,8 +392,28 @@ class DeviceMoveMeasurementsView(LoginRequiredMixin, UserPassesTestMixin, View):
             return HttpResponseRedirect(reverse("device-data", kwargs={"pk": source.pk}))
 
         with transaction.atomic():
+            moved_range = Measurement.objects.filter(device=source).aggregate(
+                first=Min("time_measured"), last=Max("time_measured")
+            )
+            # (device, time_measured, sensor_model) is unique: the target's rows win on overlap
+            overlapping = Measurement.objects.filter(
+                device=target,
+                time_measured=OuterRef("time_measured"),
+                sensor_model=OuterRef("sensor_model"),
+            )
+            Measurement.objects.filter(device=source).filter(Exists(overlapping)).delete()
+            workshop_ids = set(
+                Measurement.objects.filter(device=source, workshop__isnull=False)
+                .values_list("workshop_id", flat=True).distinct()
+            )
             Measurement.objects.filter(device=source).update(device=target)
             AirQualityRecord.objects.filter(device=source).update(device=target)
+            invalidate_workshop_data(*workshop_ids)
+            # overlapping source measurements were deleted
+            recompute_spots(WorkshopSpot.objects.filter(workshop_id__in=workshop_ids).values_list("pk", flat=True))
+            if moved_range["first"] is not None:
+                rebuild_rollups(moved_range["first"], moved_range["last"], device_ids=[source.pk, target.pk])
+                rebuild_latest_values([source.pk, target.pk])
 
         logger.info(
             "measurements_moved user=%s source=%s target=%s measurements=%s aqr=%s",
@@ -479,7 +524,7 @@ class DeviceDataView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
             dimensions_used = set()
             for measurement in measurements:
                 sensors_used.add(measurement.sensor_model)
-                for value in measurement.values.all():
+                for value in measurement.get_values():
                     dimensions_used.add(value.dimension)
 
             # Get dimensions from AirQualityRecord (they have pm1, pm25, pm10, temperature, humidity, etc.)
@@ -615,17 +660,16 @@ class DeviceMeasurementsView(LoginRequiredMixin, UserPassesTestMixin, DetailView
         sensors = [(sid, SensorModel.get_sensor_name(sid)) for sid in sorted(sensor_ids)]
 
         # Get dimensions (from filtered set for correct columns)
-        all_dim_ids = set(
-            Values.objects.filter(measurement__in=measurements_qs)
-            .values_list('dimension', flat=True)
-            .distinct()
-        )
+        all_dim_ids = set()
+        if filter_workshop or filter_participant or filter_sensor_id is not None:
+            all_dim_ids = distinct_dimensions(measurements_qs)
         if not all_dim_ids:
+            # the device's day rollups hold every dimension and are far smaller than its Values
             all_dim_ids = set(
-                Values.objects.filter(measurement__device=device)
+                ValuesDayRollup.objects.filter(device=device)
                 .values_list('dimension', flat=True)
                 .distinct()
-            )
+            ) or distinct_dimensions(Measurement.objects.filter(device=device))
         dimension_names = {d: Dimension.get_name(d) for d in all_dim_ids}
         common_dims = [
             Dimension.PM1_0, Dimension.PM2_5, Dimension.PM10_0,
@@ -642,7 +686,7 @@ class DeviceMeasurementsView(LoginRequiredMixin, UserPassesTestMixin, DetailView
 
         table_rows = []
         for m in measurements:
-            values_dict = {v.dimension: (v.value, Dimension.get_unit(v.dimension)) for v in m.values.all()}
+            values_dict = {v.dimension: (v.value, Dimension.get_unit(v.dimension)) for v in m.get_values()}
             table_rows.append({
                 'measurement': m,
                 'values': values_dict,
@@ -689,7 +733,16 @@ class MeasurementDeleteView(LoginRequiredMixin, UserPassesTestMixin, View):
     def post(self, request, pk, measurement_pk):
         device = get_object_or_404(Device, pk=pk)
         measurement = get_object_or_404(Measurement, pk=measurement_pk, device=device)
-        measurement.delete()
+        with transaction.atomic():
+            measurement.delete()
+            rebuild_rollups(measurement.time_measured, measurement.time_measured, device_ids=[device.pk])
+            rebuild_latest_values([device.pk])
+            if measurement.workshop_id:
+                invalidate_workshop_data(measurement.workshop_id)
+                recompute_spots(
+                    WorkshopSpot.objects.filter(workshop_id=measurement.workshop_id).values_list("pk", flat=True)
+                )
+            invalidate_room_current_values(measurement.room_id)
         messages.success(request, _('Measurement deleted.'))
         next_url = request.POST.get('next') or reverse('device-measurements', kwargs={'pk': device.pk})
         return HttpResponseRedirect(next_url)
@@ -914,25 +967,19 @@ class DeviceDataDownloadView(LoginRequiredMixin, UserPassesTestMixin, View):
                     "value",
                 ]
             )
-            for v in (
-                Values.objects.filter(measurement__device=device)
-                .select_related(
-                    "measurement",
-                    "measurement__workshop",
-                    "measurement__participant",
-                    "measurement__mode",
-                    "measurement__location",
-                    "measurement__room",
-                    "measurement__user",
-                )
-                .order_by("measurement__time_measured", "measurement__id", "id")
+            measurements = (
+                Measurement.objects.filter(device=device)
+                .select_related("workshop")
+                .prefetch_related(Prefetch("values", queryset=Values.objects.order_by("id")))
+                .order_by("time_measured", "id")
                 .iterator(chunk_size=2000)
-            ):
-                m = v.measurement
+            )
+            # packed values (devices.packed_values) have no value_id
+            for m, v in ((m, v) for m in measurements for v in m.get_values()):
                 wname = m.workshop.name if m.workshop else ""
                 m_writer.writerow(
                     [
-                        v.id,
+                        _csv_value(v.id),
                         m.id,
                         _csv_value(m.time_received),
                         _csv_value(m.time_measured),
@@ -1025,6 +1072,13 @@ class DeviceDataDownloadView(LoginRequiredMixin, UserPassesTestMixin, View):
         return response
 
 
+class _Echo:
+    """File-like object for csv.writer that returns each row instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
 # View to export DeviceLogs for a given Device as CSV
 class DeviceLogsCSVView(LoginRequiredMixin, UserPassesTestMixin, View):
     """
@@ -1037,24 +1091,25 @@ class DeviceLogsCSVView(LoginRequiredMixin, UserPassesTestMixin, View):
     def get(self, request, pk, *args, **kwargs):
         # Fetch the device or return 404
         device = get_object_or_404(Device, pk=pk)
-        # Query all logs for this device, ordered by timestamp descending
-        logs = DeviceLogs.objects.filter(device=device).order_by('-timestamp')
+        # Query all logs for this device, ordered by timestamp descending; rows are read in chunks
+        # from a server-side cursor and streamed, so large logs never sit in memory
+        logs = (
+            DeviceLogs.objects.filter(device=device)
+            .order_by('-timestamp')
+            .values_list('timestamp', 'level', 'message')
+            .iterator(chunk_size=2000)
+        )
 
-        # Prepare HTTP response with CSV content
-        response = HttpResponse(content_type='text/csv')
+        writer = csv.writer(_Echo())
+        rows = itertools.chain(
+            [writer.writerow(['timestamp', 'level', 'message'])],
+            (
+                writer.writerow([timestamp.strftime('%Y-%m-%d %H:%M:%S'), level, message])
+                for timestamp, level, message in logs
+            ),
+        )
+        response = streaming_response(request, rows, 'text/csv')
         response['Content-Disposition'] = f'attachment; filename="device_{device.id}_logs.csv"'
-
-        writer = csv.writer(response)
-        # Write header
-        writer.writerow(['timestamp', 'level', 'message'])
-        # Write log rows
-        for log in logs:
-            writer.writerow([
-                log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                log.level,
-                log.message
-            ])
-
         return response
 
 
@@ -172,6 +172,14 @@ DATABASES = {
     }
 }
 
+# Cache
+# Workshop data responses are cached here (workshops/cache.py). The default is per process; with
+# several workers use a shared backend, e.g. CACHE_URL=dbcache://django_cache (after
+# `manage.py createcachetable`) or CACHE_URL=redis://redis:6379/1.
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', default='locmem://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -303,6 +311,56 @@ LUFTDATEN_API_REQUEST_TIMEOUT = (15, 60)
 # Shared TTL (seconds) for cached JSON from Luftdaten API (e.g. statistics proxy, station/all list).
 LUFTDATEN_API_JSON_CACHE_TTL = 3600
 
+# Upper bound for readings in one POST /v1/devices/data/batch/ request (devices replaying an offline buffer).
+DEVICE_DATA_BATCH_MAX_READINGS = env.int("DEVICE_DATA_BATCH_MAX_READINGS", default=1000)
+# TTL (seconds) of the cached device row used to authenticate ingest requests (devices.identity).
+# Device.save() invalidates it; the TTL only bounds staleness for writes that bypass save().
+DEVICE_IDENTITY_CACHE_TTL = env.int("DEVICE_IDENTITY_CACHE_TTL", default=300)
+# DeviceStatus recording (devices.status_recording): "always" = one row per status/data request,
+# "changes" = only when battery moved beyond the deltas, sensor_list changed or the heartbeat elapsed.
+DEVICE_STATUS_RECORDING = env.str("DEVICE_STATUS_RECORDING", default="always")
+DEVICE_STATUS_BATTERY_VOLTAGE_DELTA = env.float("DEVICE_STATUS_BATTERY_VOLTAGE_DELTA", default=0.05)  # V
+DEVICE_STATUS_BATTERY_SOC_DELTA = env.float("DEVICE_STATUS_BATTERY_SOC_DELTA", default=2.0)  # %
+DEVICE_STATUS_HEARTBEAT_SECONDS = env.int("DEVICE_STATUS_HEARTBEAT_SECONDS", default=3600)
+# Ingest mode for POST /devices/data/ and /devices/status/ (devices.ingest_buffer): "sync" writes in the
+# request, "buffered" stages requests in IngestBuffer for `manage.py flush_ingest_buffer --loop`.
+INGEST_MODE = env.str("INGEST_MODE", default="sync")
+INGEST_BUFFER_HIGH_WATER_MARK = env.int("INGEST_BUFFER_HIGH_WATER_MARK", default=100000)  # rows; above: 503
+INGEST_BUFFER_RETRY_AFTER = env.int("INGEST_BUFFER_RETRY_AFTER", default=60)  # seconds, Retry-After header
+INGEST_BUFFER_DEPTH_CACHE_SECONDS = 5
+# failed flushes per buffered request before it is kept as a dead letter (`flush_ingest_buffer --retry-failed`)
+INGEST_BUFFER_MAX_ATTEMPTS = env.int("INGEST_BUFFER_MAX_ATTEMPTS", default=5)
+# Workshop JSON Trip imports (workshops.trip_import): processed in a background thread after upload, or inline
+# (tests). Imports left pending or running by a restarted worker are picked up by `manage.py run_workshop_imports`.
+WORKSHOP_IMPORT_INLINE = env.bool("WORKSHOP_IMPORT_INLINE", default=TESTING)
+WORKSHOP_IMPORT_BATCH_SIZE = env.int("WORKSHOP_IMPORT_BATCH_SIZE", default=2000)  # data points per transaction
+# seconds; `run_workshop_imports` restarts imports still marked running this long after they started (their worker
+# was restarted or recycled mid-import)
+WORKSHOP_IMPORT_STALE_AFTER = env.int("WORKSHOP_IMPORT_STALE_AFTER", default=3600)
+# Location rows of measurements (devices.locations): "per_reading" creates one per located reading, "dedupe"
+# shares one row per position. Run `manage.py dedupe_locations` after switching to "dedupe".
+LOCATION_STORAGE = env.str("LOCATION_STORAGE", default="per_reading")
+# Values of new measurements (devices.packed_values): "rows" stores one Values row per dimension, "packed" keeps
+# them as arrays in the measurement row. Run `manage.py pack_values` to convert existing rows.
+VALUES_STORAGE = env.str("VALUES_STORAGE", default="rows")
+# Retention of device logs, status rows and Values rollups, applied by `manage.py apply_retention`
+# (devices.retention): matching rows older than keep_days are deleted, or with "downsample" thinned to the newest
+# row per device and hour/day. DeviceLogs levels: 0 debug, 1 info, 2 warning, 3 error, 4 critical.
+RETENTION_POLICIES = [
+    {"model": "devices.DeviceLogs", "filter": {"level": 0}, "keep_days": 14},
+    {"model": "devices.DeviceLogs", "filter": {"level": 1}, "keep_days": 180},
+    {"model": "devices.DeviceStatus", "keep_days": 30, "downsample": "hour"},
+    # hour buckets serve the 30-day device chart; day buckets the long ranges
+    {"model": "devices.ValuesHourRollup", "keep_days": 400},
+    {"model": "devices.ValuesDayRollup", "keep_days": 3650},
+]
+# Workshop data responses are streamed; the encoded JSON is cached only up to this size (bytes).
+WORKSHOP_DATA_CACHE_MAX_BYTES = env.int("WORKSHOP_DATA_CACHE_MAX_BYTES", default=32 * 1024 * 1024)
+# Responses with a workshop data cursor leave out rows inserted within this many seconds (api.workshop_data), so
+# rows of a transaction that commits after the cursor was handed out are not skipped. Must exceed the longest
+# ingest flush / import batch transaction.
+WORKSHOP_DATA_CURSOR_LAG = env.int("WORKSHOP_DATA_CURSOR_LAG", default=60)
+
 # GeoSphere Austria Dataset API (chem forecast overlay on home map; CC-BY 4.0).
 GEOSPHERE_DATASET_API_BASE = "https://dataset.api.hub.geosphere.at/v1"
 GEOSPHERE_CHEM_FORECAST_RESOURCE_ID = "chem-v2-1h-3km"
@@ -0,0 +1,61 @@
+"""
+Streaming responses that stay streamed under ASGI (uvicorn in production) as well as WSGI.
+
+Django serves a synchronous iterator under ASGI by consuming it completely first, so neither
+memory stays bounded nor does the first byte go out early. :func:`streaming_response` therefore
+passes an asynchronous iterator when the request came in through ASGI, which pulls one chunk at a
+time from the synchronous ``chunks`` in the request's sync thread (database cursors stay on their
+connection). ``on_close`` runs when the response is closed, i.e. also when the client disconnected
+before the first chunk was read.
+"""
+from __future__ import annotations
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+_END = object()
+
+
+class _Chunks:
+    """``chunks`` for StreamingHttpResponse; ``close()`` closes them and runs ``on_close`` once."""
+
+    def __init__(self, chunks, on_close=None):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self):
+        try:
+            yield from self._chunks
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        on_close, self._on_close = self._on_close, None
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+        if on_close is not None:
+            on_close()
+
+
+class _AsyncChunks(_Chunks):
+    def __iter__(self):
+        raise TypeError("iterate asynchronously")
+
+    async def __aiter__(self):
+        chunks = iter(self._chunks)
+        try:
+            while (chunk := await sync_to_async(next, thread_sensitive=True)(chunks, _END)) is not _END:
+                yield chunk
+        finally:
+            await sync_to_async(self.close, thread_sensitive=True)()
+
+
+def is_asgi(request) -> bool:
+    # ASGIRequest (also behind a DRF Request, which proxies attributes) carries the ASGI scope
+    return hasattr(request, "scope")
+
+
+def streaming_response(request, chunks, content_type: str, on_close=None) -> StreamingHttpResponse:
+    """StreamingHttpResponse of the byte/str iterable ``chunks``, asynchronous under ASGI."""
+    wrapper = _AsyncChunks if is_asgi(request) else _Chunks
+    return StreamingHttpResponse(wrapper(chunks, on_close), content_type=content_type)
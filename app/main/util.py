@@ -1,27 +1,25 @@
-import numpy as np
 import logging
-from django.db import connection
 from django.core.exceptions import PermissionDenied
-from django.db.models import Max
 from django.contrib.gis.geos import Point
 from PIL import Image, UnidentifiedImageError
 from PIL.ExifTags import TAGS
-from datetime import datetime, timezone
-from collections import defaultdict
+from datetime import datetime
 import pytz
 import time
 import pyproj
 
-from devices.models import Device, DeviceStatus
+from devices.identity import authenticate_device
+from devices.latest_values import latest_means, latest_means_by
+from devices.status_recording import record_device_status
 from workshops.models import Workshop, WorkshopImage
-from main.enums import SensorModel, Dimension
+from main.enums import Dimension
 from api.models import Location
 
 
 logger = logging.getLogger('myapp')
 
 
-def get_or_create_station(station_info: dict):
+def get_or_create_station(station_info: dict, sensor_list=None):
     '''
     station_info dict: 
     {
@@ -42,90 +40,52 @@ def get_or_create_station(station_info: dict):
         ]
     }
 
-    creates a station_status entry with the information in station_info
+    authenticates the station (devices.identity: cached lookup, wrong api key raises
+    ValidationError before anything is written) and records a station_status entry
+    with the information in station_info (devices.status_recording: depending on
+    DEVICE_STATUS_RECORDING only when it differs from the last one).
+    sensor_list overrides station_info['sensor_list'] (e.g. merged with a sensor scan).
 
-    return: (Device, DeviceStatus) — the device row and the newly created status row.
+    return: (Device, DeviceStatus | None) — the device row and the new status row, or None if
+    the status was coalesced into the previous one.
     '''
-    station, created = Device.objects.get_or_create(
-        id = station_info['device']
+    station = authenticate_device(station_info)
+
+    battery = station_info.get('battery') or {}
+    station_status = record_device_status(
+        station,
+        battery_voltage = battery.get('voltage', None),
+        battery_soc = battery.get('percentage', None),
+        sensor_list = station_info.get('sensor_list', None) if sensor_list is None else sensor_list,
     )
-    if created:
-        station.model = station_info['model']
-        station.firmware = station_info['firmware']
-        station.api_key = station_info['apikey']
-
-    # add a new DeviceStatus
-    station_status = DeviceStatus.objects.create(
-        time_received = datetime.now(timezone.utc),
-        device = station,
-        battery_voltage = station_info.get('battery', {}).get('voltage', None),
-        battery_soc = station_info.get('battery', {}).get('percentage', None),
-        sensor_list = station_info.get('sensor_list', None)
-    )
-
-    # update firmware field
-    station.firmware = station_info['firmware']
-    station.model = station_info['model']
-    
-    station.save()
-    station_status.save()
 
     return station, station_status
 
 
-def room_calculate_current_values(room):
-        max_time_measured_per_device = room.measurements.values('device').annotate(max_time_measured=Max('time_measured'))
-        measurements = []
-        for entry in max_time_measured_per_device:
-            measurements.extend(room.measurements.filter(device = entry['device'], time_measured = entry['max_time_measured']).all())
-
-        def get_current_mean(dimension):
-            """
-            Gibt den Durchschnittswert über alle neuesten Measurements für eine gegebene Dimension zurück.
-            Wenn keine Werte vorliegen, wird None zurückgegeben.
-            """
-            # Für jedes Measurement sammeln wir alle Values der gesuchten Dimension
-            # und bilden einen Mittelwert für dieses Measurement.
-            # Anschließend bilden wir aus diesen Mittelwerten den Gesamtmittelwert.
-            measurement_means = []
-            for m in measurements:
-                dim_values = [val.value for val in m.values.all() if val.dimension == dimension]
-                if dim_values:  # Nur wenn tatsächlich Werte vorhanden sind
-                    measurement_means.append(np.mean(dim_values))
-
-            # Falls keine Werte gefunden, None zurückgeben
-            if measurement_means:
-                return np.mean(measurement_means)
-            return None
+# dimensions of the room current value cards
+ROOM_CURRENT_DIMENSIONS = (Dimension.ADJUSTED_TEMP_CUBE, Dimension.TEMPERATURE, Dimension.PM2_5, Dimension.CO2, Dimension.TVOC)
 
-        # Temperatur
-        measurements_adjusted_temp_cube = [
-            value.value 
-            for m in measurements
-                if m.sensor_model == SensorModel.VIRTUAL_SENSOR
-                    for value in m.values.all()
-                        if value.dimension == Dimension.ADJUSTED_TEMP_CUBE
-        ]
 
-        current_temperature = None
+def _room_current_values(means):
+        # Temperatur
         # use ADJUSTED_TEMP_CUBE if found
-        if measurements_adjusted_temp_cube:
-            current_temperature = measurements_adjusted_temp_cube[0]
+        if means[Dimension.ADJUSTED_TEMP_CUBE] is not None:
+            current_temperature = means[Dimension.ADJUSTED_TEMP_CUBE]
             temperature_color = Dimension.get_color(Dimension.ADJUSTED_TEMP_CUBE, current_temperature) if current_temperature else None
         else:
-            current_temperature = get_current_mean(Dimension.TEMPERATURE)
+            current_temperature = means[Dimension.TEMPERATURE]
             temperature_color = Dimension.get_color(Dimension.TEMPERATURE, current_temperature) if current_temperature else None
 
         # PM2.5
-        current_pm2_5 = get_current_mean(Dimension.PM2_5)
+        current_pm2_5 = means[Dimension.PM2_5]
         pm2_5_color = Dimension.get_color(Dimension.PM2_5, current_pm2_5) if current_pm2_5 else None
 
         # CO2
-        current_co2 = get_current_mean(Dimension.CO2)
+        current_co2 = means[Dimension.CO2]
         co2_color = Dimension.get_color(Dimension.CO2, current_co2) if current_co2 else None
 
         # VOC Index
-        current_tvoc = get_current_mean(Dimension.TVOC)
+        current_tvoc = means[Dimension.TVOC]
         tvoc_color = Dimension.get_color(Dimension.TVOC, current_tvoc) if current_tvoc else None
 
         return [
@@ -139,6 +99,29 @@ def room_calculate_current_values(room):
             tvoc_color
         ]
 
+
+def room_calculate_current_values(room):
+        """
+        Current temperature, PM2.5, CO2 and TVOC of a room with their colors, as
+        [value, color, ...]: means over the latest values of the room's devices
+        (devices.latest_values, one query). The temperature is the adjusted one
+        of the virtual sensor where available.
+        """
+        return _room_current_values(latest_means(ROOM_CURRENT_DIMENSIONS, room=room))
+
+
+def campaign_room_current_values(campaign):
+        """
+        {room pk: room_calculate_current_values(room)} for all rooms of a campaign,
+        with one query for the rooms and one for the values of all of them.
+        """
+        means = latest_means_by('room', ROOM_CURRENT_DIMENSIONS, room__campaign=campaign)
+        empty = dict.fromkeys(ROOM_CURRENT_DIMENSIONS)
+        return {
+            room_pk: _room_current_values(means.get(room_pk, empty))
+            for room_pk in campaign.rooms.values_list('pk', flat=True)
+        }
+
 def workshop_add_image(file, workshop_id):
     '''
     returns true if the picture was added sucessfully
@@ -211,36 +194,3 @@ def workshop_add_image(file, workshop_id):
 
     # Picture was not added
     return False
-
-
-def get_avg_temp_per_spot(workshop_id):
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT ws.id, AVG(v.value)
-            FROM devices_measurement AS m
-            INNER JOIN api_location l ON l.id = m.location_id
-            INNER JOIN devices_values v ON v.measurement_id = m.id
-            INNER JOIN workshops_workshopspot ws 
-                ON ST_Within(l.coordinates, ws.area) 
-                AND ws.workshop_id = m.workshop_id
-            WHERE m.workshop_id = %s
-              AND v.dimension = 7
-            GROUP BY ws.id
-        """, [workshop_id])
-        d1 = cursor.fetchall()
-        cursor.execute("""
-            select ws.id, avg(aqr.temperature)
-            from api_airqualityrecord as aqr
-            inner join api_location l on l.id = aqr.location_id
-            inner join workshops_workshopspot ws
-                on ST_Within(l.coordinates, ws.area)
-                and ws.workshop_id = aqr.workshop_id
-            where aqr.workshop_id = %s
-            group by ws.id;
-        """, [workshop_id])
-        d2 = cursor.fetchall()
-        d = defaultdict(list)
-        for k, v in d1: d[k].append(v)
-        for k, v in d2: d[k].append(v)
-        res = [(k,np.mean(v)) for k,v in d.items()]
-        return res
@@ -0,0 +1,63 @@
+// Decoder for GET /api/v1/workshops/<pk>/data/?format=binary (api/workshop_data.py, ColumnarBuilder.to_binary).
+//
+// Layout: "LDWD", uint8 version, 3 padding bytes, uint32 header length, JSON header, data block.
+// Every column is a little-endian typed array at header.columns[i].offset within the data block;
+// missing values are NaN, device/participant/mode/display_name are indexes into header.dictionaries.
+(function (global) {
+    const TYPES = {
+        uint16: Uint16Array,
+        uint32: Uint32Array,
+        float32: Float32Array,
+        float64: Float64Array,
+    };
+    const DICTIONARY_COLUMNS = ["device", "participant", "mode", "display_name"];
+
+    function decodeWorkshopData(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(
+            view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3)
+        );
+        if (magic !== "LDWD" || view.getUint8(4) !== 1) {
+            throw new Error("Unsupported workshop data format");
+        }
+        const headerLength = view.getUint32(8, true);
+        const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+        const dataStart = 12 + headerLength;
+
+        const columns = {};
+        for (const column of header.columns) {
+            // views, no copy: offsets are aligned to 8 bytes by the server
+            columns[column.name] = new TYPES[column.type](buffer, dataStart + column.offset, header.count);
+        }
+        return {
+            count: header.count,
+            cursor: header.cursor,
+            dictionaries: header.dictionaries,
+            columns: columns,
+        };
+    }
+
+    // Row objects in the shape of the default JSON response (time as ISO string, null for NaN).
+    function workshopDataRows(decoded) {
+        const rows = new Array(decoded.count);
+        const names = Object.keys(decoded.columns);
+        for (let i = 0; i < decoded.count; i++) {
+            const row = {};
+            for (const name of names) {
+                const value = decoded.columns[name][i];
+                if (name === "time") {
+                    row.time = new Date(value * 1000).toISOString();
+                } else if (DICTIONARY_COLUMNS.includes(name)) {
+                    row[name] = decoded.dictionaries[name][value];
+                } else {
+                    row[name] = Number.isNaN(value) ? null : value;
+                }
+            }
+            rows[i] = row;
+        }
+        return rows;
+    }
+
+    global.decodeWorkshopData = decodeWorkshopData;
+    global.workshopDataRows = workshopDataRows;
+})(window);
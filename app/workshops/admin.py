@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Participant, Workshop
+from .models import Participant, Workshop, WorkshopImport
 
 class WorkshopAdmin(admin.ModelAdmin):
     list_display = ('title', 'name', 'start_date')
@@ -10,4 +10,10 @@ admin.site.register(Workshop, WorkshopAdmin)
 class ParticipantAdmin(admin.ModelAdmin):
     list_display = ('name', 'workshop')
 
-admin.site.register(Participant, ParticipantAdmin)
\ No newline at end of file
+admin.site.register(Participant, ParticipantAdmin)
+
+class WorkshopImportAdmin(admin.ModelAdmin):
+    list_display = ('workshop', 'status', 'created_at', 'created_count', 'skipped_count', 'error_count')
+    list_filter = ('status',)
+
+admin.site.register(WorkshopImport, WorkshopImportAdmin)
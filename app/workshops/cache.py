@@ -0,0 +1,139 @@
+"""
+Cache of workshop data responses (GET workshops/<pk>/data/).
+
+Entries are keyed by a per-workshop generation counter: every write that touches a workshop's
+data calls :func:`invalidate_workshop_data`, which bumps the counter, so all cached variants
+(json/columnar/binary) of the old generation become unreachable at once and simply expire.
+With a shared ``CACHE_URL`` backend this holds across all workers.
+
+A miss is rebuilt by one request only (:func:`get_or_lock`): the first caller takes a short
+rebuild lock with ``cache.add``, the others wait for its result instead of running the same
+pivot queries concurrently. The lock is released as soon as the result is cached; a result too
+large for the cache is remembered as uncacheable (:meth:`RebuildLock.release_uncacheable`), so
+later requests for that generation build it right away instead of waiting for a lock.
+"""
+from __future__ import annotations
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+DATA_TIMEOUT = 900
+# finished workshops rarely change; still finite, so entries of old generations expire
+FINISHED_DATA_TIMEOUT = 24 * 3600
+# finite, so counters of workshop ids that were only requested (e.g. unknown names, checked after the cache
+# lookup) do not pile up; an expired counter restarts above every earlier generation, a miss at worst
+GENERATION_TIMEOUT = 2 * FINISHED_DATA_TIMEOUT
+REBUILD_LOCK_TIMEOUT = 60
+REBUILD_WAIT_SECONDS = 10.0
+REBUILD_POLL_SECONDS = 0.1
+
+
+def _generation_key(workshop_id: str) -> str:
+    return f"workshop_data_generation_{workshop_id}"
+
+
+def _new_generation() -> int:
+    # a counter that was evicted restarts above every generation used before
+    return time.time_ns() // 1000
+
+
+def workshop_data_generation(workshop_id: str) -> int:
+    key = _generation_key(workshop_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), GENERATION_TIMEOUT)
+        generation = cache.get(key)
+    return generation
+
+
+def workshop_data_key(workshop_id: str, variant: str = "json") -> str:
+    return f"workshop_data_{workshop_id}_{variant}_{workshop_data_generation(workshop_id)}"
+
+
+def _bump(workshop_ids) -> None:
+    for workshop_id in {w for w in workshop_ids if w}:
+        key = _generation_key(workshop_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # no counter yet (nothing cached) or evicted
+            cache.set(key, _new_generation(), GENERATION_TIMEOUT)
+
+
+def invalidate_workshop_data(*workshop_ids) -> None:
+    """
+    Drop the cached data of ``workshop_ids``. Inside a transaction this happens on commit, so a
+    concurrent rebuild cannot cache the state before the write under the new generation.
+    """
+    transaction.on_commit(lambda: _bump(workshop_ids))
+
+
+def invalidate_device_workshop_data(device_id: str) -> None:
+    """
+    Drop the cached data of every workshop with readings of ``device_id``, e.g. after a rename
+    (the data shows device names). Legacy AirQualityRecord rows of the uncorrected upload id
+    show this device's name as well.
+    """
+    from api.models import AirQualityRecord
+    from api.workshop_data import uncorrected_device_id
+    from devices.models import Measurement
+
+    record_device_ids = [d for d in (device_id, uncorrected_device_id(device_id)) if d]
+    workshop_ids = set(
+        Measurement.objects.filter(device_id=device_id, workshop__isnull=False)
+        .values_list("workshop_id", flat=True)
+        .distinct()
+    )
+    workshop_ids.update(
+        AirQualityRecord.objects.filter(device_id__in=record_device_ids, workshop__isnull=False)
+        .values_list("workshop_id", flat=True)
+        .distinct()
+    )
+    invalidate_workshop_data(*workshop_ids)
+
+
+def _lock_key(key: str) -> str:
+    return f"{key}_rebuild"
+
+
+def _uncacheable_key(key: str) -> str:
+    return f"{key}_uncacheable"
+
+
+def get_or_lock(key: str):
+    """
+    ``(value, None)`` if ``key`` is cached (possibly after waiting for another rebuild), otherwise
+    ``(None, lock)``: the caller rebuilds and must call ``lock.release()`` once the result is cached
+    (or ``lock.release_uncacheable()`` if it is too large). ``lock`` is not held when the result is
+    known to be uncacheable or the wait timed out; the caller rebuilds without it then.
+    """
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while True:
+        values = cache.get_many([key, _uncacheable_key(key)])
+        if key in values:
+            return values[key], None
+        if _uncacheable_key(key) in values:
+            return None, RebuildLock(key, held=False)
+        if cache.add(_lock_key(key), 1, REBUILD_LOCK_TIMEOUT):
+            return None, RebuildLock(key)
+        if time.monotonic() >= deadline:
+            return None, RebuildLock(key, held=False)
+        time.sleep(REBUILD_POLL_SECONDS)
+
+
+class RebuildLock:
+    def __init__(self, key: str, held: bool = True):
+        self._key = key
+        self._held = held
+
+    def release(self) -> None:
+        if self._held:
+            cache.delete(_lock_key(self._key))
+            self._held = False
+
+    def release_uncacheable(self, timeout: int) -> None:
+        """The result will not be cached: let other requests build it without waiting for a lock."""
+        cache.set(_uncacheable_key(self._key), 1, timeout)
+        self.release()
@@ -0,0 +1,28 @@
+"""Rebuild the per-spot statistics (WorkshopSpotStat) from the stored readings."""
+from django.core.management.base import BaseCommand
+
+from workshops.models import WorkshopSpot
+from workshops.spot_stats import recompute_spots
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute workshop spot statistics from all stored readings, e.g. after measurements were deleted "
+        "or moved. New readings and new spots are kept up to date without this command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workshop",
+            action="append",
+            default=[],
+            help="Only the spots of this workshop (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        spots = WorkshopSpot.objects.all()
+        if options["workshop"]:
+            spots = spots.filter(workshop_id__in=options["workshop"])
+        spot_ids = list(spots.values_list("pk", flat=True))
+        recompute_spots(spot_ids)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed statistics of {len(spot_ids)} spots."))
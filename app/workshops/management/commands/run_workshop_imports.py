@@ -0,0 +1,42 @@
+"""Process workshop JSON Trip imports that were not (or not completely) processed after upload."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from workshops.models import WorkshopImport
+from workshops.trip_import import run_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending workshop data imports and restart running ones that started more than "
+        "WORKSHOP_IMPORT_STALE_AFTER seconds ago, e.g. after the web worker that received the upload was restarted. "
+        "Points stored by an interrupted run are skipped as duplicates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--include-running",
+            action="store_true",
+            help="Also restart recent imports that are marked as running (only if no worker is processing them).",
+        )
+
+    def handle(self, *args, **options):
+        running = Q(status=WorkshopImport.STATUS_RUNNING)
+        if not options["include_running"]:
+            stale = timezone.now() - timedelta(seconds=settings.WORKSHOP_IMPORT_STALE_AFTER)
+            running &= Q(started_at__isnull=True) | Q(started_at__lt=stale)
+        import_ids = list(
+            WorkshopImport.objects.filter(Q(status=WorkshopImport.STATUS_PENDING) | running)
+            .order_by("created_at").values_list("pk", flat=True)
+        )
+        for import_id in import_ids:
+            workshop_import = run_import(import_id)
+            self.stdout.write(
+                f"import {import_id} ({workshop_import.workshop_id}): {workshop_import.status}, "
+                f"{workshop_import.created_count} created, {workshop_import.skipped_count} skipped, "
+                f"{workshop_import.error_count} errors"
+            )
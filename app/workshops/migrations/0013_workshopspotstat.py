@@ -0,0 +1,60 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Fill the aggregates from the stored readings. Frozen SQL (workshops.spot_stats.recompute_spots at
+# the time of writing) that reads devices_values directly: the devices_measurement_values view and
+# the packed values do not exist yet at this point of the migration graph.
+POPULATE_SQL = """
+    INSERT INTO workshops_workshopspotstat (spot_id, dimension, total, count, minimum, maximum)
+    SELECT spot_id, dimension, SUM(value), COUNT(*), MIN(value), MAX(value)
+    FROM (
+        SELECT ws.id AS spot_id, v.dimension, v.value
+        FROM devices_measurement AS m
+        INNER JOIN api_location l ON l.id = m.location_id
+        INNER JOIN workshops_workshopspot ws
+            ON ws.workshop_id = m.workshop_id
+            AND ST_Within(l.coordinates, ws.area)
+        INNER JOIN devices_values v ON v.measurement_id = m.id
+        UNION ALL
+        SELECT ws.id AS spot_id, d.dimension, d.value
+        FROM api_airqualityrecord AS a
+        INNER JOIN api_location l ON l.id = a.location_id
+        INNER JOIN workshops_workshopspot ws
+            ON ws.workshop_id = a.workshop_id
+            AND ST_Within(l.coordinates, ws.area)
+        CROSS JOIN LATERAL (VALUES
+            (2, a.pm1), (3, a.pm25), (5, a.pm10), (7, a.temperature), (6, a.humidity), (8, a.voc), (9, a.nox)
+        ) AS d (dimension, value)
+        WHERE d.value IS NOT NULL
+    ) points
+    GROUP BY spot_id, dimension
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_location_coordinates_key'),
+        ('devices', '0034_ingestbuffer'),
+        ('workshops', '0012_workshopimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkshopSpotStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.IntegerField()),
+                ('total', models.FloatField()),
+                ('count', models.BigIntegerField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('spot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='workshops.workshopspot')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('spot', 'dimension'), name='workshop_spot_stat_uniq')],
+            },
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_location_key_height_protect'),
+        ('workshops', '0013_workshopspotstat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workshopimage',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='workshop_images', to='api.location'),
+        ),
+    ]
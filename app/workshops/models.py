@@ -84,7 +84,7 @@ class Participant(models.Model):
 class WorkshopImage(models.Model):
     workshop = models.ForeignKey('Workshop', on_delete=models.CASCADE, related_name='workshop_images')
     image = models.ImageField(upload_to='workshop_images/')
-    location = models.ForeignKey('api.Location', on_delete=models.CASCADE, related_name='workshop_images')
+    location = models.ForeignKey('api.Location', on_delete=models.PROTECT, related_name='workshop_images')
     time_created = models.DateTimeField(null=True)
 
 
@@ -98,6 +98,75 @@ class WorkshopSpot(models.Model):
     history = AuditlogHistoryField()
 
 
+class WorkshopSpotStat(models.Model):
+    """
+    Running sum/count/min/max of one dimension over the readings inside a WorkshopSpot.
+    Updated as readings are stored and rebuilt when the spot is created (workshops.spot_stats),
+    so listing spots needs no spatial join.
+    """
+    spot = models.ForeignKey('WorkshopSpot', on_delete=models.CASCADE, related_name='stats')
+    dimension = models.IntegerField()
+    total = models.FloatField()
+    count = models.BigIntegerField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['spot', 'dimension'], name='workshop_spot_stat_uniq'),
+        ]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class WorkshopImport(models.Model):
+    """
+    Upload of a "Luftdaten.at JSON Trip" export, processed outside the request
+    (workshops.trip_import). Counters are updated after every batch so the workshop
+    page can show progress.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    workshop = models.ForeignKey('Workshop', on_delete=models.CASCADE, related_name='imports')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    file = models.FileField(upload_to='workshop_imports/', blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    device = models.ForeignKey(Device, on_delete=models.SET_NULL, null=True, blank=True)
+    total_count = models.IntegerField(null=True, blank=True)
+    processed_count = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    skipped_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    # first few error messages (see trip_import.MAX_STORED_ERRORS)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Import {self.pk} for Workshop {self.workshop_id} ({self.status})'
+
+    @property
+    def progress_percent(self):
+        if not self.total_count:
+            return 100 if self.status == self.STATUS_DONE else 0
+        return min(100, int(100 * self.processed_count / self.total_count))
+
+
 auditlog.register(Workshop) 
 auditlog.register(Participant)
 auditlog.register(WorkshopInvitation)
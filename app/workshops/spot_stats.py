@@ -0,0 +1,117 @@
+"""
+Per-spot aggregates (WorkshopSpotStat) of every dimension, maintained incrementally.
+
+Stored readings are matched against the spots of their workshop once, when they are written
+(:func:`add_measurements`, :func:`add_air_quality_records`), and added to the running
+sum/count/min/max with one upsert. A new spot is filled from the existing readings with
+:func:`recompute_spots`, which is also the repair path after readings were deleted
+(``manage.py recompute_spot_stats``). Listing spots then reads one row per spot and dimension.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from api.workshop_grid import AIR_QUALITY_RECORD_DIMENSIONS
+from main import enums
+
+from .models import WorkshopSpotStat
+
+# AirQualityRecord columns as (dimension, value) pairs
+_AIR_QUALITY_RECORD_VALUES = ", ".join(
+    f"({enums.AQR_DIMENSION_MAP[column]}, a.{column})" for column in AIR_QUALITY_RECORD_DIMENSIONS
+)
+
+_MEASUREMENT_STATS_SQL = """
+    SELECT ws.id AS spot_id, v.dimension, v.value
+    FROM devices_measurement AS m
+    INNER JOIN api_location l ON l.id = m.location_id
+    INNER JOIN workshops_workshopspot ws
+        ON ws.workshop_id = m.workshop_id
+        AND ST_Within(l.coordinates, ws.area)
+    INNER JOIN devices_measurement_values v ON v.measurement_id = m.id
+    WHERE {where}
+"""
+
+_AIR_QUALITY_RECORD_STATS_SQL = f"""
+    SELECT ws.id AS spot_id, d.dimension, d.value
+    FROM api_airqualityrecord AS a
+    INNER JOIN api_location l ON l.id = a.location_id
+    INNER JOIN workshops_workshopspot ws
+        ON ws.workshop_id = a.workshop_id
+        AND ST_Within(l.coordinates, ws.area)
+    CROSS JOIN LATERAL (VALUES {_AIR_QUALITY_RECORD_VALUES}) AS d (dimension, value)
+    WHERE {{where}} AND d.value IS NOT NULL
+"""
+
+_AGGREGATE_SQL = """
+    SELECT spot_id, dimension, SUM(value), COUNT(*), MIN(value), MAX(value)
+    FROM ({points}) points
+    GROUP BY spot_id, dimension
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO {table} AS s (spot_id, dimension, total, count, minimum, maximum)
+    {select}
+    ON CONFLICT (spot_id, dimension) DO UPDATE SET
+        total = s.total + EXCLUDED.total,
+        count = s.count + EXCLUDED.count,
+        minimum = LEAST(s.minimum, EXCLUDED.minimum),
+        maximum = GREATEST(s.maximum, EXCLUDED.maximum)
+"""
+
+# aggregates of all spots of one workshop from the raw readings (what recompute_spots runs)
+WORKSHOP_SPOT_STATS_SQL = _AGGREGATE_SQL.format(points=" UNION ALL ".join([
+    _MEASUREMENT_STATS_SQL.format(where="ws.workshop_id = %s"),
+    _AIR_QUALITY_RECORD_STATS_SQL.format(where="ws.workshop_id = %s"),
+]))
+
+
+def _upsert(points_sql: str, params: list) -> None:
+    select = _AGGREGATE_SQL.format(points=points_sql)
+    with connection.cursor() as cursor:
+        cursor.execute(_UPSERT_SQL.format(table=WorkshopSpotStat._meta.db_table, select=select), params)
+
+
+def add_measurements(measurement_ids) -> None:
+    """Add the values of newly stored measurements to the spots they lie in."""
+    measurement_ids = list(measurement_ids)
+    if measurement_ids:
+        _upsert(_MEASUREMENT_STATS_SQL.format(where="m.id = ANY(%s)"), [measurement_ids])
+
+
+def add_air_quality_records(record_ids) -> None:
+    """Add newly stored AirQualityRecords to the spots they lie in."""
+    record_ids = list(record_ids)
+    if record_ids:
+        _upsert(_AIR_QUALITY_RECORD_STATS_SQL.format(where="a.id = ANY(%s)"), [record_ids])
+
+
+def recompute_spots(spot_ids=None) -> None:
+    """Rebuild the aggregates of ``spot_ids`` (all spots for None) from the stored readings."""
+    spot_filter, params = "TRUE", []
+    if spot_ids is not None:
+        spot_ids = list(spot_ids)
+        if not spot_ids:
+            return
+        spot_filter, params = "ws.id = ANY(%s)", [spot_ids]
+    points = " UNION ALL ".join([
+        _MEASUREMENT_STATS_SQL.format(where=spot_filter),
+        _AIR_QUALITY_RECORD_STATS_SQL.format(where=spot_filter),
+    ])
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if spot_ids is None:
+                cursor.execute(f"DELETE FROM {WorkshopSpotStat._meta.db_table}")
+            else:
+                cursor.execute(f"DELETE FROM {WorkshopSpotStat._meta.db_table} WHERE spot_id = ANY(%s)", [spot_ids])
+        _upsert(points, params * 2)
+
+
+def workshop_spot_stats(workshop_id: str) -> dict[int, dict[int, WorkshopSpotStat]]:
+    """``{spot id: {dimension: WorkshopSpotStat}}`` for the spots of a workshop, in one query."""
+    stats = defaultdict(dict)
+    for stat in WorkshopSpotStat.objects.filter(spot__workshop_id=workshop_id):
+        stats[stat.spot_id][stat.dimension] = stat
+    return stats
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -6,10 +8,12 @@ from django.contrib.auth import get_user_model
 from django.contrib.messages import get_messages
 import json
 from datetime import timedelta
+from io import StringIO
 
-from .models import Workshop, Participant
-from devices.models import Device
+from .models import Workshop, Participant, WorkshopImport
+from devices.models import Device, Measurement
 from api.models import AirQualityRecord, MobilityMode
+from main.enums import Dimension, SensorModel
 
 User = get_user_model()
 
@@ -158,7 +162,7 @@ class WorkshopImportDataViewTests(TestCase):
         # Check that records were created (if form was valid)
         # The count might be 0 if there were validation errors, so we check messages
         messages_list = list(get_messages(response.wsgi_request))
-        record_count = AirQualityRecord.objects.count()
+        record_count = Measurement.objects.count()
         
         if any('Successfully imported' in str(m) for m in messages_list):
             # If import was successful, check record count and details
@@ -166,17 +170,20 @@ class WorkshopImportDataViewTests(TestCase):
             
             # Check first record if any were created
             if record_count > 0:
-                record1 = AirQualityRecord.objects.first()
-                self.assertEqual(record1.pm1, 33.8)
-                self.assertEqual(record1.pm25, 36.3)
-                self.assertEqual(record1.pm10, 37.4)
-                self.assertEqual(record1.humidity, 39.2)
-                self.assertEqual(record1.temperature, 22.2)
-                self.assertEqual(record1.voc, 15.0)
+                record1 = Measurement.objects.order_by('time_measured').first()
+                values = {v.dimension: v.value for v in record1.values.all()}
+                self.assertEqual(record1.sensor_model, SensorModel.SEN5X)
+                self.assertEqual(values[Dimension.PM1_0], 33.8)
+                self.assertEqual(values[Dimension.PM2_5], 36.3)
+                self.assertEqual(values[Dimension.PM10_0], 37.4)
+                self.assertEqual(values[Dimension.HUMIDITY], 39.2)
+                self.assertEqual(values[Dimension.TEMPERATURE], 22.2)
+                self.assertEqual(values[Dimension.VOC_INDEX], 15.0)
                 self.assertEqual(record1.workshop, self.workshop)
                 self.assertIsNotNone(record1.device)
                 self.assertIsNotNone(record1.participant)
                 self.assertIsNotNone(record1.mode)
+                self.assertIsNotNone(record1.location)
         else:
             # If import failed, check for error messages or print debug info
             error_messages = [str(m) for m in messages_list]
@@ -216,7 +223,7 @@ class WorkshopImportDataViewTests(TestCase):
         response = self.client.post(url, {'json_file': invalid_file}, follow=True)
         
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(AirQualityRecord.objects.count(), 0)
+        self.assertEqual(Measurement.objects.count(), 0)
         
         # Check error message
         messages_list = list(get_messages(response.wsgi_request))
@@ -232,7 +239,7 @@ class WorkshopImportDataViewTests(TestCase):
         response = self.client.post(url, {'json_file': json_file}, follow=True)
         
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(AirQualityRecord.objects.count(), 0)
+        self.assertEqual(Measurement.objects.count(), 0)
         
         # Check error message
         messages_list = list(get_messages(response.wsgi_request))
@@ -246,7 +253,7 @@ class WorkshopImportDataViewTests(TestCase):
         # Import first time
         json_file = self.create_json_file(self.valid_json_data)
         response = self.client.post(url, {'json_file': json_file}, follow=True)
-        first_count = AirQualityRecord.objects.count()
+        first_count = Measurement.objects.count()
         self.assertGreaterEqual(first_count, 0)  # At least some records might be created
         
         # Import same data again (with same timestamps)
@@ -254,7 +261,7 @@ class WorkshopImportDataViewTests(TestCase):
         response = self.client.post(url, {'json_file': json_file2}, follow=True)
         
         # Should still be the same count (duplicates skipped)
-        second_count = AirQualityRecord.objects.count()
+        second_count = Measurement.objects.count()
         self.assertEqual(first_count, second_count)
         
         # Check warning message about skipped records
@@ -296,7 +303,7 @@ class WorkshopImportDataViewTests(TestCase):
         response = self.client.post(url, {'json_file': json_file}, follow=True)
         
         # No records should be created
-        self.assertEqual(AirQualityRecord.objects.count(), 0)
+        self.assertEqual(Measurement.objects.count(), 0)
         
         # Check warning message
         messages_list = list(get_messages(response.wsgi_request))
@@ -315,7 +322,7 @@ class WorkshopImportDataViewTests(TestCase):
         response = self.client.post(url, {'json_file': json_file}, follow=True)
         
         # Should still create records using four letter code
-        self.assertEqual(AirQualityRecord.objects.count(), 2)
+        self.assertEqual(Measurement.objects.count(), 2)
         
         # Device should be created with four letter code
         device = Device.objects.get(id='0007AAA')
@@ -335,8 +342,8 @@ class WorkshopImportDataViewTests(TestCase):
         
         # Only second record should be created (first skipped due to missing sensor data)
         # Note: If both are skipped, count will be 0, so we check >= 0 and <= 1
-        self.assertLessEqual(AirQualityRecord.objects.count(), 1)
-        self.assertGreaterEqual(AirQualityRecord.objects.count(), 0)
+        self.assertLessEqual(Measurement.objects.count(), 1)
+        self.assertGreaterEqual(Measurement.objects.count(), 0)
 
     def test_import_data_missing_location(self):
         """Test import with data points missing location"""
@@ -352,8 +359,8 @@ class WorkshopImportDataViewTests(TestCase):
         
         # Only second record should be created (first skipped due to missing location)
         # Note: If both are skipped, count will be 0, so we check >= 0 and <= 1
-        self.assertLessEqual(AirQualityRecord.objects.count(), 1)
-        self.assertGreaterEqual(AirQualityRecord.objects.count(), 0)
+        self.assertLessEqual(Measurement.objects.count(), 1)
+        self.assertGreaterEqual(Measurement.objects.count(), 0)
 
     def test_import_data_creates_mobility_mode(self):
         """Test that new mobility modes are created"""
@@ -367,10 +374,10 @@ class WorkshopImportDataViewTests(TestCase):
         response = self.client.post(url, {'json_file': json_file}, follow=True)
         
         # Check that mobility mode was created (if records were created)
-        if AirQualityRecord.objects.exists():
+        if Measurement.objects.exists():
             mode = MobilityMode.objects.get(name='cycling')
             self.assertEqual(mode.title, 'Cycling')
-            self.assertEqual(AirQualityRecord.objects.first().mode, mode)
+            self.assertEqual(Measurement.objects.order_by('time_measured').first().mode, mode)
         else:
             # If no records were created, at least check the mode exists
             self.assertTrue(MobilityMode.objects.filter(name='cycling').exists() or 
@@ -391,4 +398,78 @@ class WorkshopImportDataViewTests(TestCase):
         
         json_file = self.create_json_file(self.valid_json_data)
         response = self.client.post(url, {'json_file': json_file}, follow=True)
-        self.assertEqual(AirQualityRecord.objects.count(), 2)
+        self.assertEqual(Measurement.objects.count(), 2)
+
+    def test_import_data_records_import_progress(self):
+        """The upload is tracked as a WorkshopImport with counters and shown on the workshop page"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('workshop-import-data', kwargs={'workshop_id': self.workshop.pk})
+
+        data = self.valid_json_data.copy()
+        data['data'] = self.valid_json_data['data'] + [{"timestamp": None}, {"timestamp": "not a time"}]
+        json_file = self.create_json_file(data)
+        self.client.post(url, {'json_file': json_file}, follow=True)
+
+        workshop_import = WorkshopImport.objects.get(workshop=self.workshop)
+        self.assertEqual(workshop_import.status, WorkshopImport.STATUS_DONE)
+        self.assertEqual(workshop_import.uploaded_by, self.user)
+        self.assertEqual(workshop_import.device_id, 'E51A822F3728AAA')
+        self.assertEqual(workshop_import.total_count, 4)
+        self.assertEqual(workshop_import.processed_count, 4)
+        self.assertEqual(workshop_import.created_count, 2)
+        self.assertEqual(workshop_import.skipped_count, 1)
+        self.assertEqual(workshop_import.error_count, 1)
+        self.assertEqual(workshop_import.progress_percent, 100)
+        # the upload is removed once it has been processed
+        self.assertFalse(workshop_import.file)
+
+        response = self.client.get(reverse('workshop-detail', kwargs={'pk': self.workshop.pk}))
+        self.assertContains(response, 'workshop-imports')
+
+    def test_import_data_invalid_json_marks_import_failed(self):
+        """A file that cannot be parsed leaves a failed WorkshopImport and no measurements"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('workshop-import-data', kwargs={'workshop_id': self.workshop.pk})
+
+        # truncated in the middle of the data array
+        content = json.dumps(self.valid_json_data, default=str)[:-40].encode('utf-8')
+        invalid_file = SimpleUploadedFile("truncated.json", content, content_type="application/json")
+        self.client.post(url, {'json_file': invalid_file}, follow=True)
+
+        workshop_import = WorkshopImport.objects.get(workshop=self.workshop)
+        self.assertEqual(workshop_import.status, WorkshopImport.STATUS_FAILED)
+        self.assertTrue(workshop_import.errors[0].startswith('Invalid JSON file'))
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_import_data_skips_points_imported_as_air_quality_records(self):
+        """Points of a trip imported before the move to Measurement are not stored a second time"""
+        device = Device.objects.create(id='E51A822F3728AAA')
+        AirQualityRecord.objects.create(
+            device=device, workshop=self.workshop, time=self.valid_json_data['data'][0]['timestamp'], pm25=36.3
+        )
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('workshop-import-data', kwargs={'workshop_id': self.workshop.pk})
+        self.client.post(url, {'json_file': self.create_json_file(self.valid_json_data)}, follow=True)
+
+        workshop_import = WorkshopImport.objects.get(workshop=self.workshop)
+        self.assertEqual((workshop_import.created_count, workshop_import.skipped_count), (1, 1))
+        self.assertEqual(Measurement.objects.filter(device=device).count(), 1)
+
+    def test_run_workshop_imports_restarts_stale_running_imports(self):
+        """Imports left running by a recycled worker are picked up once WORKSHOP_IMPORT_STALE_AFTER has passed"""
+        def running_import(started_at):
+            return WorkshopImport.objects.create(
+                workshop=self.workshop,
+                file=self.create_json_file(self.valid_json_data),
+                status=WorkshopImport.STATUS_RUNNING,
+                started_at=started_at,
+            )
+
+        stale = running_import(timezone.now() - timedelta(seconds=settings.WORKSHOP_IMPORT_STALE_AFTER + 60))
+        recent = running_import(timezone.now())
+        call_command('run_workshop_imports', stdout=StringIO())
+
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, stale.created_count), (WorkshopImport.STATUS_DONE, 2))
+        self.assertEqual(recent.status, WorkshopImport.STATUS_RUNNING)
@@ -0,0 +1,378 @@
+"""
+Import of "Luftdaten.at JSON Trip" exports (Air aRound app) into Measurement/Values.
+
+The upload is stored as a WorkshopImport and processed outside the request: in a background
+thread started after the upload is committed, or by ``manage.py run_workshop_imports`` (imports
+left pending or running by a restarted worker). The file is parsed incrementally, so multi-hour recordings
+never sit in memory as a whole, and points are written in batches of
+``WORKSHOP_IMPORT_BATCH_SIZE`` through the bulk ingest path (devices.ingest.store_readings):
+duplicates are skipped by the Measurement unique constraint, not probed row by row. Points of trips
+imported before into AirQualityRecord are skipped by one lookup per batch.
+"""
+from __future__ import annotations
+
+import codecs
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.models import AirQualityRecord
+from devices.ingest import PendingReading, store_readings
+from devices.models import Device
+from main.enums import Dimension, SensorModel
+from main.timezones import NAIVE_LOCAL_TZ
+
+from .models import Participant, WorkshopImport
+
+logger = logging.getLogger('myapp')
+
+CHUNK_SIZE = 64 * 1024
+MAX_STORED_ERRORS = 50
+# points may be recorded a while before/after the workshop (users choose to import them explicitly)
+TIMEFRAME_BUFFER = timedelta(days=30)
+
+# sensorData keys of the JSON Trip format (SEN5x) -> Dimension
+SENSOR_DATA_DIMENSIONS = {
+    'PM1.0': Dimension.PM1_0,
+    'PM2.5': Dimension.PM2_5,
+    'PM4.0': Dimension.PM4_0,
+    'PM10.0': Dimension.PM10_0,
+    'Luftfeuchtigkeit': Dimension.HUMIDITY,
+    'Temperatur': Dimension.TEMPERATURE,
+    'VOCs': Dimension.VOC_INDEX,
+    'NOx': Dimension.NOX_INDEX,
+}
+
+
+class TripFormatError(ValueError):
+    """The upload is not valid JSON or not in the JSON Trip format; the message is shown to the user."""
+
+
+class _SkipPoint(Exception):
+    pass
+
+
+class _JsonStream:
+    """
+    Minimal incremental reader for one JSON document: values are decoded one at a time with
+    ``json.JSONDecoder.raw_decode`` on a buffer that is refilled from the file as needed.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            self._buf += self._utf8.decode(b'', final=True)
+            return False
+        if self._pos > CHUNK_SIZE:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        self._buf += self._utf8.decode(chunk)
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self._buf, self._pos)
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def walk(self):
+        """
+        Yield ('key', name, value) for top-level members and ('point', value) for every element
+        of the top-level "data" array, without materialising that array.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError('Expecting property name', self._buf, self._pos)
+            self.expect(':')
+            if key == 'data' and self.peek() == '[':
+                self.expect('[')
+                if self.peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield ('point', self.value())
+                        if self.peek() == ',':
+                            self._pos += 1
+                            continue
+                        self.expect(']')
+                        break
+                yield ('key', 'data', None)
+            else:
+                yield ('key', key, self.value())
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect('}')
+            return
+
+
+def _events(fileobj):
+    try:
+        yield from _JsonStream(fileobj).walk()
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise TripFormatError(f'Invalid JSON file: {e}')
+
+
+def read_trip_header(fileobj) -> tuple[dict, int]:
+    """Top-level members except the data points, and the number of points (first pass)."""
+    header = {}
+    count = 0
+    for event in _events(fileobj):
+        if event[0] == 'point':
+            count += 1
+        else:
+            header[event[1]] = event[2]
+    if not isinstance(header.get('device'), dict) or 'version' not in header or 'data' not in header:
+        raise TripFormatError('Invalid JSON format. Expected version, device, and data fields.')
+    return header, count
+
+
+def iter_trip_points(fileobj):
+    for event in _events(fileobj):
+        if event[0] == 'point':
+            yield event[1]
+
+
+def _resolve_device(device_info: dict, workshop) -> tuple[Device, str]:
+    """Device (byte-reversed MAC + "AAA", fallback four letter code) and participant name."""
+    mac = (device_info.get('chipId') or {}).get('mac', '')
+    four_letter_code = device_info.get('fourLetterCode', '')
+    display_name = device_info.get('displayName', '')
+
+    if mac:
+        mac_upper = mac.upper()
+        rmac = ''.join(reversed([mac_upper[i:i + 2] for i in range(0, len(mac_upper), 2)]))
+        device_id = f'{rmac}AAA'
+    else:
+        device_id = f'{four_letter_code}AAA' if four_letter_code else 'UNKNOWN'
+
+    device, _ = Device.objects.get_or_create(id=device_id)
+    if display_name and not device.device_name:
+        device.device_name = display_name
+        device.save()
+
+    participant_name = display_name or device.device_name or device_id
+    participant, _ = Participant.objects.get_or_create(
+        name=participant_name,
+        defaults={'workshop': workshop},
+    )
+    if participant.workshop_id != workshop.pk:
+        participant.workshop = workshop
+        participant.save()
+    return device, participant_name
+
+
+def _parse_time(timestamp_str: str) -> datetime:
+    time = parse_datetime(timestamp_str)
+    if time is None:
+        if timestamp_str.endswith('Z'):
+            timestamp_str = timestamp_str.replace('Z', '+00:00')
+        time = datetime.fromisoformat(timestamp_str)
+    # Naive timestamps in uploads are interpreted as Europe/Vienna
+    if time.tzinfo is None:
+        time = timezone.make_aware(time, NAIVE_LOCAL_TZ)
+    return time
+
+
+def point_to_reading(point: dict, workshop, participant_name: str) -> PendingReading:
+    """
+    One JSON Trip data point -> PendingReading (one SEN5x measurement).
+    Raises _SkipPoint for points without time/location/sensor data or outside the workshop
+    timeframe, ValueError for malformed ones.
+    """
+    timestamp_str = point.get('timestamp')
+    if not timestamp_str:
+        raise _SkipPoint()
+    try:
+        time = _parse_time(str(timestamp_str))
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid timestamp format: {timestamp_str}')
+
+    if not (workshop.start_date - TIMEFRAME_BUFFER <= time <= workshop.end_date + TIMEFRAME_BUFFER):
+        raise _SkipPoint()
+
+    coordinates = (point.get('location') or {}).get('coordinates') or []
+    if len(coordinates) != 2:
+        raise _SkipPoint()
+    lon, lat = float(coordinates[0]), float(coordinates[1])
+
+    sensor_data_list = point.get('sensorData') or []
+    if not sensor_data_list:
+        raise _SkipPoint()
+    # first sensor data entry (usually only one)
+    sensor_data = sensor_data_list[0]
+    data = {
+        str(dimension): float(sensor_data[key])
+        for key, dimension in SENSOR_DATA_DIMENSIONS.items()
+        if sensor_data.get(key) is not None
+    }
+    if not data:
+        raise _SkipPoint()
+
+    mode = point.get('mode') or 'unknown'
+    if not isinstance(mode, str):
+        raise ValueError(f'Invalid mode: {mode}')
+
+    return PendingReading(
+        time_measured=time,
+        sensors={'0': {'type': SensorModel.SEN5X, 'data': data}},
+        workshop={'id': workshop.pk, 'participant': participant_name, 'mode': mode},
+        lat=lat,
+        lon=lon,
+    )
+
+
+def _add_error(workshop_import: WorkshopImport, message: str) -> None:
+    workshop_import.error_count += 1
+    if len(workshop_import.errors) < MAX_STORED_ERRORS:
+        workshop_import.errors.append(message)
+
+
+def _write_batch(workshop_import: WorkshopImport, device: Device, participant_name: str, points: list) -> None:
+    workshop = workshop_import.workshop
+    pending = []
+    for point in points:
+        try:
+            pending.append(point_to_reading(point, workshop, participant_name))
+        except _SkipPoint:
+            workshop_import.skipped_count += 1
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            _add_error(workshop_import, str(e) if isinstance(e, ValueError) else f'Error processing data point: {e}')
+
+    if pending:
+        # trips imported before the move to Measurement are stored as AirQualityRecord
+        legacy = set(
+            AirQualityRecord.objects.filter(device=device, time__in={r.time_measured for r in pending})
+            .values_list('time', flat=True)
+        )
+        if legacy:
+            workshop_import.skipped_count += sum(r.time_measured in legacy for r in pending)
+            pending = [r for r in pending if r.time_measured not in legacy]
+
+    if pending:
+        with transaction.atomic():
+            _, result = store_readings(device, pending, time_received=timezone.now())
+        workshop_import.created_count += len(result.created)
+        workshop_import.skipped_count += len(result.skipped)
+
+    workshop_import.processed_count += len(points)
+    workshop_import.save(update_fields=[
+        'processed_count', 'created_count', 'skipped_count', 'error_count', 'errors',
+    ])
+
+
+def run_import(import_id: int) -> WorkshopImport:
+    """Process one WorkshopImport to completion; never raises (failures end in status "failed")."""
+    workshop_import = WorkshopImport.objects.select_related('workshop').get(pk=import_id)
+    workshop_import.status = WorkshopImport.STATUS_RUNNING
+    workshop_import.started_at = timezone.now()
+    workshop_import.save(update_fields=['status', 'started_at'])
+
+    try:
+        with workshop_import.file.open('rb') as f:
+            header, total = read_trip_header(f)
+        device, participant_name = _resolve_device(header['device'], workshop_import.workshop)
+        workshop_import.device = device
+        workshop_import.total_count = total
+        workshop_import.save(update_fields=['device', 'total_count'])
+
+        batch_size = settings.WORKSHOP_IMPORT_BATCH_SIZE
+        with workshop_import.file.open('rb') as f:
+            batch = []
+            for point in iter_trip_points(f):
+                batch.append(point if isinstance(point, dict) else {})
+                if len(batch) >= batch_size:
+                    _write_batch(workshop_import, device, participant_name, batch)
+                    batch = []
+            if batch:
+                _write_batch(workshop_import, device, participant_name, batch)
+
+        workshop_import.status = WorkshopImport.STATUS_DONE
+    except TripFormatError as e:
+        workshop_import.status = WorkshopImport.STATUS_FAILED
+        _add_error(workshop_import, str(e))
+    except Exception as e:
+        logger.error(f"Error importing data for workshop {workshop_import.workshop_id}: {e}", exc_info=True)
+        workshop_import.status = WorkshopImport.STATUS_FAILED
+        _add_error(workshop_import, f'Error processing file: {e}')
+
+    workshop_import.finished_at = timezone.now()
+    workshop_import.save()
+    if workshop_import.status == WorkshopImport.STATUS_DONE:
+        # the upload is not needed any more once every point is stored
+        workshop_import.file.storage.delete(workshop_import.file.name)
+        workshop_import.file = ''
+        workshop_import.save(update_fields=['file'])
+
+    if workshop_import.errors:
+        logger.error(f"Import errors: {workshop_import.errors}")
+    return workshop_import
+
+
+def _run_in_thread(import_id: int) -> None:
+    try:
+        run_import(import_id)
+    finally:
+        # the thread opened its own connection
+        connections.close_all()
+
+
+def start_import(workshop_import: WorkshopImport) -> None:
+    """
+    Run ``workshop_import`` inline (WORKSHOP_IMPORT_INLINE, e.g. tests) or in a daemon thread once
+    the surrounding transaction has committed the upload.
+    """
+    if settings.WORKSHOP_IMPORT_INLINE:
+        run_import(workshop_import.pk)
+        workshop_import.refresh_from_db()
+        return
+    transaction.on_commit(
+        lambda: threading.Thread(target=_run_in_thread, args=(workshop_import.pk,), daemon=True).start()
+    )